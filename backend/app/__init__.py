@@ -0,0 +1 @@
+from . import config  # Carga el .env antes de que los servicios lean su configuración
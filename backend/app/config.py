@@ -0,0 +1,14 @@
+"""
+Configuración de entorno del backend.
+
+El archivo .env se carga una sola vez, aquí. app/__init__.py importa este
+módulo, así que las variables ya están disponibles cuando los servicios
+leen su configuración con os.environ.
+"""
+import os
+from dotenv import load_dotenv
+
+load_dotenv()
+
+SUPABASE_URL = os.environ.get("SUPABASE_URL")
+SUPABASE_KEY = os.environ.get("SUPABASE_KEY")
@@ -1,17 +1,58 @@
-from fastapi import FastAPI, HTTPException
+from fastapi import FastAPI, HTTPException, Header, Depends
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import StreamingResponse
+from fastapi.responses import StreamingResponse, Response, JSONResponse
+from contextlib import asynccontextmanager
 import json
+import time
 import asyncio
+import logging
 
-from .models.schemas import ChatRequest, ChatResponse, QuickQueryRequest, StructuredResponse
-from .services.database import buscar_datos_cliente, CONSULTAS_RAPIDAS
-from .services.llm import construir_prompt, generar_respuesta_llm_ollama
+from .models.schemas import ChatRequest, ChatResponse, QuickQueryRequest, QuickQueryBatchRequest, QuickQueryBatchResponse, StructuredResponse
+from .services.database import buscar_datos_cliente, invalidar_cache_cliente, cache_clientes, cache_resumenes, USAR_RESUMEN_CUENTA, indice_identificadores, conexion_bd, DB_BACKEND, CONSULTAS_RAPIDAS, CONSULTAS_INFORMATIVAS
+from .services.catalogo import cargar_catalogo, obtener_entrada, etag_coincide, EntradaCatalogo, CATALOGO_MAX_AGE
+from .services.historial import contar_tokens
+from .services.sesiones import sesiones
+from .services.planificador import planificador, LLMSaturado
+from .services.intenciones import enrutador, requiere_cliente
+from .services.calentamiento import calentador, OLLAMA_PRECARGA
+from .services import metricas
+from .services.llm import (
+    construir_prompt,
+    generar_resultado_llm,
+    verificar_llm_activo,
+    generar_respuesta_llm_stream,
+    cache_respuestas,
+    generaciones,
+    MODELO_LLM,
+    backend_llm,
+    agrupador,
+    get_llm_client,
+    cerrar_llm_client,
+)
+
+logger = logging.getLogger(__name__)
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """Crea los recursos compartidos al arrancar y los libera al apagar."""
+    await conexion_bd.abrir()  # Cliente de Supabase o pool de PostgreSQL de este proceso (se reintenta si falla)
+    get_llm_client()  # Abre el pool de conexiones hacia el servidor del LLM
+    cargar_catalogo()  # Valida y serializa una vez las respuestas informativas
+    sesiones.iniciar()  # Escritura en segundo plano del historial de conversaciones
+    if OLLAMA_PRECARGA:
+        calentador.iniciar()  # Carga el modelo en segundo plano y lo mantiene en memoria en horario de atención
+    yield
+    await calentador.detener()
+    await sesiones.detener()
+    await indice_identificadores.detener()
+    await conexion_bd.cerrar()
+    await cerrar_llm_client()
 
 app = FastAPI(
     title="AquaLLM API",
     description="API para el sistema de atención al cliente de la empresa de agua potable.",
-    version="1.0.0"
+    version="1.0.0",
+    lifespan=lifespan
 )
 
 # --- Configuración de CORS ---
@@ -28,93 +69,283 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"], # Permite todos los métodos (GET, POST, etc.)
     allow_headers=["*"], # Permite todas las cabeceras
+    expose_headers=["Retry-After", "X-Request-ID"], # Reintento tras un 503 e id de la petición en los logs
 )
 
+# Id de correlación por petición y duración por ruta (ver /metrics)
+app.add_middleware(metricas.MiddlewareObservabilidad)
+
+@app.exception_handler(LLMSaturado)
+async def llm_saturado_handler(request, exc: LLMSaturado):
+    """El LLM no puede atender la petición a tiempo: 503 inmediato con Retry-After."""
+    return JSONResponse(
+        status_code=503,
+        content={"detail": f"Servicio de IA saturado: {exc}"},
+        headers={"Retry-After": str(exc.retry_after)},
+    )
+
+def cliente_supabase():
+    """
+    Dependencia con la conexión a la base de datos del proceso (cliente de
+    Supabase o pool de PostgreSQL, según DB_BACKEND), o None si todavía no
+    se pudo crear. Los tests pueden sustituirla con app.dependency_overrides.
+    """
+    return conexion_bd.obtener()
+
+def base_de_datos_no_disponible() -> HTTPException:
+    """503 con Retry-After para las peticiones que necesitan la base de datos cuando no hay conexión."""
+    return HTTPException(
+        status_code=503,
+        detail="La base de datos no está disponible en este momento",
+        headers={"Retry-After": str(conexion_bd.reintentar_en())},
+    )
+
 @app.get("/")
 def read_root():
     """Endpoint de bienvenida que devuelve un saludo."""
     return {"message": "¡Bienvenido a la API de AquaLLM!"}
 
+@app.get("/health/ready")
+async def ready_handler(supabase=Depends(cliente_supabase)):
+    """
+    Indica al balanceador si la instancia puede recibir tráfico: base de datos
+    conectada y el modelo del LLM cargado (503 mientras no lo esté).
+
+    Fuera de horario, con el modelo descargado a propósito, responde 200 con
+    status "standby": la instancia atiende, pero la primera pregunta pagará
+    la carga del modelo.
+    """
+    if OLLAMA_PRECARGA:
+        modelo = calentador.estadisticas()
+        estado = "ready" if calentador.listo else "standby" if calentador.en_reposo else "not_ready"
+    else:
+        modelo = await verificar_llm_activo()
+        estado = "ready" if modelo["status"] == "activo" else "not_ready"
+    if supabase is None:
+        estado = "not_ready"
+    return JSONResponse(
+        {"status": estado, "modelo": modelo, "base_datos": {"backend": DB_BACKEND, **conexion_bd.estadisticas()}},
+        status_code=503 if estado == "not_ready" else 200,
+    )
+
 @app.post("/api/chat", response_model=ChatResponse)
-async def chat_handler(request: ChatRequest):
+async def chat_handler(request: ChatRequest, supabase=Depends(cliente_supabase)):
     """
     Maneja las solicitudes de chat del usuario.
     """
-    print(f"Recibida pregunta: '{request.question}' con identificador: '{request.identifier}'")
+    logger.info(f"Recibida pregunta: '{request.question}' con identificador: '{request.identifier}'")
 
     identificador = request.identifier
+    intencion = enrutador.clasificar(request.question)
     
-    # 1. Buscar datos del cliente
-    datos_cliente = await buscar_datos_cliente(identificador) if identificador else {}
+    # 1. Buscar datos del cliente (las preguntas informativas no los necesitan)
+    buscar = bool(identificador) and necesita_datos(intencion)
+    if buscar and supabase is None:
+        raise base_de_datos_no_disponible()
+    datos_cliente = await buscar_datos_cliente(identificador) if buscar else {}
     if datos_cliente.get("error"):
         raise HTTPException(status_code=500, detail=datos_cliente.get("error"))
 
-    # 2. Construir el prompt con el historial de conversación
-    historial = request.history if request.history else []
+    # 2. Si la pregunta equivale a una consulta rápida, se responde sin el LLM
+    historial = await historial_de(request)
+    directa = await enrutador.responder(intencion, identificador, datos_cliente)
+    if directa is not None:
+        registrar_turno(request, directa["respuesta"])
+        metricas.respuestas_chat_total.incrementar(origen="directa")
+        return ChatResponse(answer=directa["respuesta"], metadata=metadatos_directa(directa))
+
+    # 3. Reutilizar la respuesta si esta pregunta ya se respondió con los mismos datos
+    respuesta_llm = await respuesta_en_cache(request.question, datos_cliente, historial)
+    if respuesta_llm is not None:
+        registrar_turno(request, respuesta_llm)
+        metricas.respuestas_chat_total.incrementar(origen="cache")
+        return ChatResponse(answer=respuesta_llm, metadata={"cache": True, "prompt_tokens": 0})
+
+    # 4. Construir el prompt con el historial de conversación
     prompt = construir_prompt(request.question, datos_cliente, historial)
 
-    # 3. Generar respuesta del LLM usando la función de Ollama
-    respuesta_llm = generar_respuesta_llm_ollama(prompt)
+    # 5. Generar respuesta del LLM con el servidor configurado (Ollama u OpenAI)
+    resultado = await generar_resultado_llm(prompt)
+    respuesta_llm = resultado["respuesta"]
+    if not resultado.get("error"):
+        await guardar_en_cache(request.question, datos_cliente, historial, respuesta_llm)
+        registrar_turno(request, respuesta_llm)
+    metricas.respuestas_chat_total.incrementar(origen="error_llm" if resultado.get("error") else "llm")
+
+    # 6. Devolver la respuesta junto con lo que costó generarla
+    return ChatResponse(answer=respuesta_llm, metadata=metadatos_prompt(prompt, resultado.get("prompt_tokens")))
+
+def necesita_datos(intencion) -> bool:
+    """Si hay que buscar al cliente: siempre, salvo para preguntas informativas reconocidas."""
+    return intencion is None or requiere_cliente(intencion.query_type)
 
-    # 4. Devolver la respuesta
-    return ChatResponse(answer=respuesta_llm)
+def metadatos_directa(directa: dict) -> dict:
+    """Metadatos de una respuesta calculada sin el LLM a partir de una consulta rápida."""
+    return {"cache": False, "prompt_tokens": 0, "intencion": directa["query_type"]}
+
+async def historial_de(request: ChatRequest) -> list:
+    """
+    Historial de la conversación. Sin ``session_id`` es el que envía el
+    cliente en ``history``. Con sesión se guarda en el servidor, y ``history``
+    solo trae los turnos que el servidor aún no conoce (p. ej. las consultas
+    rápidas respondidas en el navegador), que se añaden a la sesión.
+    """
+    if request.session_id:
+        historial = await sesiones.obtener_historial(request.session_id)
+        for intercambio in request.history or []:
+            sesiones.agregar(request.session_id, intercambio.pregunta, intercambio.respuesta)
+        return historial + list(request.history or [])
+    return request.history or []
+
+def registrar_turno(request: ChatRequest, respuesta: str):
+    """Añade la pregunta y su respuesta al historial de la sesión, si la hay."""
+    if request.session_id:
+        sesiones.agregar(request.session_id, request.question, respuesta)
+
+def metadatos_prompt(prompt: str, prompt_tokens_ollama: int | None = None) -> dict:
+    """Tamaño del prompt enviado al LLM (estimado y, si se conoce, el contado por el servidor)."""
+    return {
+        "cache": False,
+        "prompt_tokens": contar_tokens(prompt),
+        "prompt_caracteres": len(prompt),
+        "prompt_tokens_ollama": prompt_tokens_ollama,
+    }
+
+async def respuesta_en_cache(pregunta: str, datos_cliente: dict, historial: list) -> str | None:
+    """
+    Busca una respuesta ya generada para la misma pregunta y los mismos datos.
+    Las preguntas con historial no se cachean: su respuesta depende de la conversación.
+    """
+    if cache_respuestas is None or historial:
+        return None
+    return await cache_respuestas.obtener(pregunta, datos_cliente, MODELO_LLM)
+
+async def guardar_en_cache(pregunta: str, datos_cliente: dict, historial: list, respuesta: str):
+    """Guarda una respuesta del LLM (solo para preguntas sin historial)."""
+    if cache_respuestas is not None and not historial:
+        await cache_respuestas.guardar(pregunta, datos_cliente, MODELO_LLM, respuesta)
+
+TOTAL_ETAPAS = 4
+
+def evento_sse(datos: dict) -> str:
+    """Serializa un evento para el stream de /api/chat-stream."""
+    return f"data: {json.dumps(datos)}\n\n"
+
+def evento_etapa(etapa: str, step: int, status: str, **extra) -> str:
+    """Evento de progreso de una etapa real del procesamiento."""
+    return evento_sse({'status': status, 'stage': etapa, 'step': step, 'total': TOTAL_ETAPAS, **extra})
+
+def ms_desde(inicio: float) -> float:
+    """Milisegundos transcurridos desde ``inicio`` (time.perf_counter)."""
+    return round((time.perf_counter() - inicio) * 1000, 1)
+
+async def transmitir_respuesta_llm(prompt: str, tiempos: dict, al_completar=None):
+    """
+    Convierte el stream del LLM en eventos SSE: la etapa de primer token, un
+    evento ``token`` por cada fragmento generado y un evento final con la
+    respuesta completa, las estadísticas del servidor y la duración de cada etapa.
+    Si la generación termina sin errores se espera a ``al_completar(respuesta)``.
+    """
+    inicio_llm = time.perf_counter()
+    primer_token = True
+
+    async for fragmento in generar_respuesta_llm_stream(prompt):
+        if "posicion_cola" in fragmento:
+            posicion = fragmento['posicion_cola']
+            yield evento_etapa('cola', 3, f'En espera: hay {posicion} consulta(s) antes que la tuya...', position=posicion)
+        elif "token" in fragmento:
+            if primer_token:
+                primer_token = False
+                tiempos['llm_primer_token_ms'] = ms_desde(inicio_llm)
+                yield evento_etapa('llm_primer_token', 3, 'Generando respuesta...', duration_ms=tiempos['llm_primer_token_ms'])
+            yield evento_sse({'token': fragmento['token']})
+        else:
+            tiempos['llm_ms'] = ms_desde(inicio_llm)
+            if al_completar is not None and not fragmento.get('error'):
+                await al_completar(fragmento['respuesta'])
+            metricas.respuestas_chat_total.incrementar(origen="error_llm" if fragmento.get('error') else "llm")
+            estadisticas = fragmento.get('estadisticas', {})
+            yield evento_etapa(
+                'llm_fin', 4, 'Respuesta generada exitosamente',
+                duration_ms=tiempos['llm_ms'],
+                response=fragmento['respuesta'],
+                stats=estadisticas,
+                timings=tiempos,
+                metadata=metadatos_prompt(prompt, estadisticas.get('prompt_tokens')),
+                done=True,
+                **({'retry_after': fragmento['retry_after']} if 'retry_after' in fragmento else {}),
+            )
 
 @app.post("/api/chat-stream")
-async def chat_stream_handler(request: ChatRequest):
+async def chat_stream_handler(request: ChatRequest, supabase=Depends(cliente_supabase)):
     """
-    Maneja las solicitudes de chat con actualizaciones de estado en tiempo real.
+    Maneja las solicitudes de chat informando el progreso real de cada etapa:
+    búsqueda del cliente, construcción del prompt, primer token y fin del LLM.
+    Cada evento incluye la duración medida de la etapa en ``duration_ms``.
+
+    Si el modelo está ocupado se emiten eventos de etapa 'cola' con la
+    posición en la cola. La admisión en el planificador se decide solo al
+    llamar al LLM (las respuestas directas y de la caché no la necesitan):
+    si no hay capacidad para atenderla a tiempo, el evento final lleva
+    ``error`` y los segundos de ``retry_after``.
     """
+    intencion = enrutador.clasificar(request.question)
+    if request.identifier and necesita_datos(intencion) and supabase is None:
+        raise base_de_datos_no_disponible()
+
     async def generate_status_updates():
+        tiempos = {}
         try:
-            # Paso 1: Validación inicial
-            yield f"data: {json.dumps({'status': 'Iniciando procesamiento...', 'step': 1, 'total': 5})}\n\n"
-            await asyncio.sleep(0.5)  # Simular tiempo de procesamiento
-            
-            # Paso 2: Validar identificador
+            # Etapa 1: Buscar datos del cliente (solo si hay identificador y hacen falta)
             identificador = request.identifier
-            if not identificador:
-                yield f"data: {json.dumps({'status': 'Solicitando identificador del cliente...', 'step': 2, 'total': 5})}\n\n"
-                await asyncio.sleep(0.3)
-                # Construir respuesta para solicitar identificador
-                historial = request.history if request.history else []
-                prompt = construir_prompt(request.question, {}, historial)
-                respuesta_llm = generar_respuesta_llm_ollama(prompt)
-                yield f"data: {json.dumps({'status': 'Completado', 'step': 5, 'total': 5, 'response': respuesta_llm, 'done': True})}\n\n"
+            datos_cliente = {}
+            if identificador and necesita_datos(intencion):
+                yield evento_etapa('cliente', 1, 'Consultando datos del cliente...')
+                inicio = time.perf_counter()
+                datos_cliente = await buscar_datos_cliente(identificador)
+                tiempos['cliente_ms'] = ms_desde(inicio)
+
+                if datos_cliente.get("error"):
+                    yield evento_etapa('cliente', 1, 'Error en base de datos', duration_ms=tiempos['cliente_ms'], error=datos_cliente.get('error'))
+                    return
+
+                yield evento_etapa('cliente', 1, 'Datos del cliente obtenidos', duration_ms=tiempos['cliente_ms'])
+
+            # Las preguntas que equivalen a una consulta rápida se responden sin el LLM
+            historial = await historial_de(request)
+            inicio = time.perf_counter()
+            directa = await enrutador.responder(intencion, identificador, datos_cliente)
+            if directa is not None:
+                registrar_turno(request, directa["respuesta"])
+                metricas.respuestas_chat_total.incrementar(origen="directa")
+                tiempos['respuesta_directa_ms'] = ms_desde(inicio)
+                yield evento_etapa('respuesta_directa', 4, 'Respuesta obtenida de tus datos', duration_ms=tiempos['respuesta_directa_ms'], response=directa["respuesta"], timings=tiempos, metadata=metadatos_directa(directa), done=True)
                 return
-            
-            yield f"data: {json.dumps({'status': 'Identificador recibido, validando...', 'step': 2, 'total': 5})}\n\n"
-            await asyncio.sleep(0.5)
-            
-            # Paso 3: Consultar base de datos
-            yield f"data: {json.dumps({'status': 'Consultando base de datos...', 'step': 3, 'total': 5})}\n\n"
-            await asyncio.sleep(0.7)
-            
-            datos_cliente = await buscar_datos_cliente(identificador)
-            if datos_cliente.get("error"):
-                yield f"data: {json.dumps({'status': 'Error en base de datos', 'step': 3, 'total': 5, 'error': datos_cliente.get('error')})}\n\n"
+
+            # Si esta pregunta ya se respondió con los mismos datos, no se llama al LLM
+            respuesta_llm = await respuesta_en_cache(request.question, datos_cliente, historial)
+            if respuesta_llm is not None:
+                registrar_turno(request, respuesta_llm)
+                metricas.respuestas_chat_total.incrementar(origen="cache")
+                yield evento_etapa('llm_fin', 4, 'Respuesta obtenida de la caché', duration_ms=0.0, response=respuesta_llm, timings=tiempos, metadata={'cache': True, 'prompt_tokens': 0}, done=True)
                 return
-                
-            yield f"data: {json.dumps({'status': 'Datos del cliente obtenidos exitosamente', 'step': 3, 'total': 5})}\n\n"
-            await asyncio.sleep(0.5)
-            
-            # Paso 4: Preparar consulta para IA
-            yield f"data: {json.dumps({'status': 'Preparando consulta para inteligencia artificial...', 'step': 4, 'total': 5})}\n\n"
-            await asyncio.sleep(0.5)
-            
-            historial = request.history if request.history else []
+
+            # Etapa 2: Construir el prompt (sin datos, pide el identificador al usuario)
+            inicio = time.perf_counter()
             prompt = construir_prompt(request.question, datos_cliente, historial)
-            
-            # Paso 5: Generar respuesta con IA
-            yield f"data: {json.dumps({'status': 'Generando respuesta inteligente...', 'step': 5, 'total': 5})}\n\n"
-            await asyncio.sleep(0.3)
-            
-            respuesta_llm = generar_respuesta_llm_ollama(prompt)
-            
-            # Finalizar
-            yield f"data: {json.dumps({'status': 'Respuesta generada exitosamente', 'step': 5, 'total': 5, 'response': respuesta_llm, 'done': True})}\n\n"
+            tiempos['prompt_ms'] = ms_desde(inicio)
+            yield evento_etapa('prompt', 2, 'Consulta preparada', duration_ms=tiempos['prompt_ms'])
+
+            # Etapas 3 y 4: Reenviar los tokens a medida que llegan y finalizar con la respuesta completa
+            async def al_completar(respuesta: str):
+                await guardar_en_cache(request.question, datos_cliente, historial, respuesta)
+                registrar_turno(request, respuesta)
+
+            async for evento in transmitir_respuesta_llm(prompt, tiempos, al_completar):
+                yield evento
             
         except Exception as e:
-            yield f"data: {json.dumps({'status': f'Error: {str(e)}', 'error': True, 'done': True})}\n\n"
+            yield evento_sse({'status': f'Error: {str(e)}', 'error': True, 'done': True})
 
     return StreamingResponse(
         generate_status_updates(),
@@ -126,16 +357,45 @@ async def chat_stream_handler(request: ChatRequest):
         }
     )
 
+def respuesta_catalogo(entrada: EntradaCatalogo, if_none_match: str | None) -> Response:
+    """
+    Envía una respuesta del catálogo ya serializada, con ETag y Cache-Control.
+    Si el cliente ya tiene la versión vigente responde 304 sin cuerpo.
+    """
+    headers = {"ETag": entrada.etag, "Cache-Control": f"public, max-age={CATALOGO_MAX_AGE}"}
+    if etag_coincide(if_none_match, entrada.etag):
+        return Response(status_code=304, headers=headers)
+    return Response(content=entrada.cuerpo, media_type="application/json", headers=headers)
+
+@app.get("/api/quick-query/{query_type}", response_model=StructuredResponse)
+def quick_query_informativa_handler(query_type: str, if_none_match: str | None = Header(default=None)):
+    """
+    Consultas informativas (no dependen del cliente) por GET, para que
+    navegadores y proxies puedan cachearlas.
+    """
+    entrada = obtener_entrada(query_type)
+    if entrada is None:
+        raise HTTPException(status_code=404, detail="Consulta informativa no encontrada")
+    return respuesta_catalogo(entrada, if_none_match)
+
 @app.post("/api/quick-query", response_model=StructuredResponse)
-async def quick_query_handler(request: QuickQueryRequest):
+async def quick_query_handler(request: QuickQueryRequest, if_none_match: str | None = Header(default=None),
+                              supabase=Depends(cliente_supabase)):
     """
     Maneja consultas rápidas con respuestas estructuradas.
     """
-    print(f"Consulta rápida: '{request.query_type}' para identificador: '{request.identifier}'")
+    logger.info(f"Consulta rápida: '{request.query_type}' para identificador: '{request.identifier}'")
     
     # Validar tipo de consulta
     if request.query_type not in CONSULTAS_RAPIDAS:
         raise HTTPException(status_code=400, detail="Tipo de consulta no válido")
+
+    # Las consultas informativas se sirven directamente desde el catálogo precalculado
+    entrada = obtener_entrada(request.query_type)
+    if entrada is not None:
+        return respuesta_catalogo(entrada, if_none_match)
+    if supabase is None:
+        raise base_de_datos_no_disponible()
     
     # Ejecutar consulta específica
     try:
@@ -147,6 +407,73 @@ async def quick_query_handler(request: QuickQueryRequest):
         
         return StructuredResponse(**resultado)
         
+    except HTTPException:
+        raise  # El 404 de arriba no es un error interno
     except Exception as e:
-        print(f"Error en consulta rápida: {e}")
+        logger.error(f"Error en consulta rápida: {e}")
         raise HTTPException(status_code=500, detail="Error interno del servidor")# Forzando reinicio
+
+@app.post("/api/quick-query/batch", response_model=QuickQueryBatchResponse)
+async def quick_query_batch_handler(request: QuickQueryBatchRequest, supabase=Depends(cliente_supabase)):
+    """
+    Calcula varias consultas rápidas para un mismo cliente buscando sus datos
+    una sola vez. Las consultas que fallan se informan en ``errors``.
+    """
+    logger.info(f"Consultas rápidas en lote: {request.query_types} para identificador: '{request.identifier}'")
+
+    invalidas = [q for q in request.query_types if q not in CONSULTAS_RAPIDAS]
+    if invalidas:
+        raise HTTPException(status_code=400, detail=f"Tipos de consulta no válidos: {', '.join(invalidas)}")
+
+    tipos = list(dict.fromkeys(request.query_types))  # Sin duplicados, en el orden recibido
+
+    # Un único snapshot para todas las consultas que dependen del cliente
+    datos = None
+    if any(q not in CONSULTAS_INFORMATIVAS for q in tipos):
+        if supabase is None:
+            raise base_de_datos_no_disponible()
+        datos = await buscar_datos_cliente(request.identifier)
+        if datos.get("error"):
+            raise HTTPException(status_code=500, detail="Error interno del servidor")
+
+    resultados = await asyncio.gather(
+        *(CONSULTAS_RAPIDAS[q](request.identifier, datos=datos) for q in tipos)
+    )
+
+    respuesta = QuickQueryBatchResponse(results={}, errors={})
+    for query_type, resultado in zip(tipos, resultados):
+        if resultado.get("error"):
+            respuesta.errors[query_type] = resultado["error"]
+        else:
+            respuesta.results[query_type] = StructuredResponse(**resultado)
+    return respuesta
+
+@app.get("/api/stats")
+def stats_handler():
+    """Contadores internos del backend (cachés, etc.)."""
+    return {
+        "base_datos": {"backend": DB_BACKEND, **conexion_bd.estadisticas()},
+        "cache_clientes": cache_clientes.estadisticas(),
+        "cache_resumenes": cache_resumenes.estadisticas() if USAR_RESUMEN_CUENTA else None,
+        "indice_identificadores": indice_identificadores.estadisticas(),
+        "cache_respuestas_llm": cache_respuestas.estadisticas() if cache_respuestas else None,
+        "sesiones": sesiones.estadisticas(),
+        "planificador_llm": planificador.estadisticas(),
+        "generaciones_llm": generaciones.estadisticas() if generaciones else None,
+        "intenciones": enrutador.estadisticas(),
+        "calentamiento": calentador.estadisticas(),
+        "llm": {"backend": backend_llm.nombre, "modelo": MODELO_LLM, "microlotes": agrupador.estadisticas() if agrupador else None},
+    }
+
+@app.get("/metrics")
+def metrics_handler():
+    """Métricas en formato Prometheus (histogramas de cada etapa y contadores)."""
+    return Response(content=metricas.exponer_metricas(), media_type="text/plain; version=0.0.4; charset=utf-8")
+
+@app.delete("/api/cache/clientes/{identificador}")
+def invalidar_cache_handler(identificador: str):
+    """
+    Descarta el snapshot en caché de un identificador y los de su cliente,
+    para que la próxima consulta lea los datos actualizados.
+    """
+    return {"eliminadas": invalidar_cache_cliente(identificador)}
@@ -9,9 +9,11 @@ class ChatRequest(BaseModel):
     question: str
     identifier: str | None = None  # El usuario puede o no proporcionar un identificador al principio
     history: Optional[List[MessageHistory]] = None  # Historial de mensajes anteriores
+    session_id: Optional[str] = None  # Con sesión, el historial vive en el servidor y 'history' trae solo los turnos nuevos
 
 class ChatResponse(BaseModel):
     answer: str
+    metadata: Optional[Dict[str, Any]] = None  # Costo de la petición (tokens del prompt, caché...)
 
 class QuickQueryRequest(BaseModel):
     query_type: str  # Tipo de consulta rápida
@@ -22,4 +24,12 @@ class StructuredResponse(BaseModel):
     title: str
     data: Dict[str, Any]
     summary: str
-    suggestions: List[str]
\ No newline at end of file
+    suggestions: List[str]
+
+class QuickQueryBatchRequest(BaseModel):
+    identifier: str  # Identificador del cliente
+    query_types: List[str]  # Consultas rápidas a calcular con una sola búsqueda
+
+class QuickQueryBatchResponse(BaseModel):
+    results: Dict[str, StructuredResponse]  # Resultado por tipo de consulta
+    errors: Dict[str, str] = {}  # Consultas que no se pudieron calcular y su motivo
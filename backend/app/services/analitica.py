@@ -0,0 +1,223 @@
+import os
+from collections import OrderedDict
+from dataclasses import dataclass
+
+import numpy as np
+
+# --- Configuración del análisis de consumos ---
+ANALITICA_Z_UMBRAL = float(os.environ.get("ANALITICA_Z_UMBRAL", "2.5"))  # |z| a partir del cual un consumo es atípico
+ANALITICA_MIN_HISTORIA = int(os.environ.get("ANALITICA_MIN_HISTORIA", "6"))  # Periodos previos para usar z-score e IQR
+ANALITICA_TOLERANCIA = float(os.environ.get("ANALITICA_TOLERANCIA", "0.3"))  # Desvío relativo aceptado sin historia suficiente
+
+@dataclass(frozen=True)
+class AnalisisConsumo:
+    """Estadísticas de la serie de consumos de un medidor (valores en m³, en orden cronológico)."""
+    periodos: tuple[str, ...]
+    valores: np.ndarray
+    actual: float
+    periodo_actual: str
+    anterior: float | None
+    delta_mensual: float | None  # Diferencia con el periodo anterior
+    delta_porcentual: float | None
+    promedio_6: float  # Media de los últimos 6 periodos (o de los que haya)
+    media_movil_3: float
+    media_movil_12: float | None
+    minimo: float
+    maximo: float
+    linea_base_estacional: float | None  # Media del mismo mes en años anteriores
+    z_score: float | None
+    limite_iqr_inferior: float | None
+    limite_iqr_superior: float | None
+    atipico: bool
+    motivo: str  # Por qué se marcó como atípico ("" si es normal)
+
+    @property
+    def periodos_analizados(self) -> int:
+        return len(self.valores)
+
+@dataclass(frozen=True)
+class AnalisisFacturacion:
+    montos: np.ndarray
+    promedio: float
+    total: float
+
+def medias_moviles(valores: np.ndarray, ventana: int) -> np.ndarray:
+    """Medias de cada ventana de ``ventana`` valores consecutivos (vacío si la serie es más corta)."""
+    if len(valores) < ventana:
+        return np.empty(0)
+    acumulado = np.cumsum(np.insert(valores, 0, 0.0))
+    return (acumulado[ventana:] - acumulado[:-ventana]) / ventana
+
+def _indice_mes(periodo) -> int:
+    # 'YYYY-MM-DD' desde PostgREST, o un date: meses desde el año 0
+    texto = str(periodo)
+    return int(texto[:4]) * 12 + int(texto[5:7]) - 1
+
+# Motivo de cada consumo atípico en puntuar_matriz (0 = normal)
+MOTIVO_NORMAL, MOTIVO_Z, MOTIVO_IQR, MOTIVO_TOLERANCIA = 0, 1, 2, 3
+
+def _cuantil_filas(ordenado: np.ndarray, n: np.ndarray, q: float) -> np.ndarray:
+    """Cuantil ``q`` (interpolación lineal, como np.percentile) de cada fila ya ordenada con sus ``n`` valores válidos al principio."""
+    if ordenado.shape[1] == 0:
+        return np.full(len(ordenado), np.nan)
+    posicion = np.maximum(n - 1, 0) * q
+    abajo = np.floor(posicion).astype(np.intp)
+    arriba = np.minimum(abajo + 1, np.maximum(n - 1, 0))
+    filas = np.arange(len(ordenado))
+    bajo, alto = ordenado[filas, abajo], ordenado[filas, arriba]
+    resultado = bajo + (posicion - abajo) * (alto - bajo)
+    resultado[n == 0] = np.nan
+    return resultado
+
+def puntuar_matriz(valores: np.ndarray) -> dict[str, np.ndarray]:
+    """
+    Evaluación vectorizada de muchas series a la vez.
+
+    ``valores`` tiene una fila por medidor y una columna por mes consecutivo;
+    la última columna es el mes evaluado y NaN marca los meses sin lectura.
+    Aplica las mismas reglas que analizar_consumos (que la usa con una sola
+    fila) y devuelve arrays de una posición por fila: lecturas previas, media
+    histórica, z-score, límites de Tukey, línea base estacional y motivo
+    (MOTIVO_*).
+    """
+    valores = np.asarray(valores, dtype=np.float64)
+    actual = valores[:, -1]
+    historia = valores[:, :-1]
+    validos = ~np.isnan(historia)
+    n = validos.sum(axis=1)
+
+    with np.errstate(invalid="ignore", divide="ignore"):  # Filas sin historia: NaN
+        media = np.where(validos, historia, 0.0).sum(axis=1) / n
+        cuadrados = np.where(validos, (historia - media[:, None]) ** 2, 0.0).sum(axis=1)
+        desviacion = np.sqrt(cuadrados / (n - 1))
+        z = np.where(desviacion > 0, (actual - media) / desviacion, 0.0)
+
+        ordenado = np.sort(historia, axis=1)  # Los NaN quedan al final de cada fila
+        q1, q3 = _cuantil_filas(ordenado, n, 0.25), _cuantil_filas(ordenado, n, 0.75)
+        limite_inferior, limite_superior = q1 - 1.5 * (q3 - q1), q3 + 1.5 * (q3 - q1)
+
+        # Mismo mes en años anteriores: 12, 24, ... columnas antes de la última
+        mismo_mes = historia[:, valores.shape[1] - 13::-12] if valores.shape[1] > 12 else historia[:, :0]
+        con_lectura = ~np.isnan(mismo_mes)
+        base_estacional = np.where(con_lectura, mismo_mes, 0.0).sum(axis=1) / con_lectura.sum(axis=1)
+
+        todos = ~np.isnan(valores)
+        promedio_total = np.where(todos, valores, 0.0).sum(axis=1) / todos.sum(axis=1)
+
+        suficiente = n >= ANALITICA_MIN_HISTORIA
+        por_z = suficiente & (np.abs(z) > ANALITICA_Z_UMBRAL)
+        por_iqr = suficiente & ~por_z & ((actual < limite_inferior) | (actual > limite_superior))
+        # Lo habitual para ese mes no se marca
+        estacional = (base_estacional > 0) & (np.abs(actual - base_estacional) <= ANALITICA_TOLERANCIA * base_estacional)
+        por_tolerancia = ~suficiente & (np.abs(actual - promedio_total) > ANALITICA_TOLERANCIA * promedio_total)
+
+    motivo = np.select(
+        [por_z & ~estacional, por_iqr & ~estacional, por_tolerancia],
+        [MOTIVO_Z, MOTIVO_IQR, MOTIVO_TOLERANCIA],
+        MOTIVO_NORMAL,
+    ).astype(np.int8)
+    motivo[np.isnan(actual)] = MOTIVO_NORMAL
+    z[~suficiente] = np.nan
+    limite_inferior[~suficiente] = np.nan
+    limite_superior[~suficiente] = np.nan
+
+    return {
+        "lecturas": n,
+        "media": media,
+        "z_score": z,
+        "limite_iqr_inferior": limite_inferior,
+        "limite_iqr_superior": limite_superior,
+        "linea_base_estacional": base_estacional,
+        "motivo": motivo,
+    }
+
+def _opcional(valor) -> float | None:
+    return None if np.isnan(valor) else float(valor)
+
+def analizar_consumos(consumos: list[dict]) -> AnalisisConsumo | None:
+    """
+    Carga una vez la serie de consumos en arrays y calcula todas las
+    estadísticas a la vez. Los consumos pueden venir en cualquier orden.
+
+    Un consumo es atípico si su z-score respecto a los periodos anteriores
+    supera ANALITICA_Z_UMBRAL o si queda fuera de los límites de Tukey
+    (Q1 - 1,5·IQR, Q3 + 1,5·IQR), salvo que se parezca al del mismo mes en
+    años anteriores (consumo estacional). Con menos de ANALITICA_MIN_HISTORIA
+    periodos previos se usa la regla simple: atípico si se aparta más de
+    ANALITICA_TOLERANCIA del promedio.
+    """
+    if not consumos:
+        return None
+
+    filas = sorted(consumos, key=lambda c: str(c["periodo"]))
+    periodos = tuple(str(c["periodo"]) for c in filas)
+    valores = np.fromiter((float(c["consumo_metros_cubicos"]) for c in filas), dtype=np.float64, count=len(filas))
+    historia = valores[:-1]
+    actual = float(valores[-1])
+
+    deltas = np.diff(valores)
+    anterior = float(historia[-1]) if len(historia) else None
+    delta = float(deltas[-1]) if len(deltas) else None
+    delta_porcentual = delta / anterior * 100 if delta is not None and anterior > 0 else (0.0 if delta is not None else None)
+    moviles_12 = medias_moviles(valores, 12)
+
+    # Serie mensual completa (NaN en los meses sin lectura) para puntuar_matriz
+    meses = np.fromiter((_indice_mes(p) for p in periodos), dtype=np.int64, count=len(periodos))
+    serie = np.full((1, meses[-1] - meses[0] + 1), np.nan)
+    serie[0, meses - meses[0]] = valores
+    puntuacion = {clave: columna[0] for clave, columna in puntuar_matriz(serie).items()}
+
+    z = _opcional(puntuacion["z_score"])
+    motivo = {
+        MOTIVO_NORMAL: "",
+        MOTIVO_Z: f"z-score {z or 0:+.1f}",
+        MOTIVO_IQR: "fuera del rango intercuartílico",
+        MOTIVO_TOLERANCIA: f"se aparta más del {ANALITICA_TOLERANCIA:.0%} del promedio",
+    }[int(puntuacion["motivo"])]
+
+    return AnalisisConsumo(
+        periodos=periodos,
+        valores=valores,
+        actual=actual,
+        periodo_actual=periodos[-1],
+        anterior=anterior,
+        delta_mensual=delta,
+        delta_porcentual=delta_porcentual,
+        promedio_6=float(valores[-6:].mean()),
+        media_movil_3=float(valores[-3:].mean()),
+        media_movil_12=float(moviles_12[-1]) if len(moviles_12) else None,
+        minimo=float(valores.min()),
+        maximo=float(valores.max()),
+        linea_base_estacional=_opcional(puntuacion["linea_base_estacional"]),
+        z_score=z,
+        limite_iqr_inferior=_opcional(puntuacion["limite_iqr_inferior"]),
+        limite_iqr_superior=_opcional(puntuacion["limite_iqr_superior"]),
+        atipico=bool(motivo),
+        motivo=motivo,
+    )
+
+def analizar_facturas(facturas: list[dict]) -> AnalisisFacturacion | None:
+    if not facturas:
+        return None
+    montos = np.fromiter((float(f["monto"]) for f in facturas), dtype=np.float64, count=len(facturas))
+    return AnalisisFacturacion(montos=montos, promedio=float(montos.mean()), total=float(montos.sum()))
+
+# Los snapshots se comparten (caché de clientes) y son de solo lectura: el
+# análisis de una misma lista de consumos se calcula una vez y lo reutilizan
+# todas las consultas rápidas (p. ej. las de un mismo lote).
+_MEMO_MAX = 512
+_memo: OrderedDict[int, tuple[list, AnalisisConsumo | None]] = OrderedDict()
+
+def analisis_de(datos: dict) -> AnalisisConsumo | None:
+    """Análisis de los consumos de un snapshot de buscar_datos_cliente, memorizado por snapshot."""
+    consumos = datos.get("consumos") or []
+    entrada = _memo.get(id(consumos))
+    # Se compara la identidad de la lista: id() puede reutilizarse cuando la anterior ya no existe
+    if entrada is not None and entrada[0] is consumos:
+        _memo.move_to_end(id(consumos))
+        return entrada[1]
+    analisis = analizar_consumos(consumos)
+    _memo[id(consumos)] = (consumos, analisis)
+    if len(_memo) > _MEMO_MAX:
+        _memo.popitem(last=False)
+    return analisis
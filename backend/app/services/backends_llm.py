@@ -0,0 +1,340 @@
+import json
+import time
+import asyncio
+import logging
+from abc import ABC, abstractmethod
+from typing import AsyncContextManager, AsyncIterator, Awaitable, Callable
+
+import httpx
+
+from . import metricas
+
+logger = logging.getLogger(__name__)
+
+class RespuestaInesperada(Exception):
+    """El servidor del LLM respondió con un formato que no se reconoce."""
+
+class BackendLLM(ABC):
+    """
+    Interfaz común de los servidores de LLM.
+
+    ``generar`` devuelve la respuesta completa y ``generar_stream`` produce
+    ``{"token": "..."}`` por fragmento y, al terminar, un único
+    ``{"fin": True, ...}``. Ambos incluyen los mismos contadores (los que el
+    servidor informe; None si no): ``prompt_tokens``, ``tokens_generados``,
+    ``segundos_evaluacion`` (solo la generación de tokens) y ``carga_modelo_ms``.
+
+    Los errores de conexión se propagan como httpx.HTTPError.
+    """
+
+    nombre = "base"
+    soporta_lotes = False  # Si ``generar_lote`` envía varios prompts en una sola petición
+
+    def __init__(self, base_url: str, modelo: str, pool: int = 10, connect_timeout: float = 5, read_timeout: float = 60):
+        self.base_url = base_url
+        self.modelo = modelo
+        self.pool = pool
+        self.connect_timeout = connect_timeout
+        self.read_timeout = read_timeout
+        self._cliente_http: httpx.AsyncClient | None = None
+
+    def cliente(self) -> httpx.AsyncClient:
+        """Cliente HTTP con un pool keep-alive, creado la primera vez y reutilizado después."""
+        if self._cliente_http is None or self._cliente_http.is_closed:
+            self._cliente_http = httpx.AsyncClient(
+                base_url=self.base_url,
+                headers=self._cabeceras(),
+                timeout=httpx.Timeout(self.read_timeout, connect=self.connect_timeout),
+                limits=httpx.Limits(max_connections=self.pool, max_keepalive_connections=self.pool),
+            )
+        return self._cliente_http
+
+    def _cabeceras(self) -> dict:
+        return {}
+
+    async def cerrar(self):
+        if self._cliente_http is not None:
+            await self._cliente_http.aclose()
+            self._cliente_http = None
+
+    @abstractmethod
+    async def verificar(self) -> dict:
+        """``{"status": "activo"}`` si el servidor responde; si no, ``"inactivo"`` con el error."""
+
+    @abstractmethod
+    async def precargar(self, keep_alive: str) -> dict:
+        """Deja el modelo cargado. Devuelve ``{"segundos": ...}`` o ``{"error": ...}``."""
+
+    @abstractmethod
+    async def modelo_cargado(self) -> bool:
+        """Si el modelo está en memoria ahora mismo (sin cargarlo)."""
+
+    @abstractmethod
+    async def generar(self, prompt: str) -> dict:
+        """``{"texto": ..., contadores}`` de la respuesta completa."""
+
+    async def generar_lote(self, prompts: list[str]) -> list[dict]:
+        """Varias respuestas completas; por defecto, una petición por prompt."""
+        return list(await asyncio.gather(*(self.generar(p) for p in prompts)))
+
+    @abstractmethod
+    def generar_stream(self, prompt: str) -> AsyncIterator[dict]:
+        """Fragmentos de la respuesta a medida que se generan (ver la descripción de la clase)."""
+
+class BackendOllama(BackendLLM):
+    """Ollama, con /api/generate (NDJSON en streaming)."""
+
+    nombre = "ollama"
+
+    def __init__(self, *args, keep_alive: str = "30m", **kwargs):
+        super().__init__(*args, **kwargs)
+        self.keep_alive = keep_alive
+
+    def _payload(self, prompt: str, stream: bool, keep_alive: str | None = None) -> dict:
+        return {"model": self.modelo, "prompt": prompt, "keep_alive": keep_alive or self.keep_alive, "stream": stream}
+
+    @staticmethod
+    def _contadores(final: dict) -> dict:
+        eval_duration = final.get("eval_duration")  # nanosegundos
+        return {
+            "prompt_tokens": final.get("prompt_eval_count"),
+            "tokens_generados": final.get("eval_count"),
+            "segundos_evaluacion": eval_duration / 1e9 if eval_duration else None,
+            "carga_modelo_ms": round(final.get("load_duration", 0) / 1e6, 1),
+        }
+
+    async def verificar(self) -> dict:
+        try:
+            # La raíz del servidor de Ollama responde "Ollama is running"
+            response = await self.cliente().get("/", timeout=5)
+            response.raise_for_status()
+            return {"status": "activo", "message": response.text}
+        except httpx.HTTPError as e:
+            return {"status": "inactivo", "error": str(e)}
+
+    async def precargar(self, keep_alive: str) -> dict:
+        # Una petición sin prompt carga el modelo sin generar nada y renueva su keep_alive
+        try:
+            inicio = time.perf_counter()
+            # Cargar un modelo grande puede tardar más que el timeout entre fragmentos
+            response = await self.cliente().post("/api/generate", json=self._payload("", False, keep_alive),
+                                                 timeout=max(self.read_timeout, 300))
+            response.raise_for_status()
+            return {"segundos": round(time.perf_counter() - inicio, 2)}
+        except httpx.HTTPStatusError as e:
+            # 404: el modelo no está descargado en el servidor de Ollama
+            return {"error": f"{e.response.status_code} {e.response.text.strip()}"}
+        except httpx.HTTPError as e:
+            return {"error": str(e) or type(e).__name__}
+
+    async def modelo_cargado(self) -> bool:
+        # /api/ps lista los modelos en memoria (los que aún no vencieron su keep_alive)
+        try:
+            response = await self.cliente().get("/api/ps", timeout=5)
+            response.raise_for_status()
+            return any(self.modelo in (m.get("name"), m.get("model")) for m in response.json().get("models", []))
+        except httpx.HTTPError:
+            return False
+
+    async def generar(self, prompt: str) -> dict:
+        response = await self.cliente().post("/api/generate", json=self._payload(prompt, False))
+        response.raise_for_status()  # Lanza un error si la petición falla (ej. 404, 500)
+        resultado = response.json()
+        # La respuesta de /api/generate está en la clave 'response'
+        if "response" not in resultado:
+            raise RespuestaInesperada(resultado)
+        return {"texto": resultado["response"], **self._contadores(resultado)}
+
+    async def generar_stream(self, prompt: str) -> AsyncIterator[dict]:
+        # Al salir del bloque se cierra la respuesta y Ollama deja de generar
+        async with self.cliente().stream("POST", "/api/generate", json=self._payload(prompt, True)) as response:
+            response.raise_for_status()
+            async for linea in response.aiter_lines():
+                if not linea:
+                    continue
+                fragmento = json.loads(linea)
+                if fragmento.get("error"):
+                    raise RuntimeError(fragmento["error"])
+                if fragmento.get("response"):
+                    yield {"token": fragmento["response"]}
+                if fragmento.get("done"):
+                    yield {"fin": True, **self._contadores(fragmento)}
+                    return
+
+class BackendOpenAI(BackendLLM):
+    """
+    Servidor compatible con la API de OpenAI (llama.cpp ``llama-server``,
+    vLLM, etc.), con /v1/completions: el prompt ya viene armado, así que no
+    hace falta la plantilla de chat del servidor. Estos servidores agrupan
+    por su cuenta las peticiones simultáneas (continuous batching) y aceptan
+    una lista de prompts en una misma petición.
+    """
+
+    nombre = "openai"
+    soporta_lotes = True
+
+    def __init__(self, *args, api_key: str = "", max_tokens: int = 512, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.api_key = api_key
+        self.max_tokens = max_tokens
+
+    def _cabeceras(self) -> dict:
+        return {"Authorization": f"Bearer {self.api_key}"} if self.api_key else {}
+
+    def _payload(self, prompt, stream: bool) -> dict:
+        payload = {"model": self.modelo, "prompt": prompt, "max_tokens": self.max_tokens, "stream": stream}
+        if stream:
+            payload["stream_options"] = {"include_usage": True}  # El último fragmento trae los tokens
+        return payload
+
+    @staticmethod
+    def _contadores(uso: dict | None, tiempos: dict | None) -> dict:
+        # llama.cpp añade "timings" con la duración de la generación; vLLM solo "usage"
+        uso, tiempos = uso or {}, tiempos or {}
+        return {
+            "prompt_tokens": uso.get("prompt_tokens", tiempos.get("prompt_n")),
+            "tokens_generados": uso.get("completion_tokens", tiempos.get("predicted_n")),
+            "segundos_evaluacion": tiempos["predicted_ms"] / 1000 if tiempos.get("predicted_ms") else None,
+            "carga_modelo_ms": None,
+        }
+
+    async def verificar(self) -> dict:
+        try:
+            response = await self.cliente().get("/v1/models", timeout=5)
+            response.raise_for_status()
+            return {"status": "activo", "message": response.text}
+        except httpx.HTTPError as e:
+            return {"status": "inactivo", "error": str(e)}
+
+    async def precargar(self, keep_alive: str) -> dict:
+        # El servidor carga el modelo al arrancar: basta con comprobar que lo ofrece
+        try:
+            inicio = time.perf_counter()
+            response = await self.cliente().get("/v1/models", timeout=5)
+            response.raise_for_status()
+            modelos = [m.get("id") for m in response.json().get("data", [])]
+            if modelos and self.modelo not in modelos:
+                return {"error": f"El servidor no ofrece el modelo {self.modelo} (disponibles: {', '.join(modelos)})"}
+            return {"segundos": round(time.perf_counter() - inicio, 2)}
+        except httpx.HTTPError as e:
+            return {"error": str(e) or type(e).__name__}
+
+    async def modelo_cargado(self) -> bool:
+        return True  # Lo carga al arrancar y no lo descarga por inactividad
+
+    async def generar(self, prompt: str) -> dict:
+        return (await self.generar_lote([prompt]))[0]
+
+    async def generar_lote(self, prompts: list[str]) -> list[dict]:
+        response = await self.cliente().post("/v1/completions", json=self._payload(prompts if len(prompts) > 1 else prompts[0], False))
+        response.raise_for_status()
+        resultado = response.json()
+        opciones = sorted(resultado.get("choices") or [], key=lambda c: c.get("index", 0))
+        if len(opciones) != len(prompts):
+            raise RespuestaInesperada(resultado)
+        # Con varios prompts, "usage" es la suma de todo el lote
+        contadores = self._contadores(resultado.get("usage"), resultado.get("timings")) if len(prompts) == 1 else self._contadores(None, None)
+        return [{"texto": opcion.get("text", ""), **contadores} for opcion in opciones]
+
+    async def generar_stream(self, prompt: str) -> AsyncIterator[dict]:
+        uso = tiempos = None
+        async with self.cliente().stream("POST", "/v1/completions", json=self._payload(prompt, True)) as response:
+            response.raise_for_status()
+            # Server-Sent Events: "data: {...}" por fragmento y "data: [DONE]" al final
+            async for linea in response.aiter_lines():
+                if not linea.startswith("data:"):
+                    continue
+                datos = linea[5:].strip()
+                if datos == "[DONE]":
+                    break
+                fragmento = json.loads(datos)
+                if fragmento.get("error"):
+                    raise RuntimeError(fragmento["error"])
+                uso = fragmento.get("usage") or uso
+                tiempos = fragmento.get("timings") or tiempos
+                for opcion in fragmento.get("choices") or []:
+                    if opcion.get("text"):
+                        yield {"token": opcion["text"]}
+        yield {"fin": True, **self._contadores(uso, tiempos)}
+
+class AgrupadorLotes:
+    """
+    Micro-lotes: junta las peticiones no-streaming que llegan con menos de
+    ``espera`` segundos de diferencia (hasta ``max_lote``) y las envía en una
+    sola petición con ``generar_lote``. Cada llamador recibe su resultado.
+
+    Con ``turno`` (p. ej. ``lambda: planificador.turno(modelo)``) cada lote
+    ocupa un único turno del planificador mientras se genera, así que los
+    llamadores no deben pedir el suyo: el tamaño del lote no queda limitado
+    por LLM_CONCURRENCIA. Si el lote no consigue turno, todos sus llamadores
+    reciben la excepción (LLMSaturado).
+    """
+
+    def __init__(self, generar_lote: Callable[[list[str]], Awaitable[list[dict]]], max_lote: int = 8, espera: float = 0.01,
+                 turno: Callable[[], AsyncContextManager] | None = None):
+        self._generar_lote = generar_lote
+        self._turno = turno
+        self.max_lote = max(1, max_lote)
+        self.espera = espera
+        self._pendientes: list[tuple[str, asyncio.Future]] = []
+        self._temporizador: asyncio.TimerHandle | None = None
+        self._tareas: set[asyncio.Task] = set()
+        self.lotes = 0
+        self.prompts = 0
+
+    async def generar(self, prompt: str) -> dict:
+        bucle = asyncio.get_running_loop()
+        futuro = bucle.create_future()
+        self._pendientes.append((prompt, futuro))
+        if len(self._pendientes) >= self.max_lote:
+            self._despachar()
+        elif self._temporizador is None:
+            self._temporizador = bucle.call_later(self.espera, self._despachar)
+        return await futuro
+
+    def _despachar(self):
+        if self._temporizador is not None:
+            self._temporizador.cancel()
+            self._temporizador = None
+        # Los llamadores que ya se fueron (cancelados) no se envían
+        lote = [(p, f) for p, f in self._pendientes if not f.done()]
+        self._pendientes = []
+        if lote:
+            tarea = asyncio.get_running_loop().create_task(self._enviar(lote))
+            self._tareas.add(tarea)
+            tarea.add_done_callback(self._tareas.discard)
+
+    async def _enviar(self, lote: list[tuple[str, asyncio.Future]]):
+        try:
+            if self._turno is None:
+                resultados = await self._generar_lote_medido(lote)
+            else:
+                async with self._turno():
+                    # Mientras esperaba el turno pudieron irse algunos llamadores
+                    lote = [(p, f) for p, f in lote if not f.done()]
+                    if not lote:
+                        return
+                    resultados = await self._generar_lote_medido(lote)
+        except Exception as e:
+            for _, futuro in lote:
+                if not futuro.done():
+                    futuro.set_exception(e)
+            return
+        for (_, futuro), resultado in zip(lote, resultados):
+            if not futuro.done():
+                futuro.set_result(resultado)
+
+    async def _generar_lote_medido(self, lote: list[tuple[str, asyncio.Future]]) -> list[dict]:
+        self.lotes += 1
+        self.prompts += len(lote)
+        metricas.llm_lote_prompts.observar(len(lote))
+        return await self._generar_lote([prompt for prompt, _ in lote])
+
+    def estadisticas(self) -> dict:
+        return {
+            "max_lote": self.max_lote,
+            "espera_ms": self.espera * 1000,
+            "lotes": self.lotes,
+            "prompts": self.prompts,
+            "media_por_lote": round(self.prompts / self.lotes, 2) if self.lotes else None,
+        }
@@ -0,0 +1,122 @@
+import asyncio
+import time
+from collections import OrderedDict
+from typing import Awaitable, Callable
+
+class CacheSnapshots:
+    """
+    Caché en memoria de los snapshots de clientes (el diccionario que devuelve
+    buscar_datos_cliente), indexada por identificador.
+
+    - Cada entrada caduca a los ``ttl_segundos``.
+    - Al superar ``max_entradas`` se descarta la menos usada recientemente (LRU).
+    - Si llegan varias peticiones a la vez para el mismo identificador y no
+      está en caché, solo la primera consulta la base de datos; el resto espera
+      su resultado.
+
+    Los snapshots se comparten entre peticiones: deben tratarse como de solo lectura.
+    """
+
+    def __init__(self, max_entradas: int = 1000, ttl_segundos: float = 120.0):
+        self.max_entradas = max_entradas
+        self.ttl_segundos = ttl_segundos
+        self._entradas: OrderedDict[str, tuple[float, dict]] = OrderedDict()
+        self._en_vuelo: dict[str, asyncio.Task] = {}
+        # Cambia con cada invalidación: una carga que empezó antes no se guarda
+        self._generacion = 0
+        self.hits = 0
+        self.misses = 0
+        self.compartidas = 0
+        self.expiradas = 0
+        self.desalojadas = 0
+
+    async def obtener(self, clave: str, cargar: Callable[[str], Awaitable[dict]]) -> dict:
+        """Devuelve el snapshot de ``clave``, cargándolo con ``cargar`` si no está en caché."""
+        entrada = self._entradas.get(clave)
+        if entrada is not None:
+            caduca, snapshot = entrada
+            if caduca > time.monotonic():
+                self._entradas.move_to_end(clave)
+                self.hits += 1
+                return snapshot
+            del self._entradas[clave]
+            self.expiradas += 1
+
+        self.misses += 1
+
+        # La carga corre en su propia tarea: si quien la inició se cancela (p. ej.
+        # un cliente SSE que se desconecta) deja de esperar, pero la carga sigue
+        # para el resto de peticiones del mismo identificador
+        tarea = self._en_vuelo.get(clave)
+        if tarea is not None:
+            self.compartidas += 1
+        else:
+            tarea = asyncio.get_running_loop().create_task(self._cargar(clave, cargar, self._generacion))
+            # Evita el aviso de "excepción nunca recuperada" si todos dejaron de esperar
+            tarea.add_done_callback(lambda t: t.cancelled() or t.exception())
+            self._en_vuelo[clave] = tarea
+        return await asyncio.shield(tarea)
+
+    async def _cargar(self, clave: str, cargar: Callable[[str], Awaitable[dict]], generacion: int) -> dict:
+        try:
+            snapshot = await cargar(clave)
+        finally:
+            del self._en_vuelo[clave]
+        # No se guardan errores ni identificadores que no corresponden a un cliente
+        if not snapshot.get("error") and snapshot.get("cliente") and generacion == self._generacion:
+            self._guardar(clave, snapshot)
+        return snapshot
+
+    def _guardar(self, clave: str, snapshot: dict):
+        self._entradas[clave] = (time.monotonic() + self.ttl_segundos, snapshot)
+        self._entradas.move_to_end(clave)
+        while len(self._entradas) > self.max_entradas:
+            self._entradas.popitem(last=False)
+            self.desalojadas += 1
+
+    def invalidar(self, clave: str) -> int:
+        """
+        Elimina el snapshot de un identificador y los demás snapshots del mismo
+        cliente. Devuelve cuántas entradas se eliminaron.
+        """
+        self._generacion += 1
+        entrada = self._entradas.pop(clave, None)
+        if entrada is None:
+            return 0
+        id_cliente = (entrada[1].get("cliente") or {}).get("id_cliente")
+        return 1 + (self.invalidar_cliente(id_cliente) if id_cliente is not None else 0)
+
+    def invalidar_cliente(self, id_cliente: int) -> int:
+        """
+        Elimina todos los snapshots de un cliente, sin importar con qué
+        identificador se consultaron (ID de cliente, N° de medidor...).
+        Devuelve cuántas entradas se eliminaron.
+        """
+        self._generacion += 1
+        claves = [
+            clave for clave, (_, snapshot) in self._entradas.items()
+            if (snapshot.get("cliente") or {}).get("id_cliente") == id_cliente
+        ]
+        for clave in claves:
+            del self._entradas[clave]
+        return len(claves)
+
+    def invalidar_todo(self):
+        """Vacía la caché (los contadores se conservan)."""
+        self._generacion += 1
+        self._entradas.clear()
+
+    def estadisticas(self) -> dict:
+        """Contadores de uso de la caché."""
+        consultas = self.hits + self.misses
+        return {
+            "entradas": len(self._entradas),
+            "max_entradas": self.max_entradas,
+            "ttl_segundos": self.ttl_segundos,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / consultas, 3) if consultas else 0.0,
+            "cargas_compartidas": self.compartidas,
+            "expiradas": self.expiradas,
+            "desalojadas": self.desalojadas,
+        }
@@ -0,0 +1,253 @@
+import os
+import re
+import json
+import time
+import asyncio
+import sqlite3
+import hashlib
+import threading
+import unicodedata
+from collections import OrderedDict
+from contextlib import contextmanager
+
+def normalizar_pregunta(pregunta: str) -> str:
+    """
+    Normaliza una pregunta para que variaciones triviales compartan la misma
+    entrada: minúsculas, sin tildes, sin signos de puntuación y con los
+    espacios colapsados ("¿Cuánto debo?" -> "cuanto debo").
+    """
+    texto = unicodedata.normalize("NFKD", pregunta.lower())
+    texto = "".join(c for c in texto if not unicodedata.combining(c))
+    texto = re.sub(r"[^\w\s]", " ", texto)
+    return " ".join(texto.split())
+
+def hash_snapshot(datos_cliente: dict) -> str:
+    """Huella estable de los datos del cliente usados para construir el prompt."""
+    serializado = json.dumps(datos_cliente or {}, sort_keys=True, default=str, separators=(",", ":"))
+    return hashlib.sha256(serializado.encode("utf-8")).hexdigest()
+
+class BackendMemoria:
+    """Almacén en memoria del proceso, con TTL y desalojo LRU."""
+
+    def __init__(self, max_entradas: int):
+        self.max_entradas = max_entradas
+        # clave -> (caduca, respuesta, etiqueta, hash_snapshot)
+        self._entradas: OrderedDict[str, tuple[float, str, str, str]] = OrderedDict()
+
+    def obtener(self, clave: str) -> str | None:
+        entrada = self._entradas.get(clave)
+        if entrada is None:
+            return None
+        if entrada[0] <= time.time():
+            del self._entradas[clave]
+            return None
+        self._entradas.move_to_end(clave)
+        return entrada[1]
+
+    def guardar(self, clave: str, respuesta: str, ttl: float, etiqueta: str, hash_datos: str):
+        self._entradas[clave] = (time.time() + ttl, respuesta, etiqueta, hash_datos)
+        self._entradas.move_to_end(clave)
+        while len(self._entradas) > self.max_entradas:
+            self._entradas.popitem(last=False)
+
+    def purgar_etiqueta(self, etiqueta: str, hash_vigente: str) -> int:
+        claves = [
+            clave for clave, (_, _, e, h) in self._entradas.items()
+            if e == etiqueta and h != hash_vigente
+        ]
+        for clave in claves:
+            del self._entradas[clave]
+        return len(claves)
+
+    def tamano(self) -> int:
+        return len(self._entradas)
+
+class BackendSQLite:
+    """
+    Almacén en un archivo SQLite local: sobrevive a reinicios y puede
+    compartirse entre los workers de la misma máquina.
+
+    Sus métodos bloquean (disco y, si otro worker está escribiendo, la espera
+    del lock de SQLite), así que CacheRespuestasLLM los ejecuta en un hilo
+    aparte. Un hit no escribe: el último uso de cada clave se apunta en
+    memoria y se vuelca a la tabla en bloque, cada ``volcado_usos`` hits o
+    antes de desalojar entradas. Las entradas caducadas se borran al guardar.
+    """
+
+    bloqueante = True
+
+    def __init__(self, ruta: str, max_entradas: int, volcado_usos: int = 100):
+        self.max_entradas = max_entradas
+        self.volcado_usos = volcado_usos
+        self._lock = threading.Lock()
+        self._usos: dict[str, float] = {}
+        self._conexion = sqlite3.connect(ruta, check_same_thread=False, isolation_level=None)
+        self._conexion.execute("PRAGMA journal_mode=WAL")
+        self._conexion.execute(
+            "CREATE TABLE IF NOT EXISTS respuestas_llm ("
+            " clave TEXT PRIMARY KEY, respuesta TEXT NOT NULL, caduca REAL NOT NULL,"
+            " ultimo_uso REAL NOT NULL, etiqueta TEXT NOT NULL, hash_snapshot TEXT NOT NULL)"
+        )
+        self._conexion.execute("CREATE INDEX IF NOT EXISTS idx_respuestas_llm_etiqueta ON respuestas_llm (etiqueta)")
+        self._conexion.execute("CREATE INDEX IF NOT EXISTS idx_respuestas_llm_uso ON respuestas_llm (ultimo_uso)")
+
+    def obtener(self, clave: str) -> str | None:
+        ahora = time.time()
+        with self._lock:
+            fila = self._conexion.execute(
+                "SELECT respuesta FROM respuestas_llm WHERE clave = ? AND caduca > ?", (clave, ahora)
+            ).fetchone()
+            if fila is None:
+                return None
+            self._usos[clave] = ahora
+            if len(self._usos) >= self.volcado_usos:
+                self._volcar_usos()
+            return fila[0]
+
+    def _volcar_usos(self):
+        """Escribe los últimos usos pendientes en una sola transacción (con el lock tomado)."""
+        if not self._usos:
+            return
+        usos, self._usos = self._usos, {}
+        with self._transaccion():
+            self._conexion.executemany(
+                "UPDATE respuestas_llm SET ultimo_uso = ? WHERE clave = ?",
+                [(ultimo_uso, clave) for clave, ultimo_uso in usos.items()],
+            )
+
+    @contextmanager
+    def _transaccion(self):
+        # La conexión está en modo autocommit: las escrituras agrupadas van en una transacción explícita
+        self._conexion.execute("BEGIN IMMEDIATE")
+        try:
+            yield
+        except BaseException:
+            self._conexion.execute("ROLLBACK")
+            raise
+        self._conexion.execute("COMMIT")
+
+    def guardar(self, clave: str, respuesta: str, ttl: float, etiqueta: str, hash_datos: str):
+        ahora = time.time()
+        with self._lock:
+            self._volcar_usos()
+            with self._transaccion():
+                self._conexion.execute(
+                    "INSERT OR REPLACE INTO respuestas_llm VALUES (?, ?, ?, ?, ?, ?)",
+                    (clave, respuesta, ahora + ttl, ahora, etiqueta, hash_datos),
+                )
+                self._conexion.execute("DELETE FROM respuestas_llm WHERE caduca <= ?", (ahora,))
+                # Desalojo LRU: se conservan las max_entradas usadas más recientemente
+                self._conexion.execute(
+                    "DELETE FROM respuestas_llm WHERE clave IN ("
+                    " SELECT clave FROM respuestas_llm ORDER BY ultimo_uso DESC LIMIT -1 OFFSET ?)",
+                    (self.max_entradas,),
+                )
+
+    def purgar_etiqueta(self, etiqueta: str, hash_vigente: str) -> int:
+        with self._lock:
+            cursor = self._conexion.execute(
+                "DELETE FROM respuestas_llm WHERE etiqueta = ? AND hash_snapshot != ?",
+                (etiqueta, hash_vigente),
+            )
+            return cursor.rowcount
+
+    def tamano(self) -> int:
+        with self._lock:
+            return self._conexion.execute("SELECT COUNT(*) FROM respuestas_llm").fetchone()[0]
+
+class CacheRespuestasLLM:
+    """
+    Caché de respuestas del LLM. La clave combina el modelo, la pregunta
+    normalizada y la huella de los datos del cliente, así que una respuesta
+    solo se reutiliza mientras los datos en que se basó no cambien.
+
+    Las entradas se etiquetan con el id del cliente: cuando aparece una huella
+    nueva para ese cliente se eliminan las respuestas calculadas con la anterior.
+    La última huella se recuerda para los ``max_etiquetas`` clientes vistos
+    más recientemente; la de un cliente olvidado se vuelve a purgar al verlo.
+
+    Los backends bloqueantes (SQLite) se ejecutan en un hilo aparte para no
+    detener el event loop.
+    """
+
+    def __init__(self, backend, ttl_segundos: float = 3600.0, max_etiquetas: int = 5000):
+        self.backend = backend
+        self.ttl_segundos = ttl_segundos
+        self.max_etiquetas = max_etiquetas
+        self._hash_por_etiqueta: OrderedDict[str, str] = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.invalidadas = 0
+
+    @staticmethod
+    def _etiqueta(datos_cliente: dict) -> str:
+        return str(((datos_cliente or {}).get("cliente") or {}).get("id_cliente", ""))
+
+    @staticmethod
+    def _clave(modelo: str, pregunta: str, hash_datos: str) -> str:
+        return hashlib.sha256(f"{modelo}\x1f{normalizar_pregunta(pregunta)}\x1f{hash_datos}".encode("utf-8")).hexdigest()
+
+    async def _ejecutar(self, metodo, *argumentos):
+        if getattr(self.backend, "bloqueante", False):
+            return await asyncio.to_thread(metodo, *argumentos)
+        return metodo(*argumentos)
+
+    async def _vigilar_cambios(self, etiqueta: str, hash_datos: str):
+        """Invalida las respuestas del cliente si sus datos cambiaron desde la última vez."""
+        if not etiqueta:
+            return
+        if self._hash_por_etiqueta.get(etiqueta) == hash_datos:
+            self._hash_por_etiqueta.move_to_end(etiqueta)
+            return
+        self._hash_por_etiqueta[etiqueta] = hash_datos
+        self._hash_por_etiqueta.move_to_end(etiqueta)
+        while len(self._hash_por_etiqueta) > self.max_etiquetas:
+            self._hash_por_etiqueta.popitem(last=False)
+        self.invalidadas += await self._ejecutar(self.backend.purgar_etiqueta, etiqueta, hash_datos)
+
+    async def obtener(self, pregunta: str, datos_cliente: dict, modelo: str) -> str | None:
+        """Respuesta guardada para esta pregunta y estos datos, o None."""
+        hash_datos = hash_snapshot(datos_cliente)
+        await self._vigilar_cambios(self._etiqueta(datos_cliente), hash_datos)
+        respuesta = await self._ejecutar(self.backend.obtener, self._clave(modelo, pregunta, hash_datos))
+        if respuesta is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return respuesta
+
+    async def guardar(self, pregunta: str, datos_cliente: dict, modelo: str, respuesta: str):
+        """Guarda la respuesta generada por el LLM."""
+        hash_datos = hash_snapshot(datos_cliente)
+        etiqueta = self._etiqueta(datos_cliente)
+        await self._vigilar_cambios(etiqueta, hash_datos)
+        await self._ejecutar(self.backend.guardar, self._clave(modelo, pregunta, hash_datos),
+                             respuesta, self.ttl_segundos, etiqueta, hash_datos)
+
+    def estadisticas(self) -> dict:
+        consultas = self.hits + self.misses
+        return {
+            "backend": type(self.backend).__name__,
+            "entradas": self.backend.tamano(),
+            "ttl_segundos": self.ttl_segundos,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / consultas, 3) if consultas else 0.0,
+            "invalidadas": self.invalidadas,
+        }
+
+def crear_cache_respuestas() -> CacheRespuestasLLM | None:
+    """
+    Crea la caché según la configuración:
+    LLM_CACHE_BACKEND = "memoria" (por defecto), "sqlite" o "desactivado".
+    """
+    tipo = os.environ.get("LLM_CACHE_BACKEND", "memoria").lower()
+    max_entradas = int(os.environ.get("LLM_CACHE_MAX", "5000"))
+    ttl = float(os.environ.get("LLM_CACHE_TTL", "3600"))
+
+    if tipo == "desactivado":
+        return None
+    if tipo == "sqlite":
+        ruta = os.environ.get("LLM_CACHE_SQLITE_PATH", "cache_llm.sqlite3")
+        return CacheRespuestasLLM(BackendSQLite(ruta, max_entradas), ttl, max_entradas)
+    return CacheRespuestasLLM(BackendMemoria(max_entradas), ttl, max_entradas)
@@ -0,0 +1,159 @@
+import os
+import re
+import asyncio
+import logging
+from datetime import datetime, time as hora
+from zoneinfo import ZoneInfo
+
+from .llm import MODELO_LLM, OLLAMA_KEEP_ALIVE, verificar_llm_activo, precargar_modelo, modelo_cargado
+
+logger = logging.getLogger(__name__)
+
+# --- Configuración del calentamiento del modelo ---
+OLLAMA_PRECARGA = os.environ.get("OLLAMA_PRECARGA", "true").lower() == "true"
+# Franja y días (0 = lunes) en los que el modelo se mantiene cargado con pings periódicos
+HORARIO_ATENCION = os.environ.get("HORARIO_ATENCION", "07:00-20:00")
+DIAS_ATENCION = os.environ.get("DIAS_ATENCION", "0,1,2,3,4,5")
+HORARIO_ZONA = os.environ.get("HORARIO_ZONA")  # ej. "America/Guayaquil"; por defecto, la hora del servidor
+# Segundos entre pings; por defecto, la mitad del keep_alive (como máximo 10 minutos)
+OLLAMA_PING_INTERVALO = os.environ.get("OLLAMA_PING_INTERVALO")
+OLLAMA_REINTENTO_MAX = float(os.environ.get("OLLAMA_REINTENTO_MAX", "30"))  # Espera máxima entre reintentos
+
+_UNIDADES = {"s": 1, "m": 60, "h": 3600}
+
+def segundos_keep_alive(valor: str) -> float | None:
+    """Segundos de un keep_alive de Ollama ('30m', '1h', '300'); None si es indefinido (negativo)."""
+    partes = re.findall(r"(-?\d+(?:\.\d+)?)([smh]?)", valor.strip())
+    if not partes:
+        return 0.0
+    total = sum(float(numero) * _UNIDADES.get(unidad or "s") for numero, unidad in partes)
+    return None if total < 0 else total
+
+def _franja(texto: str) -> tuple[hora, hora]:
+    inicio, fin = texto.split("-")
+    return hora.fromisoformat(inicio.strip()), hora.fromisoformat(fin.strip())
+
+class CalentadorModelo:
+    """
+    Mantiene el modelo listo para que la primera pregunta no pague el tiempo
+    de carga.
+
+    Al arrancar la aplicación (en segundo plano, sin retrasar el arranque)
+    espera a que el servidor del LLM responda, precarga el modelo con
+    ``keep_alive`` y, en horario de atención, lo vuelve a tocar cada
+    ``intervalo`` segundos para que Ollama no lo descargue por inactividad.
+    Fuera de horario solo se comprueba que el servidor siga activo y si el
+    modelo sigue en memoria: se descarga al vencer su keep_alive y entonces
+    el estado pasa a "en_reposo". (Los servidores compatibles con OpenAI
+    cargan el modelo al arrancar: ahí solo se comprueba que lo ofrecen.)
+
+    ``listo`` indica si, en la última comprobación, el servidor respondía y
+    el modelo estaba cargado (la próxima pregunta no pagará la carga); es lo
+    que expone /health/ready.
+    """
+
+    def __init__(self, keep_alive: str = OLLAMA_KEEP_ALIVE, intervalo: float | None = None,
+                 horario: str = HORARIO_ATENCION, dias: str = DIAS_ATENCION, zona: str | None = HORARIO_ZONA):
+        self.keep_alive = keep_alive
+        if intervalo is None:
+            duracion = segundos_keep_alive(keep_alive)
+            intervalo = 600.0 if duracion is None else max(5.0, min(duracion / 2, 600.0))
+        self.intervalo = intervalo
+        self.franja = _franja(horario)
+        self.dias = {int(d) for d in dias.split(",") if d.strip()}
+        self.zona = ZoneInfo(zona) if zona else None
+        self._tarea: asyncio.Task | None = None
+        self.listo = False
+        self.estado = "iniciando"
+        self.ultimo_error = None
+        self.segundos_precarga = None
+        self.pings = 0
+        self.fallos = 0
+
+    @property
+    def en_reposo(self) -> bool:
+        """Servidor activo con el modelo descargado fuera de horario: la próxima pregunta lo cargará."""
+        return self.estado == "en_reposo"
+
+    def en_horario(self, ahora: datetime | None = None) -> bool:
+        ahora = ahora or datetime.now(self.zona)
+        inicio, fin = self.franja
+        return ahora.weekday() in self.dias and inicio <= ahora.time() < fin
+
+    def iniciar(self):
+        if self._tarea is None or self._tarea.done():
+            self._tarea = asyncio.get_running_loop().create_task(self._ciclo())
+
+    async def detener(self):
+        if self._tarea is not None:
+            self._tarea.cancel()
+            try:
+                await self._tarea
+            except asyncio.CancelledError:
+                pass
+            self._tarea = None
+
+    async def _ciclo(self):
+        espera = 1.0
+        while True:
+            if await self._comprobar():
+                espera = 1.0
+                await asyncio.sleep(self.intervalo)
+            else:
+                # Servidor caído o modelo sin descargar: reintento con espera creciente
+                await asyncio.sleep(espera)
+                espera = min(espera * 2, OLLAMA_REINTENTO_MAX)
+
+    async def _comprobar(self) -> bool:
+        """Una ronda: salud del servidor y, si toca, carga o ping del modelo. Devuelve si está listo."""
+        salud = await verificar_llm_activo()
+        if salud["status"] != "activo":
+            return self._fallo("llm_inactivo", salud.get("error"))
+
+        # Fuera de horario no se renueva el keep_alive: solo se mira si el modelo sigue cargado
+        if self.segundos_precarga is not None and not self.en_horario():
+            cargado = await modelo_cargado()
+            self.estado = "fuera_de_horario" if cargado else "en_reposo"
+            self.listo = cargado
+            self.ultimo_error = None
+            return True
+
+        resultado = await precargar_modelo(self.keep_alive)
+        if resultado.get("error"):
+            return self._fallo("modelo_no_disponible", resultado["error"])
+
+        if self.segundos_precarga is None:
+            self.segundos_precarga = resultado["segundos"]
+            logger.info(f"Modelo {MODELO_LLM} precargado en {resultado['segundos']} s (keep_alive={self.keep_alive}).")
+        else:
+            self.pings += 1
+        self.estado = "listo"
+        self.listo = True
+        self.ultimo_error = None
+        return True
+
+    def _fallo(self, estado: str, error: str | None) -> bool:
+        if self.estado != estado:
+            logger.warning(f"Modelo {MODELO_LLM} no disponible ({estado}): {error}")
+        self.estado = estado
+        self.ultimo_error = error
+        self.listo = False
+        self.fallos += 1
+        return False
+
+    def estadisticas(self) -> dict:
+        return {
+            "modelo": MODELO_LLM,
+            "listo": self.listo,
+            "en_reposo": self.en_reposo,
+            "estado": self.estado,
+            "ultimo_error": self.ultimo_error,
+            "segundos_precarga": self.segundos_precarga,
+            "keep_alive": self.keep_alive,
+            "intervalo_ping_s": self.intervalo,
+            "en_horario": self.en_horario(),
+            "pings": self.pings,
+            "fallos": self.fallos,
+        }
+
+calentador = CalentadorModelo(intervalo=float(OLLAMA_PING_INTERVALO) if OLLAMA_PING_INTERVALO else None)
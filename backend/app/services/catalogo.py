@@ -0,0 +1,64 @@
+import os
+import logging
+import json
+import hashlib
+from dataclasses import dataclass
+
+from ..models.schemas import StructuredResponse
+
+logger = logging.getLogger(__name__)
+
+# Archivo con las respuestas de las consultas informativas (no dependen del cliente)
+RUTA_CATALOGO = os.environ.get(
+    "CATALOGO_CONSULTAS_PATH",
+    os.path.join(os.path.dirname(__file__), "..", "data", "consultas_informativas.json"),
+)
+# Segundos que navegadores y proxies pueden reutilizar una respuesta del catálogo
+CATALOGO_MAX_AGE = int(os.environ.get("CATALOGO_MAX_AGE", "3600"))
+
+@dataclass(frozen=True)
+class EntradaCatalogo:
+    """Respuesta estática ya validada y serializada, lista para enviarse tal cual."""
+    datos: dict
+    cuerpo: bytes
+    etag: str
+
+_catalogo: dict[str, EntradaCatalogo] | None = None
+
+def cargar_catalogo(ruta: str = RUTA_CATALOGO) -> dict[str, EntradaCatalogo]:
+    """
+    Lee el catálogo de consultas informativas, valida cada respuesta con
+    StructuredResponse y la serializa una sola vez a JSON con su ETag.
+    """
+    global _catalogo
+    with open(ruta, encoding="utf-8") as f:
+        contenido = json.load(f)
+
+    catalogo = {}
+    for query_type, respuesta in contenido.items():
+        datos = StructuredResponse(**respuesta).model_dump()
+        cuerpo = json.dumps(datos, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+        etag = '"' + hashlib.sha256(cuerpo).hexdigest()[:16] + '"'
+        catalogo[query_type] = EntradaCatalogo(datos=datos, cuerpo=cuerpo, etag=etag)
+
+    _catalogo = catalogo
+    logger.info(f"Catálogo de consultas informativas cargado: {len(catalogo)} respuestas.")
+    return catalogo
+
+def obtener_catalogo() -> dict[str, EntradaCatalogo]:
+    """Devuelve el catálogo, cargándolo la primera vez que se necesita."""
+    if _catalogo is None:
+        return cargar_catalogo()
+    return _catalogo
+
+def obtener_entrada(query_type: str) -> EntradaCatalogo | None:
+    """Entrada del catálogo para un tipo de consulta, o None si no es informativa."""
+    return obtener_catalogo().get(query_type)
+
+def etag_coincide(if_none_match: str | None, etag: str) -> bool:
+    """Indica si la cabecera If-None-Match del cliente incluye el ETag vigente."""
+    if not if_none_match:
+        return False
+    candidatos = [c.strip() for c in if_none_match.split(",")]
+    # Las comparaciones de If-None-Match son débiles: W/"x" equivale a "x"
+    return "*" in candidatos or etag in (c.removeprefix("W/") for c in candidatos)
@@ -0,0 +1,100 @@
+import os
+
+from .analitica import analisis_de
+
+# Consumos que se listan en el prompt (el snapshot trae más para la analítica; del resto va un resumen)
+CONTEXTO_CONSUMOS = int(os.environ.get("CONTEXTO_CONSUMOS", "6"))
+
+def _valor(valor, vacio: str = "-") -> str:
+    """Texto de un campo; los separadores se reemplazan para no romper la tabla."""
+    if valor is None or valor == "":
+        return vacio
+    return str(valor).replace("|", "/").replace("\n", " ").strip()
+
+def _periodo(valor) -> str:
+    """'2024-05-01' -> '2024-05' (los periodos son mensuales)."""
+    texto = _valor(valor)
+    return texto[:7] if len(texto) >= 10 and texto[4] == "-" else texto
+
+def _fecha(valor) -> str:
+    """Solo la parte de la fecha de un DATE o TIMESTAMP."""
+    return _valor(valor)[:10]
+
+def _monto(valor) -> str:
+    try:
+        return f"{float(valor):.2f}"
+    except (TypeError, ValueError):
+        return _valor(valor)
+
+def _tabla(titulo: str, columnas: list[str], filas: list[list[str]]) -> str:
+    if not filas:
+        return f"{titulo}: ninguna\n"
+    lineas = [f"{titulo} ({'|'.join(columnas)}):"]
+    lineas += ["|".join(fila) for fila in filas]
+    return "\n".join(lineas) + "\n"
+
+def renderizar_contexto(datos_cliente: dict) -> str:
+    """
+    Representación compacta del snapshot de un cliente para el prompt.
+
+    En lugar del JSON completo (todas las columnas de cada fila, con claves
+    y sangría), emite solo los campos que el asistente necesita para
+    responder, en líneas "clave: valor" y tablas separadas por "|".
+    """
+    cliente = datos_cliente.get("cliente") or {}
+    contrato = datos_cliente.get("contrato") or {}
+    medidor = datos_cliente.get("medidor") or {}
+
+    partes = [
+        f"Cliente: {_valor(cliente.get('nombre'))} {_valor(cliente.get('apellido'), '')}".rstrip()
+        + f" | N° cliente {_valor(cliente.get('id_cliente'))}"
+        + f" | Cédula {_valor(cliente.get('numero_identificacion_personal'))}\n",
+        f"Dirección: {_valor(cliente.get('direccion'))} | Email: {_valor(cliente.get('email'))}\n",
+    ]
+
+    if contrato:
+        partes.append(
+            f"Contrato: N° {_valor(contrato.get('id_contrato'))} | Estado {_valor(contrato.get('estado_servicio'))}"
+            f" | Desde {_fecha(contrato.get('fecha_inicio'))}\n"
+        )
+    else:
+        partes.append("Contrato: sin contrato activo\n")
+
+    if medidor:
+        partes.append(f"Medidor: {_valor(medidor.get('numero_medidor'))} | Ubicación {_valor(medidor.get('ubicacion'))}\n")
+
+    partes.append(_tabla(
+        "Facturas",
+        ["periodo", "monto $", "vence", "estado"],
+        [
+            [_periodo(f.get("periodo")), _monto(f.get("monto")), _fecha(f.get("fecha_vencimiento")), _valor(f.get("estado_pago"))]
+            for f in datos_cliente.get("facturas") or []
+        ],
+    ))
+    partes.append(_tabla(
+        "Consumos",
+        ["periodo", "m³"],
+        [
+            [_periodo(c.get("periodo")), _valor(c.get("consumo_metros_cubicos"))]
+            for c in (datos_cliente.get("consumos") or [])[:CONTEXTO_CONSUMOS]
+        ],
+    ))
+    analisis = analisis_de(datos_cliente)
+    if analisis and analisis.periodos_analizados > CONTEXTO_CONSUMOS:
+        resumen = [f"promedio 6 meses {analisis.promedio_6:.2f} m³"]
+        if analisis.media_movil_12 is not None:
+            resumen.append(f"12 meses {analisis.media_movil_12:.2f} m³")
+        if analisis.linea_base_estacional is not None:
+            resumen.append(f"mismo mes años anteriores {analisis.linea_base_estacional:.2f} m³")
+        resumen.append(f"consumo actual {'atípico (' + analisis.motivo + ')' if analisis.atipico else 'normal'}")
+        partes.append(f"Resumen de consumo ({analisis.periodos_analizados} periodos): {' | '.join(resumen)}\n")
+    partes.append(_tabla(
+        "Solicitudes",
+        ["fecha", "tipo", "estado"],
+        [
+            [_fecha(s.get("fecha_solicitud")), _valor(s.get("tipo_solicitud")), _valor(s.get("estado_solicitud"))]
+            for s in datos_cliente.get("solicitudes") or []
+        ],
+    ))
+
+    return "".join(partes)
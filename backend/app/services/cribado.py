@@ -0,0 +1,267 @@
+"""
+Cribado nocturno de consumos: evalúa todos los medidores con las reglas de
+consulta_consumo_normal y marca los que apuntan a una posible fuga.
+
+Recorre la tabla consumos por páginas (paginación por clave sobre
+id_medidor, apoyada en idx_consumos_medidor_periodo), las agrupa en lotes,
+puntúa cada lote en un pool de procesos con puntuar_matriz y escribe una
+fila por medidor en formato columnar (.npy por columna o Parquet). La
+memoria no depende del número de medidores: solo hay unos pocos lotes en
+vuelo a la vez.
+
+Uso (desde la carpeta backend):
+    python -m app.services.cribado --salida cribado/
+    python -m app.services.cribado --salida cribado.parquet --formato parquet --periodo 2024-12 --procesos 4
+
+Las columnas .npy se leen con np.load(..., mmap_mode="r").
+"""
+import os
+import sys
+import json
+import time
+import shutil
+import logging
+import argparse
+from collections import deque
+from concurrent.futures import Executor, ProcessPoolExecutor, Future
+from datetime import date
+from typing import Iterable, Iterator
+
+import numpy as np
+
+from .analitica import puntuar_matriz, MOTIVO_NORMAL
+
+logger = logging.getLogger(__name__)
+
+# --- Configuración del cribado ---
+CRIBADO_PERIODOS = int(os.environ.get("CRIBADO_PERIODOS", "36"))  # Meses de historia por medidor
+# Filas por petición; Supabase devuelve como máximo 1000 (max-rows) aunque se pidan más
+CRIBADO_FILAS_PAGINA = int(os.environ.get("CRIBADO_FILAS_PAGINA", "1000"))
+CRIBADO_FILAS_LOTE = int(os.environ.get("CRIBADO_FILAS_LOTE", "200000"))  # Filas que se puntúan juntas
+
+# Página de consumos: medidor, columna del mes (0 = el más antiguo) y m³ de cada fila
+Pagina = tuple[np.ndarray, np.ndarray, np.ndarray]
+
+# Columnas del resultado, una fila por medidor
+COLUMNAS = {
+    "id_medidor": np.int64,
+    "lecturas": np.int16,              # Meses con lectura antes del evaluado
+    "consumo_actual": np.float32,      # NaN si no hay lectura del mes evaluado
+    "delta_mensual": np.float32,       # Diferencia con el mes anterior
+    "media": np.float32,
+    "linea_base_estacional": np.float32,
+    "z_score": np.float32,
+    "limite_iqr_superior": np.float32,
+    "motivo": np.int8,                 # MOTIVO_* de analitica (0 = normal)
+    "posible_fuga": np.bool_,          # Atípico y por encima de lo esperado
+}
+
+def _mes(texto: str) -> int:
+    return int(texto[:4]) * 12 + int(texto[5:7]) - 1
+
+def paginas_consumos(supabase, hasta: str, periodos: int = CRIBADO_PERIODOS,
+                     filas_pagina: int = CRIBADO_FILAS_PAGINA) -> Iterator[Pagina]:
+    """
+    Recorre los consumos de los ``periodos`` meses que terminan en ``hasta``
+    ('YYYY-MM') ordenados por (id_medidor, periodo), con medidores completos
+    en cada página.
+
+    Cada petición continúa tras el último medidor completo
+    (id_medidor > último); el último medidor de una página puede venir
+    cortado, así que se descarta y se vuelve a pedir al principio de la
+    siguiente. Así da igual que el servidor recorte la página (max-rows).
+    """
+    final = _mes(hasta)
+    inicio = final - periodos + 1
+    desde_fecha = date(inicio // 12, inicio % 12 + 1, 1).isoformat()
+    hasta_fecha = date(final // 12, final % 12 + 1, 1).isoformat()
+    ultimo = 0
+    while True:
+        filas = (
+            supabase.table("consumos")
+            .select("id_medidor,periodo,consumo_metros_cubicos")
+            .gt("id_medidor", ultimo)
+            .gte("periodo", desde_fecha)
+            .lte("periodo", hasta_fecha)
+            .order("id_medidor")
+            .order("periodo")
+            .limit(filas_pagina)
+            .execute()
+        ).data
+        if not filas:
+            return
+        ids = np.fromiter((f["id_medidor"] for f in filas), dtype=np.int64, count=len(filas))
+        completas = len(filas)
+        if ids[-1] != ids[0]:
+            completas = int(np.searchsorted(ids, ids[-1]))  # Sin el último medidor
+        columnas = np.fromiter((_mes(f["periodo"]) - inicio for f in filas[:completas]), dtype=np.int16, count=completas)
+        valores = np.fromiter((float(f["consumo_metros_cubicos"]) for f in filas[:completas]), dtype=np.float64, count=completas)
+        yield ids[:completas], columnas, valores
+        ultimo = int(ids[completas - 1])
+
+def agrupar(paginas: Iterable[Pagina], filas_lote: int) -> Iterator[Pagina]:
+    """Une páginas consecutivas hasta ``filas_lote`` filas: lotes grandes aprovechan mejor la vectorización y el pool."""
+    acumuladas, filas = [], 0
+    for pagina in paginas:
+        acumuladas.append(pagina)
+        filas += len(pagina[0])
+        if filas >= filas_lote:
+            yield tuple(np.concatenate(partes) for partes in zip(*acumuladas))
+            acumuladas, filas = [], 0
+    if acumuladas:
+        yield tuple(np.concatenate(partes) for partes in zip(*acumuladas))
+
+def puntuar_pagina(pagina: Pagina, periodos: int) -> dict[str, np.ndarray]:
+    """Columnas del resultado para los medidores de una página (se ejecuta en el pool)."""
+    ids, columnas, valores = pagina
+    medidores, fila = np.unique(ids, return_inverse=True)
+    matriz = np.full((len(medidores), periodos), np.nan)
+    matriz[fila, columnas] = valores
+
+    puntuacion = puntuar_matriz(matriz)
+    actual = matriz[:, -1]
+    base = puntuacion["linea_base_estacional"]
+    referencia = np.where(np.isnan(base), puntuacion["media"], base)
+    resultado = {
+        "id_medidor": medidores,
+        "lecturas": puntuacion["lecturas"],
+        "consumo_actual": actual,
+        "delta_mensual": actual - matriz[:, -2] if periodos > 1 else np.full(len(medidores), np.nan),
+        "media": puntuacion["media"],
+        "linea_base_estacional": base,
+        "z_score": puntuacion["z_score"],
+        "limite_iqr_superior": puntuacion["limite_iqr_superior"],
+        "motivo": puntuacion["motivo"],
+        "posible_fuga": (puntuacion["motivo"] != MOTIVO_NORMAL) & (actual > referencia),
+    }
+    return {columna: resultado[columna].astype(tipo, copy=False) for columna, tipo in COLUMNAS.items()}
+
+class EscritorNpy:
+    """
+    Una columna por archivo .npy en la carpeta ``ruta``.
+
+    Los valores se añaden a archivos temporales a medida que llegan; al
+    cerrar, cuando ya se conoce el número de filas, se escribe la cabecera
+    .npy y se copia el contenido sin cargarlo en memoria.
+    """
+
+    def __init__(self, ruta: str):
+        self.ruta = ruta
+        os.makedirs(ruta, exist_ok=True)
+        self._partes = {columna: open(self._archivo(columna) + ".parcial", "wb") for columna in COLUMNAS}
+        self.filas = 0
+
+    def _archivo(self, columna: str) -> str:
+        return os.path.join(self.ruta, f"{columna}.npy")
+
+    def escribir(self, columnas: dict[str, np.ndarray]):
+        for columna, archivo in self._partes.items():
+            archivo.write(np.ascontiguousarray(columnas[columna]).tobytes())
+        self.filas += len(columnas["id_medidor"])
+
+    def cerrar(self):
+        for columna, parcial in self._partes.items():
+            parcial.close()
+            with open(self._archivo(columna), "wb") as destino, open(parcial.name, "rb") as origen:
+                cabecera = {"descr": np.lib.format.dtype_to_descr(np.dtype(COLUMNAS[columna])),
+                            "fortran_order": False, "shape": (self.filas,)}
+                np.lib.format.write_array_header_1_0(destino, cabecera)
+                shutil.copyfileobj(origen, destino)
+            os.remove(parcial.name)
+
+class EscritorParquet:
+    """Un row group por lote en un archivo Parquet (requiere pyarrow)."""
+
+    def __init__(self, ruta: str):
+        try:
+            import pyarrow as pa
+            import pyarrow.parquet as pq
+        except ImportError:
+            raise RuntimeError("El formato parquet requiere pyarrow (pip install pyarrow); use --formato npy.")
+        self._pa = pa
+        esquema = pa.schema([(columna, pa.from_numpy_dtype(np.dtype(tipo))) for columna, tipo in COLUMNAS.items()])
+        self._escritor = pq.ParquetWriter(ruta, esquema, compression="zstd")
+        self.filas = 0
+
+    def escribir(self, columnas: dict[str, np.ndarray]):
+        self._escritor.write_table(self._pa.table(columnas))
+        self.filas += len(columnas["id_medidor"])
+
+    def cerrar(self):
+        self._escritor.close()
+
+ESCRITORES = {"npy": EscritorNpy, "parquet": EscritorParquet}
+
+def cribar(paginas: Iterable[Pagina], escritor, periodos: int = CRIBADO_PERIODOS,
+           pool: Executor | None = None, en_vuelo: int = 4) -> dict:
+    """
+    Puntúa las páginas (en ``pool`` si se indica, como mucho ``en_vuelo``
+    pendientes a la vez) y las escribe en orden con ``escritor``.
+    Devuelve un resumen del cribado.
+    """
+    inicio = time.perf_counter()
+    resumen = {"medidores": 0, "atipicos": 0, "posibles_fugas": 0, "sin_lectura": 0}
+    pendientes: deque[Future] = deque()
+
+    def guardar(columnas: dict[str, np.ndarray]):
+        escritor.escribir(columnas)
+        resumen["medidores"] += len(columnas["id_medidor"])
+        resumen["atipicos"] += int(np.count_nonzero(columnas["motivo"]))
+        resumen["posibles_fugas"] += int(np.count_nonzero(columnas["posible_fuga"]))
+        resumen["sin_lectura"] += int(np.count_nonzero(np.isnan(columnas["consumo_actual"])))
+
+    try:
+        for pagina in paginas:
+            if pool is None:
+                guardar(puntuar_pagina(pagina, periodos))
+                continue
+            pendientes.append(pool.submit(puntuar_pagina, pagina, periodos))
+            if len(pendientes) >= en_vuelo:
+                guardar(pendientes.popleft().result())
+        while pendientes:
+            guardar(pendientes.popleft().result())
+    finally:
+        for futuro in pendientes:
+            futuro.cancel()
+        escritor.cerrar()
+
+    resumen["segundos"] = round(time.perf_counter() - inicio, 3)
+    return resumen
+
+def _ultimo_periodo(supabase) -> str | None:
+    filas = supabase.table("consumos").select("periodo").order("periodo", desc=True).limit(1).execute().data
+    return str(filas[0]["periodo"])[:7] if filas else None
+
+def main():
+    parser = argparse.ArgumentParser(description="Cribado de consumos atípicos y posibles fugas en todos los medidores")
+    parser.add_argument("--salida", required=True, help="Carpeta (npy) o archivo (parquet) de resultados")
+    parser.add_argument("--formato", choices=sorted(ESCRITORES), default="npy")
+    parser.add_argument("--periodo", help="Mes evaluado (YYYY-MM); por defecto, el último con consumos")
+    parser.add_argument("--periodos", type=int, default=CRIBADO_PERIODOS, help="Meses de historia por medidor")
+    parser.add_argument("--filas-pagina", type=int, default=CRIBADO_FILAS_PAGINA)
+    parser.add_argument("--filas-lote", type=int, default=CRIBADO_FILAS_LOTE)
+    parser.add_argument("--procesos", type=int, default=os.cpu_count() or 1, help="0 = puntuar en el proceso principal")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(name)s: %(message)s")
+    logging.getLogger("httpx").setLevel(logging.WARNING)  # Una línea por página sería demasiado
+
+    from .database import get_supabase_client
+    supabase = get_supabase_client()
+    if not supabase:
+        sys.exit("La conexión a Supabase no está disponible (SUPABASE_URL / SUPABASE_KEY).")
+    periodo = args.periodo or _ultimo_periodo(supabase)
+    if not periodo:
+        sys.exit("La tabla consumos está vacía.")
+
+    logger.info(f"Cribado de {periodo} con {args.periodos} meses de historia en {args.procesos} proceso(s).")
+    paginas = agrupar(paginas_consumos(supabase, periodo, args.periodos, args.filas_pagina), args.filas_lote)
+    escritor = ESCRITORES[args.formato](args.salida)
+    if args.procesos > 0:
+        with ProcessPoolExecutor(max_workers=args.procesos) as pool:
+            resumen = cribar(paginas, escritor, args.periodos, pool, en_vuelo=2 * args.procesos)
+    else:
+        resumen = cribar(paginas, escritor, args.periodos)
+    print(json.dumps({"periodo": periodo, **resumen}, ensure_ascii=False))
+
+if __name__ == "__main__":
+    main()
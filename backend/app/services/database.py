@@ -1,215 +1,691 @@
 import os
-from supabase import create_client, Client
-from dotenv import load_dotenv
-
-# Cargar las variables de entorno desde el archivo .env
-load_dotenv()
-
-url: str = os.environ.get("SUPABASE_URL")
-key: str = os.environ.get("SUPABASE_KEY")
+import time
+import asyncio
+import logging
+from typing import TYPE_CHECKING
+
+from ..config import SUPABASE_URL, SUPABASE_KEY
+from .cache import CacheSnapshots
+from .identificadores import IndiceIdentificadores, Ubicacion, candidatos_identificador
+from .analitica import analisis_de, analizar_facturas
+from .catalogo import obtener_entrada
+from .postgres import conexion_postgres
+from . import metricas, postgres
+
+if TYPE_CHECKING:
+    from supabase import Client
+
+logger = logging.getLogger(__name__)
+
+# Obtener el snapshot del cliente en una sola petición con la función SQL
+# obtener_snapshot_cliente (ver migracion_snapshot_cliente.sql en la raíz del repositorio)
+USAR_SNAPSHOT_RPC: bool = os.environ.get("SUPABASE_SNAPSHOT_RPC", "false").lower() == "true"
+SUPABASE_REINTENTO_MAX = float(os.environ.get("SUPABASE_REINTENTO_MAX", "30"))  # Espera máxima entre reintentos
+# Leer saldo, facturas vencidas y próxima factura de la tabla resumen_cuenta
+# (ver migracion_resumen_cuenta.sql) en lugar de calcularlos con el snapshot
+USAR_RESUMEN_CUENTA: bool = os.environ.get("SUPABASE_RESUMEN_CUENTA", "false").lower() == "true"
+# Periodos de consumo del snapshot (los que usa la analítica; el SQL de obtener_snapshot_cliente trae 36)
+CONSUMOS_HISTORIAL = int(os.environ.get("CONSUMOS_HISTORIAL", "36"))
+# Acceso a los datos: "supabase" (API REST) o "postgres" (asyncpg directo a DATABASE_URL, ver postgres.py)
+DB_BACKEND = os.environ.get("DB_BACKEND", "supabase").lower()
+if DB_BACKEND not in ("supabase", "postgres"):
+    raise ValueError(f"DB_BACKEND desconocido: {DB_BACKEND} (use 'supabase' o 'postgres')")
+USAR_POSTGRES = DB_BACKEND == "postgres"
+
+# Caché de snapshots compartida por el chat y las consultas rápidas
+cache_clientes = CacheSnapshots(
+    max_entradas=int(os.environ.get("CACHE_CLIENTES_MAX", "1000")),
+    ttl_segundos=float(os.environ.get("CACHE_CLIENTES_TTL", "120")),
+)
+# Y de las filas de resumen_cuenta ({"cliente", "resumen"}), con la misma configuración
+cache_resumenes = CacheSnapshots(max_entradas=cache_clientes.max_entradas, ttl_segundos=cache_clientes.ttl_segundos)
+
+class ConexionSupabase:
+    """
+    Cliente de Supabase creado bajo demanda en lugar de al importar el módulo.
 
-# Crear una única instancia del cliente de Supabase
-try:
-    supabase: Client = create_client(url, key)
-    print("Conexión a Supabase establecida exitosamente.")
-except Exception as e:
-    print(f"Error al conectar con Supabase: {e}")
-    supabase = None
+    La aplicación lo abre en su lifespan (una vez por proceso de uvicorn, así
+    los workers no comparten un cliente a medio crear). Si la creación falla,
+    ``obtener`` lanza un nuevo intento en segundo plano (en un hilo, para no
+    bloquear el event loop) cuando pasa la espera, que se duplica hasta
+    ``reintento_max`` segundos; mientras tanto devuelve None.
+    """
 
-def get_supabase_client() -> Client:
-    """Devuelve la instancia del cliente de Supabase."""
-    return supabase
+    def __init__(self, url: str | None, key: str | None, reintento_max: float = SUPABASE_REINTENTO_MAX):
+        self.url = url
+        self.key = key
+        self.reintento_max = reintento_max
+        self._cliente = None
+        self._conectando: asyncio.Task | None = None
+        self._proximo_intento = 0.0
+        self._espera = 1.0
+        self.intentos = 0
+        self.ultimo_error = None
+
+    def obtener(self) -> "Client | None":
+        """Devuelve el cliente, o None si aún no existe (y programa un reintento si ya toca)."""
+        if self._cliente is None and self._conectando is None and time.monotonic() >= self._proximo_intento:
+            try:
+                bucle = asyncio.get_running_loop()
+            except RuntimeError:
+                self._conectar()  # Fuera del event loop (scripts): no hay nada que bloquear
+            else:
+                self._conectando = bucle.create_task(self._conectar_en_segundo_plano())
+        return self._cliente
+
+    async def _conectar_en_segundo_plano(self):
+        try:
+            await asyncio.to_thread(self._conectar)
+        finally:
+            self._conectando = None
+
+    def _conectar(self):
+        self.intentos += 1
+        try:
+            from supabase import create_client  # Importación pesada: solo cuando se necesita
+            self._cliente = create_client(self.url, self.key)
+            self._espera = 1.0
+            self.ultimo_error = None
+            logger.info("Conexión a Supabase establecida exitosamente.")
+        except Exception as e:
+            self.ultimo_error = str(e)
+            self._proximo_intento = time.monotonic() + self._espera
+            logger.error(f"Error al conectar con Supabase (reintento en {self._espera:.0f} s): {e}")
+            self._espera = min(self._espera * 2, self.reintento_max)
+
+    def reintentar_en(self) -> int:
+        """Segundos hasta el próximo intento de conexión (para Retry-After)."""
+        return max(1, round(self._proximo_intento - time.monotonic()))
+
+    async def abrir(self):
+        """Crea el cliente fuera del event loop (al arrancar la aplicación)."""
+        if self._cliente is None:
+            await asyncio.to_thread(self._conectar)
+
+    async def cerrar(self):
+        """Descarta el cliente al apagar la aplicación."""
+        if self._conectando is not None:
+            await self._conectando
+        if self._cliente is not None:
+            try:
+                self._cliente.postgrest.session.close()
+            except Exception:
+                pass
+            self._cliente = None
+
+    def estadisticas(self) -> dict:
+        return {"conectado": self._cliente is not None, "intentos": self.intentos, "ultimo_error": self.ultimo_error}
+
+conexion_supabase = ConexionSupabase(SUPABASE_URL, SUPABASE_KEY)
+
+def get_supabase_client() -> "Client | None":
+    """Devuelve el cliente de Supabase, o None si no se pudo crear (se reintentará más adelante)."""
+    return conexion_supabase.obtener()
+
+# Conexión del backend configurado en DB_BACKEND: la que abre y cierra la aplicación
+conexion_bd = conexion_postgres if USAR_POSTGRES else conexion_supabase
+
+def base_disponible() -> bool:
+    """Si hay conexión con la base de datos (cliente de Supabase o pool de PostgreSQL)."""
+    return conexion_bd.obtener() is not None
+
+async def _ejecutar(consulta, tabla: str) -> list:
+    """
+    Ejecuta una consulta de Supabase en un hilo aparte para no bloquear el
+    event loop y devuelve las filas obtenidas. ``tabla`` etiqueta la métrica
+    de duración de la consulta.
+    """
+    inicio = time.perf_counter()
+    try:
+        response = await asyncio.to_thread(consulta.execute)
+    except Exception:
+        metricas.supabase_errores_total.incrementar(tabla=tabla)
+        raise
+    finally:
+        metricas.supabase_consulta_segundos.observar(time.perf_counter() - inicio, tabla=tabla)
+    return response.data
+
+async def _sin_filas() -> list:
+    """Resultado vacío para las consultas que no aplican (ej. cliente sin contrato)."""
+    return []
 
 async def buscar_datos_cliente(identificador: str) -> dict:
     """
     Busca la información completa de un cliente y sus datos asociados
-    a partir de un identificador (ID de cliente, N° de medidor o N° de factura).
+    a partir de un identificador (ID de cliente, N° de medidor, cédula o N° de
+    factura como FAC-123).
+
+    El resultado se sirve desde la caché de snapshots mientras no haya caducado;
+    el diccionario devuelto es compartido y no debe modificarse.
     """
-    if not supabase:
-        return {"error": "La conexión a Supabase no está disponible."}
-
-    datos_completos = {
-        "cliente": None,
-        "contrato": None,
-        "medidor": None,
-        "facturas": [],
-        "consumos": [],
-        "solicitudes": []
-    }
+    if not base_disponible():
+        return {"error": "La conexión a la base de datos no está disponible."}
+
+    return await cache_clientes.obtener(identificador, _cargar_datos_cliente)
 
+def invalidar_cache_cliente(identificador: str = None, id_cliente: int = None) -> int:
+    """
+    Descarta de la caché los snapshots de un identificador y/o de un cliente.
+    Debe llamarse cuando cambian sus facturas, consumos o solicitudes.
+    """
+    eliminadas = 0
+    for cache in (cache_clientes, cache_resumenes):
+        if identificador is not None:
+            eliminadas += cache.invalidar(identificador)
+        if id_cliente is not None:
+            eliminadas += cache.invalidar_cliente(id_cliente)
+    return eliminadas
+
+async def _cargar_datos_cliente(identificador: str) -> dict:
+    """Consulta en la base de datos el snapshot completo de un cliente."""
+    with metricas.snapshot_cliente_segundos.medir():
+        if USAR_SNAPSHOT_RPC:
+            return await buscar_datos_cliente_rpc(identificador)
+        return await _cargar_datos_cliente_consultas(identificador)
+
+async def _cargar_datos_cliente_consultas(identificador: str) -> dict:
+    """
+    Snapshot del cliente con las consultas fijas de cada tabla.
+
+    El identificador se clasifica por su formato (ver identificadores.py) y,
+    si no corresponde a ningún cliente, se busca como número de medidor. Si
+    el índice de identificadores ya sabe a qué cliente, contrato y medidor
+    apunta, todas las consultas salen en paralelo; si no, se resuelve con una
+    consulta según su tipo y luego se consultan en paralelo las facturas,
+    consumos y solicitudes. Con DB_BACKEND=postgres cada búsqueda es una
+    sola sentencia (ver postgres.py).
+    """
     try:
-        # Primero, intentamos buscar por número de medidor, que es muy específico
-        response = supabase.table('medidores').select('*, contratos(*, clientes(*))').eq('numero_medidor', identificador).execute()
-        if response.data:
-            medidor = response.data[0]
-            contrato = medidor['contratos']
-            cliente = contrato['clientes']
-            id_cliente = cliente['id_cliente']
-            id_contrato = contrato['id_contrato']
-            id_medidor = medidor['id_medidor']
+        inicio = time.perf_counter()
+        candidatos = candidatos_identificador(identificador)
+
+        for tipo, valor in candidatos:
+            ubicacion = indice_identificadores.buscar(tipo, valor)
+            if ubicacion is None:
+                continue
+            metricas.resolucion_identificador_segundos.observar(time.perf_counter() - inicio, tipo='indice')
+            datos = await _cargar_por_ubicacion(ubicacion)
+            if _corresponde(tipo, valor, datos):
+                return datos
+            # El índice estaba desactualizado (p. ej. cambió el contrato activo)
+            indice_identificadores.descartar(tipo, valor)
+            inicio = time.perf_counter()
+
+        if USAR_POSTGRES:
+            # Resolución e historial en la misma sentencia: la métrica incluye ambos
+            for tipo, valor in candidatos:
+                datos = await postgres.snapshot_por_identificador(tipo, valor, CONSUMOS_HISTORIAL)
+                if datos['cliente']:
+                    break
+            cliente, contrato, medidor = datos['cliente'], datos['contrato'], datos['medidor']
+            metricas.resolucion_identificador_segundos.observar(time.perf_counter() - inicio, tipo=tipo if cliente else 'no_encontrado')
+            if contrato:
+                indice_identificadores.registrar(tipo, valor, Ubicacion(
+                    cliente['id_cliente'], contrato['id_contrato'], medidor['id_medidor'] if medidor else None))
+            return datos
+
+        datos_completos = {
+            "cliente": None,
+            "contrato": None,
+            "medidor": None,
+            "facturas": [],
+            "consumos": [],
+            "solicitudes": []
+        }
+
+        tipo, valor, (cliente, contrato, medidor) = await _resolver_candidatos(candidatos)
+        metricas.resolucion_identificador_segundos.observar(time.perf_counter() - inicio, tipo=tipo if cliente else 'no_encontrado')
+
+        # Si hemos encontrado un cliente, recopilamos el resto de la información en paralelo
+        if cliente:
+            if contrato:
+                indice_identificadores.registrar(tipo, valor, Ubicacion(
+                    cliente['id_cliente'], contrato['id_contrato'], medidor['id_medidor'] if medidor else None))
 
-        else:
-            # Si no es un medidor, podría ser un número de factura (menos común, pero posible)
-            # Esta lógica se puede expandir. Por simplicidad, nos centraremos en medidor y ID de cliente.
-            # Podríamos añadir búsqueda por ID de factura o Cedula del cliente aquí.
-
-            # Intentamos buscar por ID de cliente (si el identificador es un número)
-            if identificador.isdigit():
-                response = supabase.table('clientes').select('*').eq('id_cliente', int(identificador)).execute()
-                if response.data:
-                    cliente = response.data[0]
-                    id_cliente = cliente['id_cliente']
-                    # Ahora buscamos su contrato activo
-                    contrato_res = supabase.table('contratos').select('*').eq('id_cliente', id_cliente).eq('estado_servicio', 'Activo').execute()
-                    if contrato_res.data:
-                        contrato = contrato_res.data[0]
-                        id_contrato = contrato['id_contrato']
-                        medidor_res = supabase.table('medidores').select('*').eq('id_contrato', id_contrato).execute()
-                        if medidor_res.data:
-                            medidor = medidor_res.data[0]
-                            id_medidor = medidor['id_medidor']
-
-        # Si hemos encontrado un cliente y contrato, recopilamos el resto de la información
-        if 'id_cliente' in locals():
             datos_completos['cliente'] = cliente
             datos_completos['contrato'] = contrato
             datos_completos['medidor'] = medidor
 
-            # Buscar facturas, consumos y solicitudes
-            facturas_res = supabase.table('facturas').select('*').eq('id_contrato', id_contrato).order('periodo', desc=True).limit(5).execute()
-            datos_completos['facturas'] = facturas_res.data
+            facturas, consumos, solicitudes = await asyncio.gather(*_consultas_historial(
+                cliente['id_cliente'],
+                contrato['id_contrato'] if contrato else None,
+                medidor['id_medidor'] if medidor else None,
+            ))
+            datos_completos['facturas'] = facturas
+            datos_completos['consumos'] = consumos
+            datos_completos['solicitudes'] = solicitudes
 
-            consumos_res = supabase.table('consumos').select('*').eq('id_medidor', id_medidor).order('periodo', desc=True).limit(5).execute()
-            datos_completos['consumos'] = consumos_res.data
+        return datos_completos
 
-            solicitudes_res = supabase.table('solicitudes').select('*').eq('id_cliente', id_cliente).order('fecha_solicitud', desc=True).limit(3).execute()
-            datos_completos['solicitudes'] = solicitudes_res.data
+    except Exception as e:
+        logger.error(f"Error al buscar datos del cliente: {e}")
+        return {"error": str(e)}
 
-        return datos_completos
+async def _resolver_candidatos(candidatos: list[tuple[str, str]]) -> tuple:
+    """(tipo, valor, (cliente, contrato, medidor)) de la primera búsqueda que encuentra un cliente, o de la última."""
+    for tipo, valor in candidatos:
+        resultado = await _resolver_identificador(tipo, valor)
+        if resultado[0]:
+            break
+    return tipo, valor, resultado
+
+async def _resolver_identificador(tipo: str, valor: str) -> tuple:
+    """Busca el cliente, contrato y medidor de un identificador con una sola consulta según su tipo."""
+    if USAR_POSTGRES:
+        return await postgres.resolver_identificador(tipo, valor)
+
+    supabase = get_supabase_client()
+    cliente = contrato = medidor = None
+
+    if tipo == 'medidor':
+        # El contrato del medidor (aunque no sea el activo) y su cliente
+        filas = await _ejecutar(supabase.table('medidores').select('*, contratos(*, clientes(*))').eq('numero_medidor', valor), 'medidores')
+        if filas:
+            medidor = filas[0]
+            contrato = medidor.pop('contratos')
+            cliente = contrato.pop('clientes')
+
+    elif tipo == 'factura':
+        # El contrato facturado, con su cliente y su medidor
+        filas = await _ejecutar(supabase.table('facturas').select('id_factura, contratos(*, clientes(*), medidores(*))').eq('id_factura', int(valor)), 'facturas')
+        if filas and filas[0].get('contratos'):
+            contrato = filas[0]['contratos']
+            cliente = contrato.pop('clientes')
+            medidores = contrato.pop('medidores') or []
+            medidor = medidores[0] if medidores else None
+
+    else:
+        # ID de cliente o cédula: el contrato activo y su medidor vienen embebidos
+        columna, filtro = ('id_cliente', int(valor)) if tipo == 'cliente' else ('numero_identificacion_personal', valor)
+        filas = await _ejecutar(
+            supabase.table('clientes')
+            .select('*, contratos(*, medidores(*))')
+            .eq(columna, filtro)
+            .eq('contratos.estado_servicio', 'Activo'),
+            'clientes',
+        )
+        if filas:
+            cliente = filas[0]
+            contratos = cliente.pop('contratos') or []
+            if contratos:
+                contrato = contratos[0]
+                medidores = contrato.pop('medidores') or []
+                medidor = medidores[0] if medidores else None
+
+    return cliente, contrato, medidor
+
+def _consultas_historial(id_cliente: int, id_contrato: int | None, id_medidor: int | None) -> list:
+    """Consultas (sin esperar) de las últimas facturas, consumos y solicitudes del cliente."""
+    supabase = get_supabase_client()
+    return [
+        _ejecutar(supabase.table('facturas').select('*').eq('id_contrato', id_contrato).order('periodo', desc=True).limit(5), 'facturas')
+        if id_contrato else _sin_filas(),
+        _ejecutar(supabase.table('consumos').select('*').eq('id_medidor', id_medidor).order('periodo', desc=True).limit(CONSUMOS_HISTORIAL), 'consumos')
+        if id_medidor else _sin_filas(),
+        _ejecutar(supabase.table('solicitudes').select('*').eq('id_cliente', id_cliente).order('fecha_solicitud', desc=True).limit(3), 'solicitudes'),
+    ]
+
+async def _cargar_por_ubicacion(ubicacion: Ubicacion) -> dict:
+    """Snapshot de una ubicación ya conocida: todas las consultas en paralelo."""
+    if USAR_POSTGRES:
+        return await postgres.snapshot_por_ubicacion(ubicacion, CONSUMOS_HISTORIAL)
+
+    supabase = get_supabase_client()
+    if ubicacion.id_medidor is not None:
+        identidad = _ejecutar(supabase.table('medidores').select('*, contratos(*, clientes(*))').eq('id_medidor', ubicacion.id_medidor), 'medidores')
+    else:
+        identidad = _ejecutar(supabase.table('contratos').select('*, clientes(*)').eq('id_contrato', ubicacion.id_contrato), 'contratos')
+
+    filas, facturas, consumos, solicitudes = await asyncio.gather(
+        identidad, *_consultas_historial(ubicacion.id_cliente, ubicacion.id_contrato, ubicacion.id_medidor))
+
+    medidor = contrato = cliente = None
+    if filas:
+        if ubicacion.id_medidor is not None:
+            medidor = filas[0]
+            contrato = medidor.pop('contratos')
+        else:
+            contrato = filas[0]
+        cliente = contrato.pop('clientes')
+
+    return {
+        "cliente": cliente,
+        "contrato": contrato,
+        "medidor": medidor,
+        "facturas": facturas,
+        "consumos": consumos,
+        "solicitudes": solicitudes,
+    }
 
+def _corresponde(tipo: str, valor: str, datos: dict) -> bool:
+    """Comprueba que el snapshot cargado desde el índice sigue siendo el del identificador."""
+    cliente, contrato, medidor = datos['cliente'], datos['contrato'], datos['medidor']
+    if not cliente or not contrato or contrato['id_cliente'] != cliente['id_cliente']:
+        return False
+    if tipo == 'medidor':
+        return bool(medidor) and medidor['numero_medidor'] == valor
+    if tipo == 'factura':
+        return True  # Una factura no cambia de contrato
+    activo = contrato['estado_servicio'] == 'Activo'
+    if tipo == 'cliente':
+        return activo and str(cliente['id_cliente']) == valor
+    return activo and cliente.get('numero_identificacion_personal') == valor
+
+async def _pagina_medidores(desde_id: int, limite: int) -> list:
+    """Página de medidores (con el cliente y la cédula de su contrato) para el índice de identificadores."""
+    if USAR_POSTGRES:
+        return await postgres.pagina_medidores(desde_id, limite) if base_disponible() else []
+
+    supabase = get_supabase_client()
+    if not supabase:
+        return []
+    return await _ejecutar(
+        supabase.table('medidores')
+        .select('id_medidor, numero_medidor, id_contrato, contratos(id_cliente, estado_servicio, clientes(numero_identificacion_personal))')
+        .gt('id_medidor', desde_id)
+        .order('id_medidor')
+        .limit(limite),
+        'medidores',
+    )
+
+# Índice identificador -> cliente/contrato/medidor para no resolver cada identificador con una consulta
+indice_identificadores = IndiceIdentificadores(
+    _pagina_medidores,
+    max_entradas=int(os.environ.get("INDICE_IDENTIFICADORES_MAX", "200000")),
+    intervalo_refresco=float(os.environ.get("INDICE_IDENTIFICADORES_REFRESCO", "300")),
+)
+
+async def buscar_datos_cliente_rpc(identificador: str) -> dict:
+    """
+    Obtiene el mismo snapshot que buscar_datos_cliente en una única petición,
+    delegando la resolución del identificador y las consultas a la función
+    SQL obtener_snapshot_cliente.
+    """
+    if not base_disponible():
+        return {"error": "La conexión a la base de datos no está disponible."}
+
+    try:
+        if USAR_POSTGRES:
+            return _snapshot_desde_rpc(await postgres.snapshot_rpc(identificador, CONSUMOS_HISTORIAL))
+        snapshot = await _ejecutar(get_supabase_client().rpc('obtener_snapshot_cliente', {'p_identificador': identificador, 'p_consumos': CONSUMOS_HISTORIAL}), 'rpc_obtener_snapshot_cliente')
+        return _snapshot_desde_rpc(snapshot)
     except Exception as e:
-        print(f"Error al buscar datos del cliente: {e}")
+        logger.error(f"Error al obtener el snapshot del cliente: {e}")
         return {"error": str(e)}
 
+def _snapshot_desde_rpc(snapshot: dict | None) -> dict:
+    """Adapta el JSON devuelto por obtener_snapshot_cliente al diccionario de buscar_datos_cliente."""
+    snapshot = snapshot or {}
+    return {
+        "cliente": snapshot.get("cliente"),
+        "contrato": snapshot.get("contrato"),
+        "medidor": snapshot.get("medidor"),
+        "facturas": snapshot.get("facturas") or [],
+        "consumos": snapshot.get("consumos") or [],
+        "solicitudes": snapshot.get("solicitudes") or []
+    }
+
 async def guardar_conversacion(session_id: str, pregunta: str, respuesta: str):
     """Guarda un intercambio de chat en la base de datos."""
-    if not supabase or not session_id:
+    if not base_disponible() or not session_id:
         return
 
+    fila = {
+        "session_id": session_id,
+        "pregunta": pregunta,
+        "respuesta": respuesta
+    }
     try:
-        supabase.table('conversaciones').insert({
-            "session_id": session_id,
-            "pregunta": pregunta,
-            "respuesta": respuesta
-        }).execute()
+        if USAR_POSTGRES:
+            await postgres.insertar_conversaciones([fila])
+        else:
+            await _ejecutar(get_supabase_client().table('conversaciones').insert(fila), 'conversaciones')
+    except Exception as e:
+        logger.error(f"Error al guardar la conversación: {e}")
+
+async def guardar_conversaciones(filas: list[dict]) -> bool:
+    """
+    Guarda varios intercambios (session_id, pregunta, respuesta) con una sola
+    inserción. Devuelve False si no se pudieron guardar, para reintentarlo.
+    """
+    if not filas:
+        return True
+    if not base_disponible():
+        return False
+
+    try:
+        if USAR_POSTGRES:
+            await postgres.insertar_conversaciones(filas)
+        else:
+            await _ejecutar(get_supabase_client().table('conversaciones').insert(filas), 'conversaciones')
+        return True
     except Exception as e:
-        print(f"Error al guardar la conversación: {e}")
+        logger.error(f"Error al guardar las conversaciones: {e}")
+        return False
 
 async def obtener_historial_conversacion(session_id: str, limit: int = 3) -> list:
     """Obtiene el historial de conversación para una sesión."""
-    if not supabase or not session_id:
+    if not base_disponible() or not session_id:
         return []
 
     try:
-        response = supabase.table('conversaciones').select('pregunta, respuesta').eq('session_id', session_id).order('created_at', desc=True).limit(limit).execute()
+        if USAR_POSTGRES:
+            filas = await postgres.historial_conversacion(session_id, limit)
+        else:
+            filas = await _ejecutar(get_supabase_client().table('conversaciones').select('pregunta, respuesta').eq('session_id', session_id).order('id', desc=True).limit(limit), 'conversaciones')
+        # 'id' respeta el orden de inserción aun dentro de un mismo lote (mismo created_at).
         # Invertimos el resultado para que el orden sea cronológico
-        return list(reversed(response.data))
+        return list(reversed(filas))
     except Exception as e:
-        print(f"Error al obtener el historial de conversación: {e}")
+        # Sin la columna 'id' en 'conversaciones' (ver README) la consulta falla aquí
+        logger.error(f"Error al obtener el historial de conversación: {e}")
         return []
 
+# =================== RESUMEN DE CUENTA ===================
+
+# Fila de resumen_cuenta con lo necesario para comprobar que corresponde al identificador
+_SELECT_RESUMEN = '*, clientes(*), contratos(id_cliente, estado_servicio), medidores(numero_medidor)'
+
+async def obtener_resumen_cuenta(identificador: str, datos: dict = None) -> dict:
+    """
+    Fila de resumen_cuenta del contrato de un identificador junto con su
+    cliente: {"cliente": {...}, "resumen": {...}}. "resumen" es None si el
+    cliente no tiene contrato. Con ``datos`` (un snapshot ya obtenido) se
+    usa su contrato y basta con leer la fila.
+
+    Se sirve desde su propia caché, que se invalida con invalidar_cache_cliente.
+    """
+    return await cache_resumenes.obtener(identificador, lambda _: _cargar_resumen_cuenta(identificador, datos))
+
+async def _cargar_resumen_cuenta(identificador: str, datos: dict | None) -> dict:
+    if not base_disponible():
+        return {"error": "La conexión a la base de datos no está disponible."}
+
+    try:
+        if datos is not None:
+            if datos.get('error'):
+                return datos
+            return {"cliente": datos.get('cliente'), "resumen": await _fila_resumen(datos.get('contrato'))}
+
+        candidatos = candidatos_identificador(identificador)
+        for tipo, valor in candidatos:
+            ubicacion = indice_identificadores.buscar(tipo, valor)
+            if ubicacion is None:
+                continue
+            identidad = await _resumen_con_identidad(ubicacion.id_contrato)
+            if identidad and _corresponde(tipo, valor, identidad):
+                return {"cliente": identidad['cliente'], "resumen": identidad['resumen']}
+            indice_identificadores.descartar(tipo, valor)
+
+        tipo, valor, (cliente, contrato, medidor) = await _resolver_candidatos(candidatos)
+        if contrato:
+            indice_identificadores.registrar(tipo, valor, Ubicacion(
+                cliente['id_cliente'], contrato['id_contrato'], medidor['id_medidor'] if medidor else None))
+        return {"cliente": cliente, "resumen": await _fila_resumen(contrato)}
+
+    except Exception as e:
+        logger.error(f"Error al obtener el resumen de cuenta: {e}")
+        return {"error": str(e)}
+
+async def _resumen_con_identidad(id_contrato: int) -> dict | None:
+    """Fila de resumen_cuenta de un contrato con su cliente, contrato y medidor, o None si no existe."""
+    if USAR_POSTGRES:
+        return await postgres.resumen_con_identidad(id_contrato)
+    filas = await _ejecutar(get_supabase_client().table('resumen_cuenta').select(_SELECT_RESUMEN).eq('id_contrato', id_contrato), 'resumen_cuenta')
+    if not filas:
+        return None
+    resumen = filas[0]
+    return {"cliente": resumen.pop('clientes'), "contrato": resumen.pop('contratos'), "medidor": resumen.pop('medidores'), "resumen": resumen}
+
+async def _fila_resumen(contrato: dict | None) -> dict | None:
+    if not contrato:
+        return None
+    if USAR_POSTGRES:
+        fila = await postgres.fila_resumen(contrato['id_contrato'])
+    else:
+        filas = await _ejecutar(get_supabase_client().table('resumen_cuenta').select('*').eq('id_contrato', contrato['id_contrato']), 'resumen_cuenta')
+        fila = filas[0] if filas else None
+    return fila or _resumen_desde_facturas([])
+
+def _resumen_desde_facturas(facturas: list) -> dict:
+    """Los campos de resumen_cuenta calculados con las facturas del snapshot (solo las últimas)."""
+    pendientes = sorted((f for f in facturas if f['estado_pago'] == 'Pendiente'), key=lambda f: f['fecha_vencimiento'])
+    vencidas = [f for f in facturas if f['estado_pago'] == 'Vencida']
+    monto_pendiente = round(sum(float(f['monto']) for f in pendientes), 2)
+    monto_vencido = round(sum(float(f['monto']) for f in vencidas), 2)
+    return {
+        "monto_pendiente": monto_pendiente,
+        "facturas_pendientes": len(pendientes),
+        "monto_vencido": monto_vencido,
+        "facturas_vencidas": len(vencidas),
+        "total_adeudado": round(monto_pendiente + monto_vencido, 2),
+        "proximo_vencimiento": pendientes[0]['fecha_vencimiento'] if pendientes else None,
+        "proximo_monto": pendientes[0]['monto'] if pendientes else None,
+        "proximo_periodo": pendientes[0]['periodo'] if pendientes else None,
+    }
+
+async def _cuenta_para_consulta(identificador: str, datos: dict = None) -> dict:
+    """
+    Cliente y resumen de cuenta para las consultas de saldo: de resumen_cuenta
+    si está activada; si no, calculado con las facturas del snapshot.
+    """
+    if USAR_RESUMEN_CUENTA:
+        cuenta = await obtener_resumen_cuenta(identificador, datos)
+        if cuenta.get('error') or not cuenta.get('cliente'):
+            return cuenta
+        return {"cliente": cuenta['cliente'], "resumen": cuenta['resumen'] or _resumen_desde_facturas([])}
+
+    datos = await _datos_para_consulta(identificador, datos)
+    if datos.get('error'):
+        return datos
+    return {"cliente": datos.get('cliente'), "resumen": _resumen_desde_facturas(datos.get('facturas', []))}
+
 # =================== FUNCIONES PARA CONSULTAS RÁPIDAS ===================
+# Todas aceptan opcionalmente el snapshot ya obtenido con buscar_datos_cliente
+# (parámetro ``datos``) para poder calcular varias consultas con una sola búsqueda.
 
-async def consulta_saldo_actual(identificador: str) -> dict:
+async def _datos_para_consulta(identificador: str, datos: dict = None) -> dict:
+    """Usa el snapshot recibido o, si no se pasó ninguno, lo busca por identificador."""
+    if datos is not None:
+        return datos
+    return await buscar_datos_cliente(identificador)
+
+async def consulta_saldo_actual(identificador: str, datos: dict = None) -> dict:
     """Consulta específica para saldo actual del cliente"""
-    if not supabase:
+    if not base_disponible():
         return {"error": "Conexión no disponible"}
     
     try:
-        datos = await buscar_datos_cliente(identificador)
-        if not datos.get('cliente'):
+        cuenta = await _cuenta_para_consulta(identificador, datos)
+        if cuenta.get('error'):
+            return {"error": cuenta['error']}
+        if not cuenta.get('cliente'):
             return {"error": "Cliente no encontrado"}
         
-        facturas_pendientes = [f for f in datos.get('facturas', []) if f['estado_pago'] == 'Pendiente']
-        total_adeudado = sum(f['monto'] for f in facturas_pendientes)
+        resumen = cuenta['resumen']
+        total_adeudado = float(resumen['total_adeudado'])
+        vencidas = f" y {resumen['facturas_vencidas']} vencida(s)" if resumen['facturas_vencidas'] else ""
         
         return {
             "query_type": "saldo_actual",
             "title": "Estado de Cuenta Actual",
             "data": {
-                "cliente": datos['cliente']['nombre'] + " " + datos['cliente']['apellido'],
-                "total_adeudado": float(total_adeudado),
-                "facturas_pendientes": len(facturas_pendientes),
-                "proxima_fecha_vencimiento": facturas_pendientes[0]['fecha_vencimiento'] if facturas_pendientes else None
+                "cliente": cuenta['cliente']['nombre'] + " " + cuenta['cliente']['apellido'],
+                "total_adeudado": total_adeudado,
+                "facturas_pendientes": resumen['facturas_pendientes'],
+                "facturas_vencidas": resumen['facturas_vencidas'],
+                "proxima_fecha_vencimiento": resumen['proximo_vencimiento']
             },
-            "summary": f"Su saldo actual es de ${total_adeudado:.2f} con {len(facturas_pendientes)} factura(s) pendiente(s).",
+            "summary": f"Su saldo actual es de ${total_adeudado:.2f} con {resumen['facturas_pendientes']} factura(s) pendiente(s){vencidas}.",
             "suggestions": ["¿Cómo puedo pagar mi factura?", "¿Dónde puedo pagar?", "¿Hay descuentos disponibles?"]
         }
     except Exception as e:
         return {"error": str(e)}
 
-async def consulta_consumo_actual(identificador: str) -> dict:
+async def consulta_consumo_actual(identificador: str, datos: dict = None) -> dict:
     """Consulta específica para consumo actual"""
     try:
-        datos = await buscar_datos_cliente(identificador)
+        datos = await _datos_para_consulta(identificador, datos)
         if not datos.get('cliente'):
             return {"error": "Cliente no encontrado"}
         
-        consumos = datos.get('consumos', [])
-        consumo_actual = consumos[0] if consumos else None
-        promedio = sum(c['consumo_metros_cubicos'] for c in consumos) / len(consumos) if consumos else 0
+        analisis = analisis_de(datos)
+        actual = analisis.actual if analisis else 0
+        periodo = analisis.periodo_actual if analisis else ""
         
         return {
             "query_type": "consumo_actual",
             "title": "Consumo de Agua Actual",
             "data": {
                 "cliente": datos['cliente']['nombre'] + " " + datos['cliente']['apellido'],
-                "consumo_actual": consumo_actual['consumo_metros_cubicos'] if consumo_actual else 0,
-                "periodo": consumo_actual['periodo'] if consumo_actual else "",
-                "promedio_6_meses": round(promedio, 2),
-                "diferencia_promedio": round((consumo_actual['consumo_metros_cubicos'] - promedio) if consumo_actual else 0, 2)
+                "consumo_actual": actual,
+                "periodo": periodo,
+                "promedio_6_meses": round(analisis.promedio_6, 2) if analisis else 0,
+                "diferencia_promedio": round(actual - analisis.promedio_6, 2) if analisis else 0
             },
-            "summary": f"Su consumo en {consumo_actual['periodo'] if consumo_actual else 'el periodo actual'} es de {consumo_actual['consumo_metros_cubicos'] if consumo_actual else 0} m³.",
+            "summary": f"Su consumo en {periodo or 'el periodo actual'} es de {actual:g} m³.",
             "suggestions": ["¿Cómo ahorrar agua?", "Comparar con mes anterior", "¿Mi consumo es normal?"]
         }
     except Exception as e:
         return {"error": str(e)}
 
-async def consulta_proxima_factura(identificador: str) -> dict:
+async def consulta_proxima_factura(identificador: str, datos: dict = None) -> dict:
     """Consulta específica para próxima fecha de vencimiento"""
     try:
-        datos = await buscar_datos_cliente(identificador)
-        if not datos.get('cliente'):
+        cuenta = await _cuenta_para_consulta(identificador, datos)
+        if cuenta.get('error'):
+            return {"error": cuenta['error']}
+        if not cuenta.get('cliente'):
             return {"error": "Cliente no encontrado"}
         
-        facturas_pendientes = [f for f in datos.get('facturas', []) if f['estado_pago'] == 'Pendiente']
-        facturas_pendientes.sort(key=lambda x: x['fecha_vencimiento'])
-        proxima_factura = facturas_pendientes[0] if facturas_pendientes else None
+        resumen = cuenta['resumen']
+        fecha = resumen['proximo_vencimiento']
+        monto = float(resumen['proximo_monto']) if fecha else 0
         
         return {
             "query_type": "proxima_factura",
             "title": "Próximo Vencimiento",
             "data": {
-                "cliente": datos['cliente']['nombre'] + " " + datos['cliente']['apellido'],
-                "fecha_vencimiento": proxima_factura['fecha_vencimiento'] if proxima_factura else None,
-                "monto": float(proxima_factura['monto']) if proxima_factura else 0,
-                "periodo": proxima_factura['periodo'] if proxima_factura else "",
+                "cliente": cuenta['cliente']['nombre'] + " " + cuenta['cliente']['apellido'],
+                "fecha_vencimiento": fecha,
+                "monto": monto,
+                "periodo": resumen['proximo_periodo'] if fecha else "",
                 "dias_restantes": "Próximo"  # Se puede implementar cálculo de días
             },
-            "summary": f"Su próxima factura vence el {proxima_factura['fecha_vencimiento'] if proxima_factura else 'N/A'} por ${proxima_factura['monto'] if proxima_factura else 0}.",
+            "summary": f"Su próxima factura vence el {fecha or 'N/A'} por ${monto:g}.",
             "suggestions": ["¿Cómo puedo pagar?", "¿Puedo pagar en línea?", "¿Dónde puedo pagar?"]
         }
     except Exception as e:
         return {"error": str(e)}
 
-async def consulta_informacion_medidor(identificador: str) -> dict:
+async def consulta_informacion_medidor(identificador: str, datos: dict = None) -> dict:
     """Consulta específica para información del medidor"""
     try:
-        datos = await buscar_datos_cliente(identificador)
+        datos = await _datos_para_consulta(identificador, datos)
         if not datos.get('cliente'):
             return {"error": "Cliente no encontrado"}
         
-        medidor = datos.get('medidor', {})
+        medidor = datos.get('medidor') or {}
         
         return {
             "query_type": "informacion_medidor",
@@ -218,7 +694,7 @@ async def consulta_informacion_medidor(identificador: str) -> dict:
                 "cliente": datos['cliente']['nombre'] + " " + datos['cliente']['apellido'],
                 "numero_medidor": medidor.get('numero_medidor', 'N/A'),
                 "ubicacion": medidor.get('ubicacion', 'N/A'),
-                "estado_servicio": datos.get('contrato', {}).get('estado_servicio', 'N/A')
+                "estado_servicio": (datos.get('contrato') or {}).get('estado_servicio', 'N/A')
             },
             "summary": f"Su medidor #{medidor.get('numero_medidor', 'N/A')} está ubicado en {medidor.get('ubicacion', 'ubicación no especificada')}.",
             "suggestions": ["¿Cómo cambiar mi medidor?", "¿Cómo reportar una fuga?", "Estado de mis solicitudes"]
@@ -226,157 +702,159 @@ async def consulta_informacion_medidor(identificador: str) -> dict:
     except Exception as e:
         return {"error": str(e)}
 
-async def consulta_promedio_facturacion(identificador: str) -> dict:
+async def consulta_promedio_facturacion(identificador: str, datos: dict = None) -> dict:
     """Consulta específica para promedio de facturación"""
     try:
-        datos = await buscar_datos_cliente(identificador)
+        datos = await _datos_para_consulta(identificador, datos)
         if not datos.get('cliente'):
             return {"error": "Cliente no encontrado"}
         
-        facturas = datos.get('facturas', [])
-        if not facturas:
+        analisis = analizar_facturas(datos.get('facturas', []))
+        if not analisis:
             return {"error": "No hay facturas disponibles"}
         
-        promedio = sum(f['monto'] for f in facturas) / len(facturas)
-        total_facturas = len(facturas)
+        total_facturas = len(analisis.montos)
         
         return {
             "query_type": "promedio_facturacion",
             "title": "Promedio de Facturación",
             "data": {
                 "cliente": datos['cliente']['nombre'] + " " + datos['cliente']['apellido'],
-                "promedio_mensual": round(promedio, 2),
+                "promedio_mensual": round(analisis.promedio, 2),
                 "total_facturas": total_facturas,
-                "monto_total": round(sum(f['monto'] for f in facturas), 2)
+                "monto_total": round(analisis.total, 2)
             },
-            "summary": f"Su promedio de facturación mensual es de ${promedio:.2f} basado en {total_facturas} facturas.",
+            "summary": f"Su promedio de facturación mensual es de ${analisis.promedio:.2f} basado en {total_facturas} facturas.",
             "suggestions": ["Ver detalles de facturas", "¿Cómo reducir mi consumo?", "Historial de pagos"]
         }
     except Exception as e:
         return {"error": str(e)}
 
-async def consulta_facturas_vencidas(identificador: str) -> dict:
+async def consulta_facturas_vencidas(identificador: str, datos: dict = None) -> dict:
     """Consulta específica para facturas vencidas"""
     try:
-        datos = await buscar_datos_cliente(identificador)
-        if not datos.get('cliente'):
+        cuenta = await _cuenta_para_consulta(identificador, datos)
+        if cuenta.get('error'):
+            return {"error": cuenta['error']}
+        if not cuenta.get('cliente'):
             return {"error": "Cliente no encontrado"}
         
-        facturas_vencidas = [f for f in datos.get('facturas', []) if f['estado_pago'] == 'Vencida']
-        total_vencido = sum(f['monto'] for f in facturas_vencidas)
+        facturas_vencidas = cuenta['resumen']['facturas_vencidas']
+        total_vencido = float(cuenta['resumen']['monto_vencido'])
         
         return {
             "query_type": "facturas_vencidas",
             "title": "Facturas Vencidas",
             "data": {
-                "cliente": datos['cliente']['nombre'] + " " + datos['cliente']['apellido'],
-                "facturas_vencidas": len(facturas_vencidas),
-                "monto_total_vencido": float(total_vencido),
+                "cliente": cuenta['cliente']['nombre'] + " " + cuenta['cliente']['apellido'],
+                "facturas_vencidas": facturas_vencidas,
+                "monto_total_vencido": total_vencido,
                 "estado": "Vencidas" if facturas_vencidas else "Al día"
             },
-            "summary": f"Tiene {len(facturas_vencidas)} factura(s) vencida(s) por un total de ${total_vencido:.2f}." if facturas_vencidas else "¡Excelente! No tiene facturas vencidas.",
+            "summary": f"Tiene {facturas_vencidas} factura(s) vencida(s) por un total de ${total_vencido:.2f}." if facturas_vencidas else "¡Excelente! No tiene facturas vencidas.",
             "suggestions": ["¿Cómo puedo pagar?", "Plan de pagos", "Evitar recargos"] if facturas_vencidas else ["Mantener al día", "Configurar recordatorios"]
         }
     except Exception as e:
         return {"error": str(e)}
 
-async def consulta_promedio_consumo(identificador: str) -> dict:
+async def consulta_promedio_consumo(identificador: str, datos: dict = None) -> dict:
     """Consulta específica para promedio de consumo"""
     try:
-        datos = await buscar_datos_cliente(identificador)
+        datos = await _datos_para_consulta(identificador, datos)
         if not datos.get('cliente'):
             return {"error": "Cliente no encontrado"}
         
-        consumos = datos.get('consumos', [])
-        if not consumos:
+        analisis = analisis_de(datos)
+        if not analisis:
             return {"error": "No hay datos de consumo disponibles"}
         
-        promedio = sum(c['consumo_metros_cubicos'] for c in consumos) / len(consumos)
+        anual = f" y de {analisis.media_movil_12:.2f} m³ en los últimos 12" if analisis.media_movil_12 is not None else ""
         
         return {
             "query_type": "promedio_consumo",
             "title": "Promedio de Consumo",
             "data": {
                 "cliente": datos['cliente']['nombre'] + " " + datos['cliente']['apellido'],
-                "promedio_6_meses": round(promedio, 2),
-                "total_periodos": len(consumos),
-                "consumo_minimo": min(c['consumo_metros_cubicos'] for c in consumos),
-                "consumo_maximo": max(c['consumo_metros_cubicos'] for c in consumos)
+                "promedio_6_meses": round(analisis.promedio_6, 2),
+                "promedio_12_meses": round(analisis.media_movil_12, 2) if analisis.media_movil_12 is not None else None,
+                "total_periodos": analisis.periodos_analizados,
+                "consumo_minimo": analisis.minimo,
+                "consumo_maximo": analisis.maximo
             },
-            "summary": f"Su promedio de consumo es de {promedio:.2f} m³ basado en {len(consumos)} períodos.",
+            "summary": f"Su promedio de consumo es de {analisis.promedio_6:.2f} m³ en los últimos {min(6, analisis.periodos_analizados)} períodos{anual}.",
             "suggestions": ["¿Cómo ahorrar agua?", "Comparar con otros clientes", "Tips de eficiencia"]
         }
     except Exception as e:
         return {"error": str(e)}
 
-async def consulta_comparar_mes_anterior(identificador: str) -> dict:
+async def consulta_comparar_mes_anterior(identificador: str, datos: dict = None) -> dict:
     """Consulta específica para comparar con mes anterior"""
     try:
-        datos = await buscar_datos_cliente(identificador)
+        datos = await _datos_para_consulta(identificador, datos)
         if not datos.get('cliente'):
             return {"error": "Cliente no encontrado"}
         
-        consumos = datos.get('consumos', [])
-        if len(consumos) < 2:
+        analisis = analisis_de(datos)
+        if not analisis or analisis.anterior is None:
             return {"error": "No hay suficientes datos para comparar"}
         
-        actual = consumos[0]['consumo_metros_cubicos']
-        anterior = consumos[1]['consumo_metros_cubicos']
-        diferencia = actual - anterior
-        porcentaje = (diferencia / anterior * 100) if anterior > 0 else 0
+        diferencia = analisis.delta_mensual
+        porcentaje = analisis.delta_porcentual
         
         return {
             "query_type": "comparar_mes_anterior",
             "title": "Comparación con Mes Anterior",
             "data": {
                 "cliente": datos['cliente']['nombre'] + " " + datos['cliente']['apellido'],
-                "consumo_actual": actual,
-                "consumo_anterior": anterior,
-                "diferencia": diferencia,
+                "consumo_actual": analisis.actual,
+                "consumo_anterior": analisis.anterior,
+                "diferencia": round(diferencia, 2),
                 "porcentaje_cambio": round(porcentaje, 1)
             },
-            "summary": f"Su consumo {'aumentó' if diferencia > 0 else 'disminuyó'} en {abs(diferencia)} m³ ({abs(porcentaje):.1f}%) respecto al mes anterior.",
+            "summary": f"Su consumo {'aumentó' if diferencia > 0 else 'disminuyó'} en {abs(diferencia):g} m³ ({abs(porcentaje):.1f}%) respecto al mes anterior.",
             "suggestions": ["¿Por qué cambió mi consumo?", "Tips para ahorrar", "Revisar fugas"] if diferencia > 0 else ["¡Excelente ahorro!", "Mantener eficiencia"]
         }
     except Exception as e:
         return {"error": str(e)}
 
-async def consulta_consumo_normal(identificador: str) -> dict:
+async def consulta_consumo_normal(identificador: str, datos: dict = None) -> dict:
     """Consulta específica para verificar si el consumo es normal"""
     try:
-        datos = await buscar_datos_cliente(identificador)
+        datos = await _datos_para_consulta(identificador, datos)
         if not datos.get('cliente'):
             return {"error": "Cliente no encontrado"}
         
-        consumos = datos.get('consumos', [])
-        if not consumos:
+        analisis = analisis_de(datos)
+        if not analisis:
             return {"error": "No hay datos de consumo disponibles"}
         
-        actual = consumos[0]['consumo_metros_cubicos']
-        promedio = sum(c['consumo_metros_cubicos'] for c in consumos) / len(consumos)
-        desviacion = abs(actual - promedio)
-        es_normal = desviacion <= (promedio * 0.3)  # 30% de tolerancia
+        # Referencia: el mismo mes en años anteriores si lo hay; si no, el promedio reciente
+        referencia = analisis.linea_base_estacional if analisis.linea_base_estacional is not None else analisis.promedio_6
+        es_normal = not analisis.atipico
         
         return {
             "query_type": "consumo_normal",
             "title": "Evaluación de Consumo",
             "data": {
                 "cliente": datos['cliente']['nombre'] + " " + datos['cliente']['apellido'],
-                "consumo_actual": actual,
-                "promedio_historico": round(promedio, 2),
-                "desviacion": round(desviacion, 2),
+                "consumo_actual": analisis.actual,
+                "promedio_historico": round(float(analisis.valores.mean()), 2),
+                "linea_base_estacional": round(analisis.linea_base_estacional, 2) if analisis.linea_base_estacional is not None else None,
+                "desviacion": round(abs(analisis.actual - referencia), 2),
+                "z_score": round(analisis.z_score, 2) if analisis.z_score is not None else None,
                 "evaluacion": "Normal" if es_normal else "Atípico"
             },
-            "summary": f"Su consumo actual {'está dentro del rango normal' if es_normal else 'es atípico comparado con su historial'}.",
+            "summary": "Su consumo actual está dentro del rango normal." if es_normal
+                       else f"Su consumo actual es atípico comparado con su historial ({analisis.motivo}).",
             "suggestions": ["Continuar así", "Consejos de ahorro"] if es_normal else ["Revisar posibles fugas", "Contactar servicio técnico", "Revisar hábitos de consumo"]
         }
     except Exception as e:
         return {"error": str(e)}
 
-async def consulta_estado_solicitudes(identificador: str) -> dict:
+async def consulta_estado_solicitudes(identificador: str, datos: dict = None) -> dict:
     """Consulta específica para estado de solicitudes"""
     try:
-        datos = await buscar_datos_cliente(identificador)
+        datos = await _datos_para_consulta(identificador, datos)
         if not datos.get('cliente'):
             return {"error": "Cliente no encontrado"}
         
@@ -401,96 +879,32 @@ async def consulta_estado_solicitudes(identificador: str) -> dict:
     except Exception as e:
         return {"error": str(e)}
 
-# Funciones informativas (no requieren datos específicos del cliente)
-async def consulta_reportar_fuga(identificador: str) -> dict:
+# Funciones informativas (no requieren datos específicos del cliente).
+# Sus respuestas viven en app/data/consultas_informativas.json y se sirven
+# desde el catálogo ya validado y serializado (ver services/catalogo.py).
+async def consulta_reportar_fuga(identificador: str, datos: dict = None) -> dict:
     """Información sobre cómo reportar una fuga"""
-    return {
-        "query_type": "reportar_fuga",
-        "title": "¿Cómo Reportar una Fuga?",
-        "data": {
-            "telefono_emergencia": "(05)262-1300 ext.3",
-            "horario_atencion": "24 horas",
-            "tiempo_respuesta": "2-4 horas",
-            "documentos_necesarios": "Ninguno para emergencias"
-        },
-        "summary": "Para reportar una fuga, llame al (05)262-1300 ext.3. Atendemos 24 horas y respondemos en 2-4 horas.",
-        "suggestions": ["Cerrar llave de paso", "Tomar fotos del problema", "Estar disponible para la visita"]
-    }
+    return obtener_entrada("reportar_fuga").datos
 
-async def consulta_cambiar_medidor(identificador: str) -> dict:
+async def consulta_cambiar_medidor(identificador: str, datos: dict = None) -> dict:
     """Información sobre cambio de medidor"""
-    return {
-        "query_type": "cambiar_medidor",
-        "title": "¿Cómo Cambiar mi Medidor?",
-        "data": {
-            "proceso": "Solicitud → Inspección → Instalación",
-            "tiempo_estimado": "7-15 días hábiles",
-            "costo": "Varía según el tipo de medidor",
-            "documentos_requeridos": "Cédula, contrato de servicio"
-        },
-        "summary": "El cambio de medidor toma 7-15 días hábiles. Debe presentar cédula y contrato de servicio.",
-        "suggestions": ["Agendar inspección", "Tipos de medidores disponibles", "Costos del servicio"]
-    }
+    return obtener_entrada("cambiar_medidor").datos
 
-async def consulta_como_pagar(identificador: str) -> dict:
+async def consulta_como_pagar(identificador: str, datos: dict = None) -> dict:
     """Información sobre métodos de pago"""
-    return {
-        "query_type": "como_pagar",
-        "title": "¿Cómo Puedo Pagar mi Factura?",
-        "data": {
-            "metodos_disponibles": "Efectivo, tarjeta, transferencia, online",
-            "comision_online": "Sin comisión",
-            "fecha_limite": "Hasta la fecha de vencimiento",
-            "recargo_mora": "5% después del vencimiento"
-        },
-        "summary": "Puede pagar en efectivo, con tarjeta, transferencia o en línea sin comisión hasta la fecha de vencimiento.",
-        "suggestions": ["Pagar en línea", "Ubicaciones de pago", "Configurar pago automático"]
-    }
+    return obtener_entrada("como_pagar").datos
 
-async def consulta_donde_pagar(identificador: str) -> dict:
+async def consulta_donde_pagar(identificador: str, datos: dict = None) -> dict:
     """Información sobre lugares de pago"""
-    return {
-        "query_type": "donde_pagar",
-        "title": "¿Dónde Puedo Pagar?",
-        "data": {
-            "oficinas_principales": "Centro de Manta Epam",
-            "bancos_afiliados": "Banco Pacifico, Banco guayaquil",
-            "supermercados": "Megamaxi, Farmacias cruz azul",
-            "horarios": "Lunes a viernes 8:00-17:00"
-        },
-        "summary": "Puede pagar en nuestras oficinas, bancos afiliados o supermercados de lunes a viernes de 8:00 a 17:00.",
-        "suggestions": ["Oficina más cercana", "Pago en línea 24/7", "App móvil"]
-    }
+    return obtener_entrada("donde_pagar").datos
 
-async def consulta_pago_online(identificador: str) -> dict:
+async def consulta_pago_online(identificador: str, datos: dict = None) -> dict:
     """Información sobre pago en línea"""
-    return {
-        "query_type": "pago_online",
-        "title": "¿Puedo Pagar en Línea?",
-        "data": {
-            "disponibilidad": "24 horas, 7 días",
-            "metodos_aceptados": "Tarjetas de crédito/débito",
-            "comision": "Sin comisión",
-            "confirmacion": "Inmediata por email y SMS"
-        },
-        "summary": "Sí, puede pagar en línea 24/7 con tarjetas, sin comisión y con confirmación inmediata.",
-        "suggestions": ["Acceder al portal de pagos", "Descargar app móvil", "Registrarse para pago automático"]
-    }
+    return obtener_entrada("pago_online").datos
 
-async def consulta_descuentos(identificador: str) -> dict:
+async def consulta_descuentos(identificador: str, datos: dict = None) -> dict:
     """Información sobre descuentos disponibles"""
-    return {
-        "query_type": "descuentos",
-        "title": "¿Hay Descuentos Disponibles?",
-        "data": {
-            "descuento_puntual": "5% por pago antes del vencimiento",
-            "descuento_tercera_edad": "10% para mayores de 65 años",
-            "descuento_estudiantes": "10% para estudiantes universitarios",
-            "programa_lealtad": "Puntos por pagos puntuales"
-        },
-        "summary": "Ofrecemos descuentos del 5% por pago puntual, 10% tercera edad y 10% estudiantes universitarios.",
-        "suggestions": ["Aplicar descuento tercera edad", "Verificar elegibilidad estudiantes", "Programa de lealtad"]
-    }
+    return obtener_entrada("descuentos").datos
 
 # Mapeo de consultas rápidas
 CONSULTAS_RAPIDAS = {
@@ -510,4 +924,7 @@ CONSULTAS_RAPIDAS = {
     "donde_pagar": consulta_donde_pagar,
     "pago_online": consulta_pago_online,
     "descuentos": consulta_descuentos,
-}
\ No newline at end of file
+}
+
+# Consultas que no dependen de los datos del cliente (servidas desde el catálogo)
+CONSULTAS_INFORMATIVAS = {"reportar_fuga", "cambiar_medidor", "como_pagar", "donde_pagar", "pago_online", "descuentos"}
@@ -0,0 +1,124 @@
+import asyncio
+import hashlib
+from typing import AsyncIterator, Callable, Hashable
+
+def huella_prompt(modelo: str, prompt: str) -> str:
+    """Identifica una generación: el mismo modelo con el mismo prompt produce la misma respuesta."""
+    return hashlib.sha256(f"{modelo}\n{prompt}".encode("utf-8")).hexdigest()
+
+class GeneracionCompartida:
+    """
+    Una generación del LLM en curso y los eventos que lleva producidos.
+
+    Los eventos se consumen en una tarea propia y se guardan en orden, así
+    cada suscriptor lee desde el principio: quien se une tarde recibe primero
+    los tokens ya generados y después los nuevos, a medida que llegan. La
+    generación sigue mientras quede algún suscriptor; cuando se va el último,
+    se cancela (y el turno del planificador queda libre).
+    """
+
+    def __init__(self, eventos: AsyncIterator[dict], al_terminar: Callable[["GeneracionCompartida"], None]):
+        self.eventos: list[dict] = []
+        self.terminada = False
+        self.cancelada = False
+        self.error: BaseException | None = None
+        self.suscriptores = 0
+        self._al_terminar = al_terminar
+        self._cambio = asyncio.Event()
+        self._tarea = asyncio.get_running_loop().create_task(self._producir(eventos))
+
+    async def _producir(self, eventos: AsyncIterator[dict]):
+        try:
+            async for evento in eventos:
+                self.eventos.append(evento)
+                self._avisar()
+        except Exception as e:
+            self.error = e  # Se propaga a cada suscriptor
+        finally:
+            self.terminada = True
+            self._avisar()
+            self._al_terminar(self)
+
+    def _avisar(self):
+        self._cambio.set()
+        self._cambio = asyncio.Event()
+
+    @property
+    def abierta(self) -> bool:
+        """Si todavía admite suscriptores nuevos."""
+        return not self.terminada and not self.cancelada
+
+    def suscribir(self) -> AsyncIterator[dict]:
+        """
+        Eventos de la generación desde el primero. El suscriptor cuenta desde
+        ahora (no desde que empieza a iterar), para que la generación no se
+        cancele entre que alguien se une y lee su primer evento.
+        """
+        self.suscriptores += 1
+        return self._leer()
+
+    async def _leer(self) -> AsyncIterator[dict]:
+        leidos = 0
+        try:
+            while True:
+                while leidos < len(self.eventos):
+                    evento = self.eventos[leidos]
+                    leidos += 1
+                    # Al ponerse al día, las posiciones en la cola ya superadas no se repiten
+                    if "posicion_cola" in evento and leidos < len(self.eventos):
+                        continue
+                    yield evento
+                if self.terminada:
+                    if self.error is not None:
+                        raise self.error
+                    return
+                await self._cambio.wait()
+        finally:
+            self.suscriptores -= 1
+            if self.suscriptores == 0 and not self.terminada:
+                self.cancelada = True
+                self._tarea.cancel()
+
+class GeneracionesEnCurso:
+    """
+    Deduplicación de generaciones en vuelo: las peticiones con la misma
+    huella (modelo y prompt completo) que una generación que ya está en
+    marcha se unen a ella en lugar de enviar otra al LLM. Ante una ráfaga de
+    preguntas iguales (p. ej. tras un aviso de corte de agua) el LLM atiende
+    tantas generaciones como prompts distintos haya.
+
+    A diferencia de la caché de respuestas, no guarda nada al terminar: solo
+    comparte lo que se está generando en ese momento.
+    """
+
+    def __init__(self):
+        self._en_curso: dict[Hashable, GeneracionCompartida] = {}
+        self.iniciadas = 0
+        self.unidas = 0
+
+    def suscribir(self, clave: Hashable) -> AsyncIterator[dict] | None:
+        """Eventos de la generación abierta con esa clave, o None si no hay ninguna."""
+        generacion = self._en_curso.get(clave)
+        if generacion is None or not generacion.abierta:
+            return None
+        self.unidas += 1
+        return generacion.suscribir()
+
+    def iniciar(self, clave: Hashable, eventos: AsyncIterator[dict]) -> AsyncIterator[dict]:
+        """Comparte bajo ``clave`` la generación que producirá ``eventos`` y devuelve su primer suscriptor."""
+        generacion = GeneracionCompartida(eventos, lambda g: self._terminar(clave, g))
+        self._en_curso[clave] = generacion
+        self.iniciadas += 1
+        return generacion.suscribir()
+
+    def _terminar(self, clave: Hashable, generacion: GeneracionCompartida):
+        if self._en_curso.get(clave) is generacion:
+            del self._en_curso[clave]
+
+    def estadisticas(self) -> dict:
+        return {
+            "en_curso": len(self._en_curso),
+            "suscriptores": sum(g.suscriptores for g in self._en_curso.values()),
+            "iniciadas": self.iniciadas,
+            "unidas": self.unidas,
+        }
@@ -0,0 +1,88 @@
+import os
+import math
+from typing import Callable
+
+# --- Presupuesto del historial de conversación dentro del prompt ---
+HISTORIAL_PRESUPUESTO_TOKENS = int(os.environ.get("HISTORIAL_PRESUPUESTO_TOKENS", "800"))
+HISTORIAL_TURNOS_RECIENTES = int(os.environ.get("HISTORIAL_TURNOS_RECIENTES", "4"))
+# Qué hacer con los turnos más antiguos: "resumir" (solo sus preguntas) o "descartar"
+HISTORIAL_ANTIGUOS = os.environ.get("HISTORIAL_ANTIGUOS", "resumir").lower()
+
+# Largo máximo de cada pregunta antigua dentro del resumen
+_MAX_CARACTERES_RESUMEN = 120
+
+def estimar_tokens(texto: str) -> int:
+    """
+    Estimación rápida sin tokenizador: ~4 caracteres por token, que es una
+    buena aproximación para texto en español con los tokenizadores de Gemma/Llama.
+    """
+    return math.ceil(len(texto) / 4)
+
+_tokenizador: Callable[[str], int] = estimar_tokens
+
+def registrar_tokenizador(contar: Callable[[str], int]):
+    """
+    Sustituye la estimación por un contador real, por ejemplo:
+    registrar_tokenizador(lambda texto: len(tokenizer.encode(texto))).
+    """
+    global _tokenizador
+    _tokenizador = contar
+
+def contar_tokens(texto: str) -> int:
+    """Cuenta los tokens de un texto con el tokenizador registrado."""
+    return _tokenizador(texto)
+
+def formatear_turno(intercambio) -> str:
+    """Texto de un intercambio tal como aparece en el prompt."""
+    return f"Usuario: {intercambio.pregunta}\nAquaBot: {intercambio.respuesta}\n"
+
+def recortar_historial(historial: list, presupuesto_tokens: int = None, turnos_recientes: int = None) -> tuple[str, list]:
+    """
+    Ajusta el historial a un presupuesto de tokens.
+
+    Conserva textualmente los últimos ``turnos_recientes`` intercambios que
+    quepan en el presupuesto (siempre al menos el último). Con el presupuesto
+    restante resume los turnos anteriores en una lista de sus preguntas, de
+    la más reciente a la más antigua, o los descarta si HISTORIAL_ANTIGUOS
+    es "descartar".
+
+    Devuelve ``(resumen, recientes)``: el texto del resumen (puede ser "") y
+    la lista de intercambios que se incluyen completos.
+    """
+    presupuesto = HISTORIAL_PRESUPUESTO_TOKENS if presupuesto_tokens is None else presupuesto_tokens
+    max_recientes = HISTORIAL_TURNOS_RECIENTES if turnos_recientes is None else turnos_recientes
+    if not historial or presupuesto <= 0:
+        return "", []
+
+    # 1. Turnos recientes completos, del más nuevo al más viejo, mientras quepan
+    recientes = []
+    usados = 0
+    for intercambio in reversed(historial[-max_recientes:] if max_recientes > 0 else []):
+        tokens = contar_tokens(formatear_turno(intercambio))
+        if recientes and usados + tokens > presupuesto:
+            break
+        recientes.append(intercambio)
+        usados += tokens
+    recientes.reverse()
+
+    # 2. Resumen de los turnos anteriores con el presupuesto que sobra
+    antiguos = historial[:len(historial) - len(recientes)]
+    if not antiguos or HISTORIAL_ANTIGUOS == "descartar":
+        return "", recientes
+
+    lineas = []
+    for intercambio in reversed(antiguos):
+        pregunta = " ".join(intercambio.pregunta.split())
+        if len(pregunta) > _MAX_CARACTERES_RESUMEN:
+            pregunta = pregunta[:_MAX_CARACTERES_RESUMEN].rstrip() + "…"
+        linea = f"- {pregunta}\n"
+        tokens = contar_tokens(linea)
+        if usados + tokens > presupuesto:
+            break
+        lineas.append(linea)
+        usados += tokens
+
+    if not lineas:
+        return "", recientes
+    resumen = "Preguntas anteriores del usuario (de la más antigua a la más reciente):\n" + "".join(reversed(lineas))
+    return resumen, recientes
@@ -0,0 +1,167 @@
+import re
+import time
+import asyncio
+import logging
+from dataclasses import dataclass
+from typing import Awaitable, Callable
+
+logger = logging.getLogger(__name__)
+
+# Formatos de identificador que acepta el chat, en orden de prioridad.
+# Un id_cliente tiene como máximo 9 dígitos; con 10 se trata como cédula.
+FORMATOS_IDENTIFICADOR = [
+    ("medidor", re.compile(r"^MED\d+$")),
+    ("factura", re.compile(r"^FAC-?(\d{1,9})$", re.IGNORECASE)),
+    ("cedula", re.compile(r"^\d{10}$")),
+    ("cliente", re.compile(r"^\d{1,9}$")),
+]
+
+def clasificar_identificador(identificador: str) -> tuple[str, str]:
+    """
+    Devuelve el tipo del identificador ('medidor', 'factura', 'cedula' o
+    'cliente') y su valor normalizado: el id_factura de 'FAC-123' (o
+    'fac123'), el id_cliente sin ceros a la izquierda y, para medidores y
+    cédulas, el texto sin espacios alrededor. Es la misma normalización que
+    hace obtener_snapshot_cliente (migracion_snapshot_cliente.sql).
+    """
+    texto = identificador.strip()
+    for tipo, patron in FORMATOS_IDENTIFICADOR:
+        coincidencia = patron.match(texto)
+        if coincidencia:
+            if tipo == "factura":
+                return tipo, str(int(coincidencia.group(1)))
+            if tipo == "cliente":
+                return tipo, str(int(texto))
+            return tipo, texto
+    # Cualquier otro formato se busca como número de medidor, como hacía el backend originalmente
+    return "medidor", texto
+
+def candidatos_identificador(identificador: str) -> list[tuple[str, str]]:
+    """
+    Búsquedas (tipo, valor) que se prueban en orden para un identificador:
+    la de su formato y, si no es ya un medidor, la del número de medidor
+    (hay medidores con números que parecen un id_cliente o una cédula).
+    """
+    tipo, valor = clasificar_identificador(identificador)
+    if tipo == "medidor":
+        return [(tipo, valor)]
+    return [(tipo, valor), ("medidor", identificador.strip())]
+
+@dataclass(frozen=True)
+class Ubicacion:
+    """Filas a las que apunta un identificador."""
+    id_cliente: int
+    id_contrato: int
+    id_medidor: int | None
+
+class IndiceIdentificadores:
+    """
+    Índice en memoria identificador -> (id_cliente, id_contrato, id_medidor)
+    para cargar el snapshot de un cliente sin consultar antes a qué cliente
+    corresponde el identificador.
+
+    - Se calienta de forma perezosa: la primera búsqueda lanza en segundo
+      plano la carga de todos los medidores (con su contrato y la cédula del
+      cliente), por páginas ordenadas por id_medidor.
+    - Se refresca de forma incremental: pasados ``intervalo_refresco``
+      segundos, la siguiente búsqueda carga solo los medidores con un
+      id_medidor mayor que el último visto.
+    - Los identificadores resueltos con una consulta (p. ej. facturas, que no
+      se precargan) se registran al vuelo.
+
+    Una entrada puede quedar desactualizada (p. ej. si cambia el contrato
+    activo de un cliente); quien la use debe comprobar que los datos cargados
+    siguen correspondiendo al identificador y, si no, descartarla.
+    """
+
+    def __init__(self, cargar_pagina: Callable[[int, int], Awaitable[list[dict]]],
+                 max_entradas: int = 200_000, intervalo_refresco: float = 300.0, tamano_pagina: int = 1000):
+        self._cargar_pagina = cargar_pagina
+        self.max_entradas = max_entradas
+        self.intervalo_refresco = intervalo_refresco
+        self.tamano_pagina = tamano_pagina
+        self._ubicaciones: dict[tuple[str, str], Ubicacion] = {}
+        self._ultimo_medidor = 0
+        self._ultimo_refresco = float("-inf")
+        self._tarea: asyncio.Task | None = None
+        self.calentado = False
+        self.hits = 0
+        self.misses = 0
+        self.descartadas = 0
+        self.refrescos = 0
+
+    def buscar(self, tipo: str, valor: str) -> Ubicacion | None:
+        """Ubicación conocida del identificador, o None si hay que consultarla."""
+        self._programar_refresco()
+        ubicacion = self._ubicaciones.get((tipo, valor))
+        if ubicacion is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return ubicacion
+
+    def registrar(self, tipo: str, valor: str, ubicacion: Ubicacion):
+        if (tipo, valor) in self._ubicaciones or len(self._ubicaciones) < self.max_entradas:
+            self._ubicaciones[(tipo, valor)] = ubicacion
+
+    def descartar(self, tipo: str, valor: str):
+        if self._ubicaciones.pop((tipo, valor), None) is not None:
+            self.descartadas += 1
+
+    def _programar_refresco(self):
+        if self._tarea is not None and not self._tarea.done():
+            return
+        if time.monotonic() - self._ultimo_refresco < self.intervalo_refresco:
+            return
+        self._ultimo_refresco = time.monotonic()
+        self._tarea = asyncio.get_running_loop().create_task(self._refrescar())
+
+    async def _refrescar(self):
+        """Carga los medidores nuevos (todos, la primera vez) página a página."""
+        try:
+            while len(self._ubicaciones) < self.max_entradas:
+                filas = await self._cargar_pagina(self._ultimo_medidor, self.tamano_pagina)
+                for fila in filas:
+                    self._indexar_medidor(fila)
+                if filas:
+                    self._ultimo_medidor = filas[-1]["id_medidor"]
+                if len(filas) < self.tamano_pagina:
+                    break
+            self.calentado = True
+            self.refrescos += 1
+        except Exception as e:
+            logger.error(f"Error al refrescar el índice de identificadores: {e}")
+
+    def _indexar_medidor(self, fila: dict):
+        contrato = fila.get("contratos") or {}
+        if not contrato:
+            return
+        ubicacion = Ubicacion(contrato["id_cliente"], fila["id_contrato"], fila["id_medidor"])
+        self.registrar("medidor", fila["numero_medidor"], ubicacion)
+        # El cliente y su cédula apuntan al contrato activo de menor id_contrato, como la
+        # función SQL; los medidores llegan por id_medidor, que no sigue el orden de los contratos
+        if contrato.get("estado_servicio") == "Activo":
+            cedula = (contrato.get("clientes") or {}).get("numero_identificacion_personal")
+            for tipo, valor in (("cliente", str(contrato["id_cliente"])), ("cedula", cedula)):
+                existente = self._ubicaciones.get((tipo, valor))
+                if valor and (existente is None or ubicacion.id_contrato < existente.id_contrato):
+                    self.registrar(tipo, valor, ubicacion)
+
+    async def detener(self):
+        if self._tarea is not None and not self._tarea.done():
+            self._tarea.cancel()
+            try:
+                await self._tarea
+            except asyncio.CancelledError:
+                pass
+
+    def estadisticas(self) -> dict:
+        return {
+            "entradas": len(self._ubicaciones),
+            "max_entradas": self.max_entradas,
+            "calentado": self.calentado,
+            "refrescos": self.refrescos,
+            "hits": self.hits,
+            "misses": self.misses,
+            "descartadas": self.descartadas,
+        }
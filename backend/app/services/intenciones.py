@@ -0,0 +1,179 @@
+import os
+import re
+from dataclasses import dataclass
+from typing import Callable
+
+from .cache_llm import normalizar_pregunta
+from .database import CONSULTAS_RAPIDAS, CONSULTAS_INFORMATIVAS
+
+# --- Configuración del enrutador de intenciones ---
+INTENCIONES_ACTIVADO = os.environ.get("INTENCIONES_ACTIVADO", "true").lower() == "true"
+INTENCIONES_UMBRAL = float(os.environ.get("INTENCIONES_UMBRAL", "0.85"))  # Confianza mínima para saltarse el LLM
+# Las preguntas más largas suelen pedir algo más que el dato (explicaciones, varios temas)
+INTENCIONES_MAX_PALABRAS = int(os.environ.get("INTENCIONES_MAX_PALABRAS", "14"))
+
+# Reglas sobre la pregunta normalizada (minúsculas, sin tildes ni signos; ver normalizar_pregunta).
+# El orden importa solo para desempatar: las reglas más específicas van primero.
+REGLAS_INTENCIONES: list[tuple[str, str]] = [
+    ("consumo_normal", r"\bconsumo (es |esta |parece )?(normal|alto|elevado|raro|atipico|anormal)\b|\bes normal (mi|el) consumo\b"),
+    ("comparar_mes_anterior", r"\b(compar\w*|diferencia)\b.*\bmes (anterior|pasado)\b|\bmes (anterior|pasado)\b.*\bcompar\w*"),
+    ("promedio_consumo", r"\b(promedio|media) de (mi |el )?consumo\b|\bconsumo promedio\b|\bconsumo en promedio\b"),
+    ("promedio_facturacion", r"\b(promedio|media) de (mis |las )?(facturas|facturacion|pagos)\b|\bfacturacion promedio\b|\bpago en promedio\b"),
+    ("facturas_vencidas", r"\bfacturas? vencidas?\b|\bfacturas? atrasadas?\b|\btengo (algo|facturas?) vencid[oa]s?\b"),
+    ("proxima_factura", r"\b(cuando|que dia|que fecha) vence\b|\bproxim[oa] (factura|vencimiento|pago)\b|\bfecha (de |del )?(vencimiento|pago|limite)\b|\bhasta cuando (tengo|puedo) pagar\b"),
+    ("saldo_actual", r"\bcuanto (debo|le debo|adeudo)\b|\b(cual es|ver|consultar|saber|conocer) (mi |el )?(saldo|deuda)\b|\bsaldo (actual|pendiente)\b|^(mi |el )?saldo$|^mi deuda$|\bcuanto (tengo|hay) que pagar\b|\bestado de (mi )?cuenta\b"),
+    ("consumo_actual", r"\bcuant[oa] (agua )?(consumi|gaste|he consumido|he gastado)\b|\bconsumo (actual|de este mes|del (ultimo|este) mes)\b|\bmi consumo$"),
+    ("cambiar_medidor", r"\bcambi\w* (de |el |mi )?medidor\b|\breemplaz\w* (el |mi )?medidor\b"),
+    ("informacion_medidor", r"\b(numero|datos|informacion|detalles) (de |del )?(mi |el )?medidor\b|\bcual es (mi|el) medidor\b|\bque medidor tengo\b|^(mi|el) medidor$"),
+    ("estado_solicitudes", r"\b(estado|como van?|ver|consultar|cuales son) (de )?(mi|mis|las) (solicitud|solicitudes|tramites?)\b|^(mis|las) solicitudes$|^mi (solicitud|tramite)$"),
+    ("reportar_fuga", r"\bfuga\b|\bse (me )?esta (saliendo|botando) el agua\b"),
+    ("pago_online", r"\bpag\w* (en linea|online|por internet|por la web)\b"),
+    ("donde_pagar", r"\bdonde (puedo |se puede |hay que )?pagar\b|\b(lugares|puntos|agencias) de pago\b"),
+    ("como_pagar", r"\bcomo (puedo |se puede |hay que )?pagar\b|\b(formas|metodos|medios) de pago\b"),
+    ("descuentos", r"\bdescuentos?\b|\b(tarifa|tarifas) (social|preferencial)\b"),
+]
+
+# Preguntas que piden razonar sobre los datos, no solo consultarlos: siempre van al LLM
+_PIDE_EXPLICACION = re.compile(r"\b(por que|porque|explica\w*|no entiendo|no estoy de acuerdo|error|mal cobr\w*|cobraron mal)\b")
+# Quejas y averías ("mi medidor no funciona"): el dato guardado no las responde, también van al LLM
+_QUEJA = re.compile(
+    r"\bno (me |nos |lo |la )?(funciona\w*|sirve|marca|registra|gira|anda|aplic\w*|llega\w*|lleg[oa]|atend\w*|respond\w*|resolv\w*|solucion\w*)\b"
+    r"|\b(danad[oa]|rot[oa]|averiad[oa]|descompuest[oa]|fall\w*|problemas?|reclam\w*|quej\w*|mal|incorrect[oa]|equivocad[oa])\b"
+)
+
+_REGLAS = [(query_type, re.compile(patron)) for query_type, patron in REGLAS_INTENCIONES]
+
+@dataclass(frozen=True)
+class Intencion:
+    query_type: str
+    confianza: float
+    fuente: str  # "reglas" o "clasificador"
+
+_clasificador: Callable[[str], tuple[str | None, float]] | None = None
+
+def registrar_clasificador(clasificar: Callable[[str], tuple[str | None, float]] | None):
+    """
+    Añade un clasificador local (p. ej. un modelo pequeño de scikit-learn o
+    fastText) que se consulta cuando las reglas no son concluyentes. Recibe la
+    pregunta normalizada y devuelve ``(query_type, confianza)`` o ``(None, 0)``.
+    """
+    global _clasificador
+    _clasificador = clasificar
+
+def clasificar_intencion(pregunta: str) -> Intencion | None:
+    """
+    Asocia una pregunta libre a una consulta rápida, con una confianza entre 0 y 1.
+
+    Las explicaciones y las quejas nunca se asocian. Las reglas dan confianza
+    alta cuando exactamente una intención coincide en una pregunta corta; si
+    coinciden varias o la pregunta es larga la confianza baja y la pregunta la
+    responde el LLM. Si las reglas no bastan y hay un clasificador
+    registrado, se usa su resultado.
+    """
+    texto = normalizar_pregunta(pregunta)
+    if not texto or _PIDE_EXPLICACION.search(texto) or _QUEJA.search(texto):
+        return None
+
+    # Una coincidencia que se solapa con otra de una regla anterior (más específica)
+    # es parte de la misma frase: "cambiar mi medidor" no es además "mi medidor".
+    coincidencias, tramos = [], []
+    for query_type, regla in _REGLAS:
+        encontrada = regla.search(texto)
+        if encontrada and all(encontrada.end() <= inicio or encontrada.start() >= fin for inicio, fin in tramos):
+            coincidencias.append(query_type)
+            tramos.append(encontrada.span())
+
+    mejor = None
+    if coincidencias:
+        confianza = 0.95 if len(coincidencias) == 1 else 0.5
+        if len(texto.split()) > INTENCIONES_MAX_PALABRAS:
+            confianza = min(confianza, 0.6)
+        mejor = Intencion(coincidencias[0], confianza, "reglas")
+
+    if _clasificador is not None and (mejor is None or mejor.confianza < INTENCIONES_UMBRAL):
+        query_type, confianza = _clasificador(texto)
+        if query_type in CONSULTAS_RAPIDAS and (mejor is None or confianza > mejor.confianza):
+            mejor = Intencion(query_type, confianza, "clasificador")
+
+    return mejor
+
+def requiere_cliente(query_type: str) -> bool:
+    """Las consultas informativas se responden sin datos del cliente."""
+    return query_type not in CONSULTAS_INFORMATIVAS
+
+def renderizar_resultado(resultado: dict) -> str:
+    """Texto de una respuesta estructurada, con el mismo formato que usa el frontend."""
+    detalles = "\n".join(f"• {clave.replace('_', ' ')}: {valor}" for clave, valor in resultado.get("data", {}).items())
+    sugerencias = "\n".join(f"• {s}" for s in resultado.get("suggestions", []))
+    return (
+        f"📋 {resultado['title']}\n\n"
+        f"{resultado['summary']}\n\n"
+        f"📊 Detalles:\n{detalles}\n\n"
+        f"💡 Sugerencias:\n{sugerencias}"
+    )
+
+class EnrutadorIntenciones:
+    """
+    Responde sin el LLM las preguntas que equivalen a una consulta rápida
+    (saldo, vencimiento, medidor, consumo...). Cuenta cuántas preguntas toman
+    el camino rápido y cuántas siguen hacia el LLM.
+    """
+
+    def __init__(self, activado: bool = INTENCIONES_ACTIVADO, umbral: float = INTENCIONES_UMBRAL):
+        self.activado = activado
+        self.umbral = umbral
+        self.directas = 0
+        self.al_llm = 0
+        self.baja_confianza = 0
+        self.sin_datos = 0
+        self.por_intencion: dict[str, int] = {}
+
+    def clasificar(self, pregunta: str) -> Intencion | None:
+        """Intención de la pregunta si supera el umbral de confianza; None si debe ir al LLM."""
+        if not self.activado:
+            return None
+        intencion = clasificar_intencion(pregunta)
+        if intencion is not None and intencion.confianza < self.umbral:
+            self.baja_confianza += 1
+            return None
+        return intencion
+
+    async def responder(self, intencion: Intencion | None, identificador: str, datos: dict) -> dict | None:
+        """
+        Calcula la consulta rápida de la intención sobre el snapshot del
+        cliente y devuelve ``{"respuesta": texto, "query_type": ...}``. Devuelve
+        None (y la pregunta sigue hacia el LLM) si no hay intención o si la
+        consulta no se puede responder con los datos disponibles.
+        """
+        if intencion is None:
+            self.al_llm += 1
+            return None
+        if requiere_cliente(intencion.query_type) and not (datos or {}).get("cliente"):
+            self.sin_datos += 1
+            self.al_llm += 1
+            return None
+
+        resultado = await CONSULTAS_RAPIDAS[intencion.query_type](identificador, datos=datos)
+        if resultado.get("error"):
+            self.sin_datos += 1
+            self.al_llm += 1
+            return None
+
+        self.directas += 1
+        self.por_intencion[intencion.query_type] = self.por_intencion.get(intencion.query_type, 0) + 1
+        return {"respuesta": renderizar_resultado(resultado), "query_type": intencion.query_type}
+
+    def estadisticas(self) -> dict:
+        total = self.directas + self.al_llm
+        return {
+            "activado": self.activado,
+            "umbral": self.umbral,
+            "respuestas_directas": self.directas,
+            "enviadas_al_llm": self.al_llm,
+            "tasa_directas": round(self.directas / total, 3) if total else 0.0,
+            "descartadas_baja_confianza": self.baja_confianza,
+            "descartadas_sin_datos": self.sin_datos,
+            "por_intencion": dict(self.por_intencion),
+        }
+
+enrutador = EnrutadorIntenciones()
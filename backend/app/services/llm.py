@@ -1,23 +1,124 @@
 import os
-import requests
-import json
-from dotenv import load_dotenv
+import time
+import logging
+from contextlib import aclosing
 
-load_dotenv()
+import httpx
+
+from .cache_llm import crear_cache_respuestas
+from .historial import recortar_historial, formatear_turno, contar_tokens
+from .contexto import renderizar_contexto
+from .planificador import planificador, LLMSaturado
+from .backends_llm import BackendOllama, BackendOpenAI, AgrupadorLotes, RespuestaInesperada
+from .generaciones import GeneracionesEnCurso, huella_prompt
+from . import metricas
+
+logger = logging.getLogger(__name__)
+
+# Servidor de LLM: "ollama" o "openai" (cualquier servidor compatible con la API
+# de OpenAI, como llama.cpp o vLLM)
+LLM_BACKEND = os.environ.get("LLM_BACKEND", "ollama").lower()
 
 # --- Configuración para Ollama (local) ---
-OLLAMA_API_URL = "http://localhost:11434/api/generate"  # Usaremos /api/generate
+OLLAMA_BASE_URL = os.environ.get("OLLAMA_BASE_URL", "http://localhost:11434")
+OLLAMA_MODEL = os.environ.get("OLLAMA_MODEL", "gemma3:latest")  # ej: "tinyllama", "gemma:2b"
+# Tiempo que Ollama mantiene el modelo (y su caché KV del último prompt) en memoria
+OLLAMA_KEEP_ALIVE = os.environ.get("OLLAMA_KEEP_ALIVE", "30m")
+
+# --- Configuración para un servidor compatible con OpenAI ---
+OPENAI_BASE_URL = os.environ.get("OPENAI_BASE_URL", "http://localhost:8080")  # Puerto por defecto de llama-server
+OPENAI_MODEL = os.environ.get("OPENAI_MODEL", OLLAMA_MODEL)
+OPENAI_API_KEY = os.environ.get("OPENAI_API_KEY", "")
+OPENAI_MAX_TOKENS = int(os.environ.get("OPENAI_MAX_TOKENS", "512"))
+
+# Pool de conexiones keep-alive compartido por todas las peticiones del proceso
+OLLAMA_POOL_SIZE = int(os.environ.get("OLLAMA_POOL_SIZE", "10"))
+OLLAMA_CONNECT_TIMEOUT = float(os.environ.get("OLLAMA_CONNECT_TIMEOUT", "5"))
+OLLAMA_READ_TIMEOUT = float(os.environ.get("OLLAMA_READ_TIMEOUT", "60"))  # Máximo entre fragmentos
+
+# Micro-lotes: agrupar las peticiones no-streaming simultáneas en una sola (si el servidor lo admite)
+LLM_MICROLOTES = os.environ.get("LLM_MICROLOTES", "false").lower() == "true"
+LLM_LOTE_MAX = int(os.environ.get("LLM_LOTE_MAX", "8"))
+LLM_LOTE_ESPERA_MS = float(os.environ.get("LLM_LOTE_ESPERA_MS", "10"))
+
+# Las peticiones con el mismo prompt que una generación en curso se unen a ella (ver generaciones.py)
+LLM_COMPARTIR_GENERACIONES = os.environ.get("LLM_COMPARTIR_GENERACIONES", "true").lower() == "true"
+
+def crear_backend():
+    """Instancia el servidor de LLM configurado en LLM_BACKEND."""
+    conexion = {"pool": OLLAMA_POOL_SIZE, "connect_timeout": OLLAMA_CONNECT_TIMEOUT, "read_timeout": OLLAMA_READ_TIMEOUT}
+    if LLM_BACKEND == "ollama":
+        return BackendOllama(OLLAMA_BASE_URL, OLLAMA_MODEL, keep_alive=OLLAMA_KEEP_ALIVE, **conexion)
+    if LLM_BACKEND == "openai":
+        return BackendOpenAI(OPENAI_BASE_URL, OPENAI_MODEL, api_key=OPENAI_API_KEY, max_tokens=OPENAI_MAX_TOKENS, **conexion)
+    raise ValueError(f"LLM_BACKEND desconocido: {LLM_BACKEND} (use 'ollama' u 'openai')")
+
+backend_llm = crear_backend()
+MODELO_LLM = backend_llm.modelo  # Etiqueta del modelo en el planificador y en las métricas
+
+# Cada lote ocupa un solo turno del planificador (no uno por prompt)
+agrupador = (
+    AgrupadorLotes(backend_llm.generar_lote, LLM_LOTE_MAX, LLM_LOTE_ESPERA_MS / 1000,
+                   turno=lambda: planificador.turno(MODELO_LLM))
+    if LLM_MICROLOTES and backend_llm.soporta_lotes else None
+)
+
+# Caché de respuestas del LLM (memoria, SQLite o desactivada; ver cache_llm.py)
+cache_respuestas = crear_cache_respuestas()
+
+generaciones = GeneracionesEnCurso() if LLM_COMPARTIR_GENERACIONES else None
+
+def get_llm_client() -> httpx.AsyncClient:
+    """
+    Devuelve el cliente HTTP asíncrono hacia el servidor del LLM, creándolo la
+    primera vez. Se reutiliza durante toda la vida de la aplicación para
+    aprovechar el pool.
+    """
+    return backend_llm.cliente()
+
+async def cerrar_llm_client():
+    """Cierra el pool de conexiones hacia el LLM (al apagar la aplicación)."""
+    await backend_llm.cerrar()
+
+# Instrucciones fijas del asistente: van primero para que todas las peticiones
+# compartan el mismo prefijo y Ollama pueda reutilizar su caché KV.
+INSTRUCCIONES_SISTEMA = (
+    "Eres un asistente virtual de atención al cliente para una empresa de agua potable. "
+    "Tu nombre es AquaBot. Eres amable, servicial y muy preciso. "
+    "Usa SOLAMENTE la información proporcionada y el historial de la conversación para responder a la pregunta del cliente. "
+    "No inventes información. Si la respuesta no está en los datos, indica amablemente que no tienes esa información. "
+    "Dirígete al cliente por su nombre de pila (si está disponible). Responde en español.\n\n"
+    "Organiza los datos de manera legible y clara, como texto plano.\n"
+    "Las tablas de datos tienen una fila por línea con las columnas separadas por '|'; los montos están en dólares.\n\n"
+)
 
 def construir_prompt(pregunta_usuario: str, datos_cliente: dict, historial: list = None) -> str:
+    """Construye el prompt (ver _componer_prompt) y registra su duración y tamaño."""
+    inicio = time.perf_counter()
+    prompt = _componer_prompt(pregunta_usuario, datos_cliente, historial)
+    metricas.prompt_construccion_segundos.observar(time.perf_counter() - inicio)
+    metricas.prompt_caracteres.observar(len(prompt))
+    metricas.prompt_tokens.observar(contar_tokens(prompt))
+    return prompt
+
+def _componer_prompt(pregunta_usuario: str, datos_cliente: dict, historial: list = None) -> str:
     """
     Construye el prompt para enviar a la API de Ollama, incluyendo el historial.
+
+    Las partes van de la más estable a la más variable (instrucciones, datos del
+    cliente, historial y pregunta) para maximizar el prefijo que Ollama puede
+    reutilizar entre turnos de una misma conversación.
+    El historial se ajusta al presupuesto de tokens configurado (ver historial.py):
+    los últimos turnos van completos y los anteriores se resumen o se descartan.
     """
     # 1. Construir el historial de la conversación
     historial_str = ""
     if historial:
-        for intercambio in historial:
-            historial_str += f"Usuario: {intercambio.pregunta}\n"
-            historial_str += f"AquaBot: {intercambio.respuesta}\n"
+        resumen, recientes = recortar_historial(historial)
+        if resumen:
+            historial_str += f"{resumen}\n"
+        for intercambio in recientes:
+            historial_str += formatear_turno(intercambio)
         historial_str += "\n"
 
 
@@ -29,76 +130,255 @@ def construir_prompt(pregunta_usuario: str, datos_cliente: dict, historial: list
             f"su número de cliente, número de medidor o número de factura. La pregunta original del usuario fue: '{pregunta_usuario}'"
         )
 
-    contexto_str = json.dumps(datos_cliente, indent=2, default=str)
+    contexto_str = renderizar_contexto(datos_cliente)
     
     prompt = (
-        f"Eres un asistente virtual de atención al cliente para una empresa de agua potable. "
-        f"Tu nombre es AquaBot. Eres amable, servicial y muy preciso. "
-        f"Usa SOLAMENTE la información proporcionada y el historial de la conversación para responder a la pregunta del cliente. "
-        f"No inventes información. Si la respuesta no está en los datos, indica amablemente que no tienes esa información. "
-        f"Dirígete al cliente por su nombre de pila (si está disponible). Responde en español.\n\n"
-        f"Los datos devueltos deben estar organizados de manera legible y clara\n\n"
-        f"si la respuesta de la base de datos es un json,transformalo y organizalo como texto plano para que se muestre de manera legible.\n\n"
+        f"{INSTRUCCIONES_SISTEMA}"
+        f"--- INICIO DE DATOS DEL CLIENTE ---\n"
+        f"{contexto_str}"
+        f"--- FIN DE DATOS DEL CLIENTE ---\n\n"
         f"--- INICIO HISTORIAL DE CONVERSACIÓN ---\n"
         f"{historial_str}"
         f"--- FIN HISTORIAL DE CONVERSACIÓN ---\n\n"
-        f"--- INICIO DE DATOS DEL CLIENTE ---\n"
-        f"{contexto_str}\n"
-        f"--- FIN DE DATOS DEL CLIENTE ---\n\n"
         f"Pregunta actual: {pregunta_usuario}\n"
         f"Respuesta:"
     )
 
     return prompt
 
-def verificar_ollama_activo() -> dict:
+async def verificar_llm_activo() -> dict:
     """
-    Verifica si el servidor de Ollama está activo y responde en el endpoint raíz.
+    Verifica si el servidor del LLM está activo y responde.
     """
-    try:
-        # Hacemos una petición GET a la raíz del servidor Ollama. Debería responder.
-        response = requests.get("http://localhost:11434/", timeout=5)
-        response.raise_for_status()
-        return {"status": "activo", "message": response.text}
-    except requests.exceptions.RequestException as e:
-        return {"status": "inactivo", "error": str(e)}
+    return await backend_llm.verificar()
 
-def generar_respuesta_llm_ollama(prompt: str) -> str:
+async def precargar_modelo(keep_alive: str = OLLAMA_KEEP_ALIVE) -> dict:
     """
-    Envía el prompt a la API de Ollama local y devuelve la respuesta del modelo.
+    Carga el modelo en memoria sin generar nada y, en Ollama, renueva su
+    keep_alive. Devuelve los segundos que tardó o el error.
     """
-    # URL del endpoint de generación de Ollama
-    API_URL_OLLAMA = "http://localhost:11434/api/generate"
-    
-    # Payload para el endpoint /api/generate
-    payload = {
-        "model": "gemma3:latest", # O el modelo que estés usando, ej: "tinyllama", "gemma:2b"
-        "prompt": prompt,
-        "stream": False # Para recibir la respuesta completa de una vez
-    }
+    return await backend_llm.precargar(keep_alive)
+
+async def modelo_cargado() -> bool:
+    """Si el modelo está en memoria en el servidor del LLM (no lo carga)."""
+    return await backend_llm.modelo_cargado()
+
+async def generar_respuesta_llm(prompt: str) -> str:
+    """
+    Envía el prompt al servidor del LLM y devuelve la respuesta del modelo.
+    """
+    resultado = await generar_resultado_llm(prompt)
+    return resultado["respuesta"]
+
+async def generar_resultado_llm(prompt: str) -> dict:
+    """
+    Igual que generar_respuesta_llm, pero devuelve un diccionario con la
+    respuesta y ``error=True`` cuando el texto es un mensaje de error (para
+    no cachearlo, por ejemplo).
 
+    Si ya se está generando la respuesta de este mismo prompt (en streaming
+    o no), espera a esa generación en lugar de iniciar otra.
+    """
+    if generaciones is None:
+        return await _generar_con_turno(prompt)
+
+    final = {}
+    async with aclosing(_eventos_compartidos(prompt, "completa")) as eventos:
+        async for evento in eventos:
+            if evento.get("done"):
+                final = evento
+    if "retry_after" in final:
+        # Unida a una generación en streaming que no consiguió turno: 503 como sin compartir
+        raise LLMSaturado(final["respuesta"], final["retry_after"])
+    resultado = {"respuesta": final["respuesta"], "prompt_tokens": final.get("prompt_tokens", final.get("estadisticas", {}).get("prompt_tokens"))}
+    if final.get("error"):
+        resultado["error"] = True
+    return resultado
+
+async def _generacion_completa(prompt: str):
+    """La generación no-streaming como un único evento final, con la forma del último del stream."""
+    resultado = await _generar_con_turno(prompt)
+    yield {"done": True, **resultado}
+
+def _eventos_compartidos(prompt: str, modo: str):
+    """
+    Eventos de la generación en curso de este prompt o, si no hay ninguna, de
+    una nueva (``modo`` "stream" o "completa"); antes de iniciarla se comprueba
+    la admisión en el planificador (LLMSaturado). Una petición completa puede
+    esperar a una generación en streaming; al revés no, porque no recibiría
+    los tokens a medida que se generan.
+    """
+    huella = huella_prompt(MODELO_LLM, prompt)
+    for tipo in ("stream", "completa") if modo == "completa" else ("stream",):
+        eventos = generaciones.suscribir((tipo, huella))
+        if eventos is not None:
+            metricas.llm_generaciones_compartidas_total.incrementar(modelo=MODELO_LLM, modo=modo)
+            return eventos
+    # Unirse no consume turno; solo una generación nueva pasa por la admisión
+    planificador.verificar_admision(MODELO_LLM)
+    crear = _generar_stream if modo == "stream" else _generacion_completa
+    return generaciones.iniciar((modo, huella), crear(prompt))
+
+async def _generar_con_turno(prompt: str) -> dict:
+    """
+    Generación no-streaming en cuanto haya un turno libre del modelo; si no lo
+    hay a tiempo, LLMSaturado llega al llamador. Con micro-lotes el turno lo
+    pide el agrupador para todo el lote.
+    """
+    if agrupador is not None:
+        return await _generar(prompt)
+    async with planificador.turno(MODELO_LLM):
+        return await _generar(prompt)
+
+async def _generar(prompt: str) -> dict:
+    """Generación no-streaming (con el turno del planificador ya concedido o a cargo del agrupador)."""
     try:
-        # Usamos requests.post para enviar la solicitud
-        response = requests.post(API_URL_OLLAMA, json=payload, timeout=60)
-        response.raise_for_status() # Lanza un error si la petición falla (ej. 404, 500)
-        
-        # Parseamos la respuesta JSON
-        resultado = response.json()
-        
-        # La respuesta de /api/generate está en la clave 'response'
-        if 'response' in resultado:
-            return resultado['response'].strip()
+        inicio = time.perf_counter()
+        if agrupador is not None:
+            resultado = await agrupador.generar(prompt)
         else:
-            # Esto podría pasar si hay un error en el formato de respuesta de Ollama
-            print(f"Respuesta inesperada de Ollama: {resultado}")
-            return "Lo siento, recibí una respuesta inesperada del servicio de IA."
+            resultado = await backend_llm.generar(prompt)
+        _registrar_metricas_generacion(resultado, "completa", time.perf_counter() - inicio)
+        return {"respuesta": resultado["texto"].strip(), "prompt_tokens": resultado.get("prompt_tokens")}
 
-    except requests.exceptions.RequestException as e:
+    except LLMSaturado:
+        raise  # El lote no consiguió turno: el llamador responde 503
+    except RespuestaInesperada as e:
+        # Esto podría pasar si hay un error en el formato de respuesta del servidor
+        logger.warning(f"Respuesta inesperada del LLM: {e}")
+        return {"respuesta": "Lo siento, recibí una respuesta inesperada del servicio de IA.", "error": True}
+    except httpx.HTTPError as e:
         # Captura errores de conexión, timeout, etc.
-        print(f"Error al contactar la API de Ollama: {e}")
+        logger.error(f"Error al contactar el servidor del LLM ({backend_llm.nombre}): {e}")
         # Devuelve un mensaje de error claro para el frontend
-        return f"Error en la comunicación con el servicio local de IA. Detalles: {e}"
+        return {"respuesta": f"Error en la comunicación con el servicio local de IA. Detalles: {e}", "error": True}
     except Exception as e:
         # Captura cualquier otro error inesperado
-        print(f"Error inesperado en la generación de respuesta con Ollama: {e}")
-        return "Ha ocurrido un error inesperado al procesar tu solicitud con el servicio local."
+        logger.error(f"Error inesperado en la generación de respuesta ({backend_llm.nombre}): {e}")
+        return {"respuesta": "Ha ocurrido un error inesperado al procesar tu solicitud con el servicio local.", "error": True}
+
+
+async def generar_respuesta_llm_stream(prompt: str):
+    """
+    Envía el prompt al servidor del LLM en modo streaming y va devolviendo los
+    fragmentos de texto a medida que el modelo los genera.
+
+    Produce diccionarios ``{"token": "..."}`` por cada fragmento y, al final,
+    un único ``{"done": True, "respuesta": ..., "estadisticas": {...}}`` con la
+    respuesta completa y los tiempos de la generación.
+
+    Mientras el modelo está ocupado produce ``{"posicion_cola": n}`` cada vez
+    que cambia la posición en la cola del planificador. Si el consumidor deja
+    de iterar (el cliente se desconectó), se abandona la cola o se corta la
+    generación y el turno queda libre para la siguiente petición.
+
+    Si ya se está generando este mismo prompt, se une a esa generación:
+    recibe primero los tokens ya generados y después los nuevos. La
+    generación solo se corta cuando se desconectan todos los que la esperan.
+    """
+    if generaciones is None:
+        eventos = _generar_stream(prompt)
+    else:
+        try:
+            eventos = _eventos_compartidos(prompt, "stream")
+        except LLMSaturado as e:
+            yield _evento_saturado(e)
+            return
+
+    async with aclosing(eventos):
+        try:
+            async for evento in eventos:
+                yield evento
+        except LLMSaturado as e:
+            # Unida a una generación no-streaming que no consiguió turno
+            yield _evento_saturado(e)
+
+def _evento_saturado(e: LLMSaturado) -> dict:
+    return {
+        "done": True,
+        "error": True,
+        "respuesta": "El servicio de IA está atendiendo muchas consultas. Por favor, inténtalo de nuevo en unos segundos.",
+        "retry_after": e.retry_after,
+    }
+
+async def _generar_stream(prompt: str):
+    """Generación en streaming (ver generar_respuesta_llm_stream): espera su turno y reenvía los fragmentos."""
+    primer_token = None
+    partes = []
+    turno = None
+
+    try:
+        llegada = time.perf_counter()
+        turno = planificador.solicitar(MODELO_LLM)
+        async for posicion in turno.esperar(planificador.plazo):
+            yield {"posicion_cola": posicion}
+        inicio = time.perf_counter()  # Los tiempos de generación no incluyen la espera en la cola
+
+        async for evento in backend_llm.generar_stream(prompt):
+            if evento.get("token"):
+                if primer_token is None:
+                    primer_token = time.perf_counter()
+                partes.append(evento["token"])
+                yield {"token": evento["token"]}
+
+            if evento.get("fin"):
+                fin = time.perf_counter()
+                _registrar_metricas_generacion(evento, "stream", fin - inicio, primer_token and primer_token - inicio)
+                yield {
+                    "done": True,
+                    "respuesta": "".join(partes).strip(),
+                    "estadisticas": {
+                        **_estadisticas_generacion(evento, inicio, primer_token, fin),
+                        "espera_cola_ms": round((inicio - llegada) * 1000, 1),
+                    },
+                }
+                return
+
+        # El servidor cerró la conexión sin enviar el fragmento final
+        yield {"done": True, "respuesta": "".join(partes).strip(), "estadisticas": {}}
+
+    except LLMSaturado as e:
+        yield _evento_saturado(e)
+    except httpx.HTTPError as e:
+        logger.error(f"Error al contactar el servidor del LLM ({backend_llm.nombre}): {e}")
+        yield {
+            "done": True,
+            "error": True,
+            "respuesta": f"Error en la comunicación con el servicio local de IA. Detalles: {e}",
+        }
+    except Exception as e:
+        logger.error(f"Error inesperado en la generación de respuesta ({backend_llm.nombre}): {e}")
+        yield {
+            "done": True,
+            "error": True,
+            "respuesta": "Ha ocurrido un error inesperado al procesar tu solicitud con el servicio local.",
+        }
+    finally:
+        if turno is not None:
+            turno.liberar()
+
+def _registrar_metricas_generacion(resultado: dict, modo: str, segundos: float, ttft: float | None = None):
+    """Métricas de una generación terminada, con los contadores que informó el servidor."""
+    modelo = MODELO_LLM
+    metricas.llm_generacion_segundos.observar(segundos, modelo=modelo, modo=modo)
+    metricas.llm_ttft_segundos.observar(ttft, modelo=modelo)
+    tokens, evaluacion = resultado.get("tokens_generados"), resultado.get("segundos_evaluacion")
+    if tokens:
+        metricas.llm_tokens_generados.observar(tokens, modelo=modelo)
+        if evaluacion:
+            metricas.llm_tokens_por_segundo.observar(tokens / evaluacion, modelo=modelo)
+
+def _estadisticas_generacion(final: dict, inicio: float, primer_token: float, fin: float) -> dict:
+    """Resume los tiempos medidos y los contadores que el servidor envía al terminar."""
+    tokens = final.get("tokens_generados") or 0
+    # Sin la duración de la generación que da el servidor, se estima desde el primer token
+    evaluacion = final.get("segundos_evaluacion") or (fin - primer_token if primer_token else None)
+
+    return {
+        "ttft_ms": round((primer_token - inicio) * 1000, 1) if primer_token else None,
+        "total_ms": round((fin - inicio) * 1000, 1),
+        "prompt_tokens": final.get("prompt_tokens"),
+        "tokens_generados": tokens,
+        "tokens_por_segundo": round(tokens / evaluacion, 2) if evaluacion else None,
+        "carga_modelo_ms": final.get("carga_modelo_ms"),
+    }
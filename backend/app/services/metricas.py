@@ -0,0 +1,206 @@
+import os
+import sys
+import time
+import uuid
+import bisect
+import logging
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+# --- Configuración de métricas y logs ---
+METRICAS_ACTIVADAS = os.environ.get("METRICAS_ACTIVADAS", "true").lower() == "true"
+LOG_LEVEL = os.environ.get("LOG_LEVEL", "INFO").upper()
+
+# Identificador de la petición en curso; aparece en cada línea de log
+id_correlacion: ContextVar[str] = ContextVar("id_correlacion", default="-")
+
+def nuevo_id_correlacion(recibido: str | None = None) -> str:
+    """Usa el X-Request-ID que envía el cliente (si es razonable) o genera uno nuevo."""
+    if recibido and len(recibido) <= 64 and recibido.isprintable():
+        return recibido
+    return uuid.uuid4().hex[:16]
+
+class _FiltroCorrelacion(logging.Filter):
+    def filter(self, record: logging.LogRecord) -> bool:
+        record.id_correlacion = id_correlacion.get()
+        return True
+
+def configurar_logs():
+    """Los logs del paquete 'app' salen por stdout con la hora, el nivel y el id de la petición."""
+    logger = logging.getLogger("app")
+    if logger.handlers:
+        return
+    manejador = logging.StreamHandler(sys.stdout)
+    manejador.addFilter(_FiltroCorrelacion())
+    manejador.setFormatter(logging.Formatter("%(asctime)s %(levelname)s [%(id_correlacion)s] %(name)s: %(message)s"))
+    logger.addHandler(manejador)
+    logger.setLevel(LOG_LEVEL)
+    logger.propagate = False
+
+configurar_logs()
+
+# =================== MÉTRICAS ===================
+# Implementación mínima del formato de texto de Prometheus. Registrar una
+# observación solo suma en memoria (sin E/S ni bloqueos); el texto se genera
+# únicamente cuando alguien consulta /metrics.
+
+REGISTRO: list = []
+
+def _escapar(valor) -> str:
+    return str(valor).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+def _etiquetas(nombres: tuple, valores: tuple, extra: str = "") -> str:
+    pares = [f'{n}="{_escapar(v)}"' for n, v in zip(nombres, valores)]
+    if extra:
+        pares.append(extra)
+    return "{" + ",".join(pares) + "}" if pares else ""
+
+class Contador:
+    def __init__(self, nombre: str, ayuda: str, etiquetas: tuple = ()):
+        self.nombre = nombre
+        self.ayuda = ayuda
+        self.etiquetas = etiquetas
+        self._valores: dict[tuple, float] = {}
+        REGISTRO.append(self)
+
+    def incrementar(self, cantidad: float = 1, **etiquetas):
+        if not METRICAS_ACTIVADAS:
+            return
+        clave = tuple(etiquetas.get(n, "") for n in self.etiquetas)
+        self._valores[clave] = self._valores.get(clave, 0) + cantidad
+
+    def exponer(self) -> list[str]:
+        lineas = [f"# HELP {self.nombre} {self.ayuda}", f"# TYPE {self.nombre} counter"]
+        for clave, valor in self._valores.items():
+            lineas.append(f"{self.nombre}{_etiquetas(self.etiquetas, clave)} {valor}")
+        return lineas
+
+class Histograma:
+    def __init__(self, nombre: str, ayuda: str, limites: tuple, etiquetas: tuple = ()):
+        self.nombre = nombre
+        self.ayuda = ayuda
+        self.limites = tuple(sorted(limites))
+        self.etiquetas = etiquetas
+        # etiquetas -> [cuentas por intervalo (+ el de +Inf), suma, total]
+        self._series: dict[tuple, list] = {}
+        REGISTRO.append(self)
+
+    def observar(self, valor: float, **etiquetas):
+        if not METRICAS_ACTIVADAS or valor is None:
+            return
+        clave = tuple(etiquetas.get(n, "") for n in self.etiquetas)
+        serie = self._series.get(clave)
+        if serie is None:
+            serie = self._series[clave] = [[0] * (len(self.limites) + 1), 0.0, 0]
+        serie[0][bisect.bisect_left(self.limites, valor)] += 1
+        serie[1] += valor
+        serie[2] += 1
+
+    @contextmanager
+    def medir(self, **etiquetas):
+        """Observa los segundos que tarda el bloque."""
+        inicio = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observar(time.perf_counter() - inicio, **etiquetas)
+
+    def exponer(self) -> list[str]:
+        lineas = [f"# HELP {self.nombre} {self.ayuda}", f"# TYPE {self.nombre} histogram"]
+        for clave, (cuentas, suma, total) in self._series.items():
+            acumulado = 0
+            for limite, cuenta in zip(self.limites + (float("inf"),), cuentas):
+                acumulado += cuenta
+                le = 'le="+Inf"' if limite == float("inf") else f'le="{float(limite)!r}"'
+                lineas.append(f"{self.nombre}_bucket{_etiquetas(self.etiquetas, clave, le)} {acumulado}")
+            lineas.append(f"{self.nombre}_sum{_etiquetas(self.etiquetas, clave)} {suma}")
+            lineas.append(f"{self.nombre}_count{_etiquetas(self.etiquetas, clave)} {total}")
+        return lineas
+
+def exponer_metricas() -> str:
+    """Todas las métricas en el formato de texto de Prometheus (versión 0.0.4)."""
+    lineas = []
+    for metrica in REGISTRO:
+        lineas.extend(metrica.exponer())
+    return "\n".join(lineas) + "\n"
+
+# Límites de los histogramas (segundos, caracteres, tokens, tokens/s)
+_RAPIDO = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5)
+_LENTO = (0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 20.0, 30.0, 60.0, 120.0)
+
+http_peticion_segundos = Histograma(
+    "aquallm_http_peticion_segundos", "Duración de las peticiones HTTP (en los streams, hasta el último evento)",
+    _LENTO, ("metodo", "ruta", "codigo"))
+resolucion_identificador_segundos = Histograma(
+    "aquallm_resolucion_identificador_segundos", "Búsqueda del cliente, contrato y medidor a partir del identificador",
+    _RAPIDO, ("tipo",))
+snapshot_cliente_segundos = Histograma(
+    "aquallm_snapshot_cliente_segundos", "Carga completa del snapshot de un cliente desde la base de datos", _RAPIDO)
+supabase_consulta_segundos = Histograma(
+    "aquallm_supabase_consulta_segundos", "Duración de cada consulta a Supabase", _RAPIDO, ("tabla",))
+supabase_errores_total = Contador(
+    "aquallm_supabase_errores_total", "Consultas a Supabase que terminaron en error", ("tabla",))
+postgres_consulta_segundos = Histograma(
+    "aquallm_postgres_consulta_segundos", "Duración de cada consulta directa a PostgreSQL (DB_BACKEND=postgres)",
+    _RAPIDO, ("consulta",))
+postgres_errores_total = Contador(
+    "aquallm_postgres_errores_total", "Consultas directas a PostgreSQL que terminaron en error", ("consulta",))
+prompt_construccion_segundos = Histograma(
+    "aquallm_prompt_construccion_segundos", "Construcción del prompt", (0.0001, 0.0005, 0.001, 0.005, 0.01, 0.05))
+prompt_caracteres = Histograma(
+    "aquallm_prompt_caracteres", "Tamaño del prompt en caracteres", (250, 500, 1000, 2000, 4000, 8000, 16000))
+prompt_tokens = Histograma(
+    "aquallm_prompt_tokens", "Tamaño estimado del prompt en tokens", (64, 128, 256, 512, 1024, 2048, 4096))
+llm_espera_cola_segundos = Histograma(
+    "aquallm_llm_espera_cola_segundos", "Espera en la cola del planificador antes de generar", _LENTO, ("modelo",))
+llm_ttft_segundos = Histograma(
+    "aquallm_llm_ttft_segundos", "Tiempo hasta el primer token del LLM", _LENTO, ("modelo",))
+llm_generacion_segundos = Histograma(
+    "aquallm_llm_generacion_segundos", "Duración total de la generación del LLM", _LENTO, ("modelo", "modo"))
+llm_tokens_por_segundo = Histograma(
+    "aquallm_llm_tokens_por_segundo", "Velocidad de generación según los contadores del servidor del LLM",
+    (1, 2.5, 5, 10, 20, 40, 80, 160), ("modelo",))
+llm_tokens_generados = Histograma(
+    "aquallm_llm_tokens_generados", "Tokens generados por respuesta (eval_count)", (16, 32, 64, 128, 256, 512, 1024), ("modelo",))
+llm_lote_prompts = Histograma(
+    "aquallm_llm_lote_prompts", "Prompts enviados juntos en cada micro-lote", (1, 2, 4, 8, 16, 32))
+llm_generaciones_compartidas_total = Contador(
+    "aquallm_llm_generaciones_compartidas_total", "Peticiones que se unieron a una generación idéntica en curso",
+    ("modelo", "modo"))
+respuestas_chat_total = Contador(
+    "aquallm_respuestas_chat_total", "Respuestas del chat según su origen", ("origen",))
+
+class MiddlewareObservabilidad:
+    """
+    Middleware ASGI que asigna a cada petición un id de correlación (el
+    X-Request-ID recibido o uno nuevo), lo devuelve en la respuesta y mide
+    su duración por ruta, método y código de estado.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+
+        recibido = dict(scope["headers"]).get(b"x-request-id")
+        identificador = nuevo_id_correlacion(recibido.decode("latin-1") if recibido else None)
+        token = id_correlacion.set(identificador)
+        inicio = time.perf_counter()
+        codigo = 500
+
+        async def enviar(mensaje):
+            nonlocal codigo
+            if mensaje["type"] == "http.response.start":
+                codigo = mensaje["status"]
+                mensaje["headers"] = [*mensaje.get("headers", []), (b"x-request-id", identificador.encode("latin-1"))]
+            await send(mensaje)
+
+        try:
+            await self.app(scope, receive, enviar)
+        finally:
+            # La plantilla de la ruta (no la URL) para no crear una serie por identificador
+            ruta = getattr(scope.get("route"), "path", "sin_ruta")
+            http_peticion_segundos.observar(time.perf_counter() - inicio, metodo=scope["method"], ruta=ruta, codigo=str(codigo))
+            id_correlacion.reset(token)
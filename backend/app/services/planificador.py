@@ -0,0 +1,204 @@
+import os
+import math
+import time
+import asyncio
+from collections import deque
+from contextlib import asynccontextmanager
+
+from . import metricas
+
+# --- Configuración del planificador de peticiones al LLM ---
+# Generaciones simultáneas por modelo (conviene igualarlo a OLLAMA_NUM_PARALLEL del servidor)
+LLM_CONCURRENCIA = int(os.environ.get("LLM_CONCURRENCIA", "2"))
+LLM_COLA_MAX = int(os.environ.get("LLM_COLA_MAX", "20"))  # Peticiones en espera por modelo
+LLM_COLA_PLAZO = float(os.environ.get("LLM_COLA_PLAZO", "30"))  # Segundos máximos de espera en la cola
+LLM_DURACION_INICIAL = float(os.environ.get("LLM_DURACION_INICIAL", "8"))  # Estimación antes de medir
+
+class LLMSaturado(Exception):
+    """No hay capacidad para atender la petición dentro del plazo; reintentar en ``retry_after`` s."""
+
+    def __init__(self, mensaje: str, retry_after: int):
+        super().__init__(mensaje)
+        self.retry_after = retry_after
+
+class _EstadoModelo:
+    def __init__(self):
+        self.activos = 0
+        self.cola: deque[Turno] = deque()
+        self.duracion_media = LLM_DURACION_INICIAL  # Media móvil de lo que dura una generación
+
+class Turno:
+    """Lugar de una petición en la cola de un modelo."""
+
+    def __init__(self, planificador: "PlanificadorLLM", modelo: str, estado: _EstadoModelo):
+        self._planificador = planificador
+        self.modelo = modelo
+        self._estado = estado
+        self.creado = time.monotonic()
+        self._cambio = asyncio.Event()
+        self.concedido = False
+        self.liberado = False
+        self.inicio = None
+
+    @property
+    def posicion(self) -> int:
+        """Posición en la cola (1 = el siguiente en pasar); 0 si ya tiene el turno."""
+        if self.concedido or self.liberado:
+            return 0
+        return self._estado.cola.index(self) + 1
+
+    def _avisar(self):
+        self._cambio.set()
+
+    async def esperar(self, plazo: float):
+        """
+        Espera el turno produciendo la posición en la cola cada vez que cambia.
+        Lanza LLMSaturado si no llega antes de ``plazo`` segundos.
+        """
+        limite = time.monotonic() + plazo
+        ultima = None
+        while not self.concedido:
+            posicion = self.posicion
+            if posicion != ultima:
+                ultima = posicion
+                yield posicion
+                continue  # El estado pudo cambiar mientras se procesaba la posición
+            self._cambio.clear()
+            restante = limite - time.monotonic()
+            try:
+                await asyncio.wait_for(self._cambio.wait(), timeout=max(restante, 0))
+            except asyncio.TimeoutError:
+                if self.concedido:
+                    break
+                self._planificador.expiradas += 1
+                raise LLMSaturado(
+                    "Tiempo de espera agotado en la cola del modelo",
+                    self._planificador._retry_after(self._estado),
+                )
+
+    def liberar(self):
+        """Devuelve el turno (o abandona la cola si aún no se había concedido)."""
+        if not self.liberado:
+            self.liberado = True
+            self._planificador._liberar(self)
+
+class PlanificadorLLM:
+    """
+    Limita las generaciones simultáneas por modelo y ordena el resto en una
+    cola FIFO acotada.
+
+    Una petición se rechaza enseguida (LLMSaturado, que se traduce en un 503
+    con Retry-After) si la cola está llena o si la espera estimada supera el
+    plazo; así, ante una ráfaga, se responde rápido en lugar de acumular
+    peticiones hasta el timeout de Ollama. La espera se estima con la duración
+    media de las últimas generaciones.
+    """
+
+    def __init__(self, concurrencia: int = LLM_CONCURRENCIA, max_cola: int = LLM_COLA_MAX, plazo: float = LLM_COLA_PLAZO):
+        self.concurrencia = max(1, concurrencia)
+        self.max_cola = max_cola
+        self.plazo = plazo
+        self._modelos: dict[str, _EstadoModelo] = {}
+        self.admitidas = 0
+        self.rechazadas = 0
+        self.expiradas = 0
+        self.canceladas = 0
+
+    def _estado(self, modelo: str) -> _EstadoModelo:
+        if modelo not in self._modelos:
+            self._modelos[modelo] = _EstadoModelo()
+        return self._modelos[modelo]
+
+    def espera_estimada(self, modelo: str) -> float:
+        """Segundos que esperaría una petición nueva antes de empezar a generar."""
+        estado = self._estado(modelo)
+        if estado.activos < self.concurrencia and not estado.cola:
+            return 0.0
+        rondas = math.ceil((len(estado.cola) + 1) / self.concurrencia)
+        return rondas * estado.duracion_media
+
+    def _retry_after(self, estado: _EstadoModelo) -> int:
+        rondas = math.ceil((len(estado.cola) + 1) / self.concurrencia)
+        return max(1, math.ceil(rondas * estado.duracion_media))
+
+    def verificar_admision(self, modelo: str):
+        """Lanza LLMSaturado si una petición nueva para ``modelo`` no se podría atender a tiempo."""
+        estado = self._estado(modelo)
+        if estado.activos < self.concurrencia and not estado.cola:
+            return
+        if len(estado.cola) >= self.max_cola:
+            self.rechazadas += 1
+            raise LLMSaturado("La cola del modelo está llena", self._retry_after(estado))
+        if self.espera_estimada(modelo) > self.plazo:
+            self.rechazadas += 1
+            raise LLMSaturado("La espera estimada supera el plazo", self._retry_after(estado))
+
+    def solicitar(self, modelo: str) -> Turno:
+        """
+        Reserva un turno para ``modelo``: concedido enseguida si hay capacidad
+        libre o, si no, en la cola. Lanza LLMSaturado si no es admisible.
+        """
+        self.verificar_admision(modelo)
+        estado = self._estado(modelo)
+        turno = Turno(self, modelo, estado)
+        estado.cola.append(turno)
+        self.admitidas += 1
+        self._despachar(estado)
+        return turno
+
+    def _despachar(self, estado: _EstadoModelo):
+        """Concede turnos a los primeros de la cola mientras haya capacidad y avisa a los demás."""
+        while estado.activos < self.concurrencia and estado.cola:
+            turno = estado.cola.popleft()
+            estado.activos += 1
+            turno.concedido = True
+            turno.inicio = time.monotonic()
+            metricas.llm_espera_cola_segundos.observar(turno.inicio - turno.creado, modelo=turno.modelo)
+            turno._avisar()
+        for turno in estado.cola:
+            turno._avisar()
+
+    def _liberar(self, turno: Turno):
+        estado = turno._estado
+        if turno.concedido:
+            estado.activos -= 1
+            duracion = time.monotonic() - turno.inicio
+            estado.duracion_media = 0.8 * estado.duracion_media + 0.2 * duracion
+        else:
+            # La petición se canceló (p. ej. el cliente cerró la conexión) mientras esperaba
+            estado.cola.remove(turno)
+            self.canceladas += 1
+        self._despachar(estado)
+
+    @asynccontextmanager
+    async def turno(self, modelo: str):
+        """Ocupa un turno de ``modelo`` durante el bloque, esperando en la cola si hace falta."""
+        turno = self.solicitar(modelo)
+        try:
+            async for _ in turno.esperar(self.plazo):
+                pass
+            yield turno
+        finally:
+            turno.liberar()
+
+    def estadisticas(self) -> dict:
+        return {
+            "concurrencia": self.concurrencia,
+            "max_cola": self.max_cola,
+            "plazo_segundos": self.plazo,
+            "admitidas": self.admitidas,
+            "rechazadas": self.rechazadas,
+            "expiradas": self.expiradas,
+            "canceladas": self.canceladas,
+            "modelos": {
+                modelo: {
+                    "activos": estado.activos,
+                    "en_cola": len(estado.cola),
+                    "duracion_media_s": round(estado.duracion_media, 2),
+                    "espera_estimada_s": round(self.espera_estimada(modelo), 2),
+                }
+                for modelo, estado in self._modelos.items()
+            },
+        }
+
+planificador = PlanificadorLLM()
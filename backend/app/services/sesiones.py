@@ -0,0 +1,169 @@
+import os
+import logging
+import time
+import asyncio
+from collections import OrderedDict
+from dataclasses import dataclass, field
+
+from ..models.schemas import MessageHistory
+from .database import guardar_conversaciones, obtener_historial_conversacion
+
+logger = logging.getLogger(__name__)
+
+# --- Configuración del almacén de sesiones ---
+SESIONES_MAX = int(os.environ.get("SESIONES_MAX", "10000"))
+SESIONES_INACTIVIDAD = float(os.environ.get("SESIONES_INACTIVIDAD", "1800"))  # Segundos sin actividad
+SESIONES_MAX_TURNOS = int(os.environ.get("SESIONES_MAX_TURNOS", "20"))  # Turnos guardados en memoria por sesión
+SESIONES_LOTE = int(os.environ.get("SESIONES_LOTE", "50"))  # Filas por inserción en 'conversaciones'
+SESIONES_INTERVALO_ESCRITURA = float(os.environ.get("SESIONES_INTERVALO_ESCRITURA", "2"))  # Segundos
+
+@dataclass
+class Sesion:
+    turnos: list = field(default_factory=list)
+    ultimo_acceso: float = field(default_factory=time.monotonic)
+
+class AlmacenSesiones:
+    """
+    Historial de conversación por sesión, guardado en el servidor.
+
+    Las sesiones activas viven en memoria (LRU acotado y expiración por
+    inactividad). Si una sesión no está en memoria se recupera de la tabla
+    'conversaciones'. Los turnos nuevos se escriben en esa tabla en lotes,
+    desde una tarea en segundo plano, fuera del camino de la petición; hasta
+    que se escriben, su sesión no se desaloja (si no, al recuperarla de la
+    tabla le faltarían esos turnos), aunque se supere el máximo de sesiones.
+    """
+
+    def __init__(self, max_sesiones: int = SESIONES_MAX, inactividad: float = SESIONES_INACTIVIDAD,
+                 max_turnos: int = SESIONES_MAX_TURNOS, lote: int = SESIONES_LOTE,
+                 intervalo_escritura: float = SESIONES_INTERVALO_ESCRITURA):
+        self.max_sesiones = max_sesiones
+        self.inactividad = inactividad
+        self.max_turnos = max_turnos
+        self.lote = lote
+        self.intervalo_escritura = intervalo_escritura
+        self._sesiones: OrderedDict[str, Sesion] = OrderedDict()
+        self._pendientes: list[dict] = []
+        self._sin_escribir: dict[str, int] = {}  # session_id -> turnos aún no escritos
+        self._tarea: asyncio.Task | None = None
+        self.escritas = 0
+        self.descartadas = 0
+
+    async def obtener_historial(self, session_id: str) -> list:
+        """Turnos anteriores de la sesión, del más antiguo al más reciente."""
+        sesion = self._sesiones.get(session_id)
+        if sesion is not None and time.monotonic() - sesion.ultimo_acceso > self.inactividad and self._desalojable(session_id):
+            del self._sesiones[session_id]
+            sesion = None
+
+        if sesion is None:
+            # Sesión expirada o de otro worker: se recupera de la base de datos
+            filas = await obtener_historial_conversacion(session_id, limit=self.max_turnos)
+            sesion = self._sesiones.get(session_id) or Sesion(turnos=[MessageHistory(**f) for f in filas])
+            self._sesiones[session_id] = sesion
+            self._acotar()
+
+        sesion.ultimo_acceso = time.monotonic()
+        self._sesiones.move_to_end(session_id)
+        return list(sesion.turnos)
+
+    def agregar(self, session_id: str, pregunta: str, respuesta: str):
+        """Añade un turno a la sesión y lo encola para escribirlo en la base de datos."""
+        sesion = self._sesiones.get(session_id)
+        if sesion is None:
+            sesion = self._sesiones[session_id] = Sesion()
+            self._acotar()
+        sesion.turnos.append(MessageHistory(pregunta=pregunta, respuesta=respuesta))
+        del sesion.turnos[:-self.max_turnos]
+        sesion.ultimo_acceso = time.monotonic()
+        self._sesiones.move_to_end(session_id)
+
+        self._pendientes.append({"session_id": session_id, "pregunta": pregunta, "respuesta": respuesta})
+        self._sin_escribir[session_id] = self._sin_escribir.get(session_id, 0) + 1
+
+    def _desalojable(self, session_id: str) -> bool:
+        return session_id not in self._sin_escribir
+
+    def _acotar(self):
+        exceso = len(self._sesiones) - self.max_sesiones
+        if exceso <= 0:
+            return
+        # Las menos usadas primero, salvo las que tienen turnos sin escribir y la recién usada
+        for session_id in [s for s in list(self._sesiones)[:-1] if self._desalojable(s)][:exceso]:
+            del self._sesiones[session_id]
+
+    def _purgar_inactivas(self):
+        limite = time.monotonic() - self.inactividad
+        # Las sesiones están ordenadas por último acceso: basta con mirar el principio
+        inactivas = []
+        for session_id, sesion in self._sesiones.items():
+            if sesion.ultimo_acceso > limite:
+                break
+            if self._desalojable(session_id):
+                inactivas.append(session_id)
+        for session_id in inactivas:
+            del self._sesiones[session_id]
+        # Las que esperaban a que se escribieran sus turnos pueden salir ya si sobran
+        self._acotar()
+
+    def _escritos(self, turnos: list[dict]):
+        """Los turnos ya no están pendientes (escritos o descartados): su sesión vuelve a ser desalojable."""
+        for turno in turnos:
+            session_id = turno["session_id"]
+            if self._sin_escribir[session_id] <= 1:
+                del self._sin_escribir[session_id]
+            else:
+                self._sin_escribir[session_id] -= 1
+
+    async def escribir_pendientes(self):
+        """Inserta en 'conversaciones' los turnos pendientes, en lotes."""
+        while self._pendientes:
+            lote, self._pendientes = self._pendientes[:self.lote], self._pendientes[self.lote:]
+            if await guardar_conversaciones(lote):
+                self.escritas += len(lote)
+                self._escritos(lote)
+            else:
+                # Se reintenta en el próximo ciclo, sin acumular más de 20 lotes
+                self._pendientes = lote + self._pendientes
+                exceso = len(self._pendientes) - 20 * self.lote
+                if exceso > 0:
+                    self._escritos(self._pendientes[:exceso])
+                    del self._pendientes[:exceso]
+                    self.descartadas += exceso
+                return
+
+    async def _ciclo(self):
+        while True:
+            await asyncio.sleep(self.intervalo_escritura)
+            self._purgar_inactivas()
+            try:
+                await self.escribir_pendientes()
+            except Exception as e:
+                logger.error(f"Error al escribir el historial de conversaciones: {e}")
+
+    def iniciar(self):
+        """Arranca la escritura en segundo plano (al iniciar la aplicación)."""
+        if self._tarea is None:
+            self._tarea = asyncio.create_task(self._ciclo())
+
+    async def detener(self):
+        """Detiene la tarea de fondo y escribe lo que quede pendiente."""
+        if self._tarea is not None:
+            self._tarea.cancel()
+            try:
+                await self._tarea
+            except asyncio.CancelledError:
+                pass
+            self._tarea = None
+        await self.escribir_pendientes()
+
+    def estadisticas(self) -> dict:
+        return {
+            "sesiones_activas": len(self._sesiones),
+            "max_sesiones": self.max_sesiones,
+            "turnos_pendientes_de_escribir": len(self._pendientes),
+            "turnos_escritos": self.escritas,
+            "turnos_descartados": self.descartadas,
+        }
+
+sesiones = AlmacenSesiones()
@@ -0,0 +1,92 @@
+"""
+Mide lo que tarda el backend en estar disponible:
+
+- importación: segundos de ``import app.main`` en un proceso nuevo (con y
+  sin credenciales de Supabase en el entorno);
+- arranque en frío: desde lanzar uvicorn hasta que responde en /, hasta que
+  /health/ready devuelve 200 y la duración de la primera consulta rápida
+  (la primera que usa Supabase).
+
+Usa el Ollama y el PostgREST simulados de bench/, así que funciona sin conexión.
+
+Uso (desde la carpeta backend):
+    python -m bench.arranque
+    python -m bench.arranque --repeticiones 10
+"""
+import os
+import sys
+import time
+import argparse
+import statistics
+import subprocess
+
+import httpx
+
+from bench.carga import CARPETA_BACKEND, levantar_simulados, lanzar_backend
+
+_IMPORTAR = "import time; t = time.perf_counter(); import app.main; print(time.perf_counter() - t)"
+
+def medir_importacion(repeticiones: int, env: dict) -> list[float]:
+    """Segundos de ``import app.main`` en procesos nuevos."""
+    tiempos = []
+    for _ in range(repeticiones):
+        salida = subprocess.run([sys.executable, "-c", _IMPORTAR], cwd=CARPETA_BACKEND, env=env,
+                                capture_output=True, text=True, check=True).stdout
+        tiempos.append(float(salida.strip().splitlines()[-1]))
+    return tiempos
+
+def _esperar(url: str, limite: float, estado: int = 200) -> float:
+    """Momento (perf_counter) en que ``url`` responde con ``estado``."""
+    while time.perf_counter() < limite:
+        try:
+            if httpx.get(url, timeout=1).status_code == estado:
+                return time.perf_counter()
+        except httpx.HTTPError:
+            pass
+        time.sleep(0.01)
+    raise RuntimeError(f"{url} no respondió a tiempo")
+
+def medir_arranque(repeticiones: int, puerto: int) -> dict[str, list[float]]:
+    """Arranques en frío del backend contra los servidores simulados."""
+    base = f"http://127.0.0.1:{puerto}"
+    tiempos = {"escuchando_s": [], "listo_s": [], "primera_consulta_s": []}
+    simulados = levantar_simulados(puerto + 1, puerto + 2)
+    try:
+        for _ in range(repeticiones):
+            inicio = time.perf_counter()
+            backend = lanzar_backend(puerto, puerto + 1, puerto + 2, {})
+            try:
+                limite = inicio + 60
+                tiempos["escuchando_s"].append(_esperar(f"{base}/", limite) - inicio)
+                tiempos["listo_s"].append(_esperar(f"{base}/health/ready", limite) - inicio)
+                consulta = time.perf_counter()
+                httpx.post(f"{base}/api/quick-query", json={"query_type": "saldo_actual", "identifier": "6"}, timeout=10).raise_for_status()
+                tiempos["primera_consulta_s"].append(time.perf_counter() - consulta)
+            finally:
+                backend.terminate()
+                backend.wait()
+    finally:
+        for proceso in simulados:
+            proceso.terminate()
+    return tiempos
+
+def _resumen(nombre: str, valores: list[float]):
+    print(f"  {nombre:<34} mediana={statistics.median(valores):.3f} s  min={min(valores):.3f} s  max={max(valores):.3f} s")
+
+def main():
+    parser = argparse.ArgumentParser(description="Tiempo de importación y de arranque en frío del backend")
+    parser.add_argument("--repeticiones", type=int, default=5)
+    parser.add_argument("--puerto", type=int, default=8810, help="Puerto del backend (los simulados usan los dos siguientes)")
+    args = parser.parse_args()
+
+    sin_credenciales = {k: v for k, v in os.environ.items() if k not in ("SUPABASE_URL", "SUPABASE_KEY")}
+    print("Importación de app.main")
+    _resumen("con credenciales", medir_importacion(args.repeticiones, {**os.environ, "SUPABASE_URL": "http://127.0.0.1:1", "SUPABASE_KEY": "x"}))
+    _resumen("sin credenciales", medir_importacion(args.repeticiones, sin_credenciales))
+
+    print("Arranque en frío")
+    for nombre, valores in medir_arranque(args.repeticiones, args.puerto).items():
+        _resumen(nombre, valores)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,311 @@
+"""
+Prueba de carga de la API: lanza peticiones concurrentes contra /api/chat,
+/api/chat-stream y /api/quick-query y mide latencias (p50/p95/p99), tiempo
+hasta el primer token (TTFT) y peticiones por segundo de cada endpoint.
+
+Con --levantar arranca todo en local y sin conexión: el Ollama simulado
+(bench/fake_ollama.py), el PostgREST simulado (bench/fake_postgrest.py) y el
+backend apuntando a ambos. Los resultados se guardan en JSON junto con el
+commit actual para comparar entre versiones.
+
+Uso (desde la carpeta backend):
+    python -m bench.carga --levantar
+    python -m bench.carga --levantar --escenarios chat_stream --concurrencia 50 --peticiones 500
+    python -m bench.carga --url http://localhost:8000          # contra un backend ya en marcha
+    python -m bench.carga --comparar bench/resultados/a.json bench/resultados/b.json
+
+La latencia de Ollama y de Supabase simulados se ajusta con las variables de
+entorno de cada servidor (BENCH_OLLAMA_TTFT_MS, BENCH_OLLAMA_TOKENS_S,
+BENCH_OLLAMA_TOKENS, BENCH_OLLAMA_PARALELO, BENCH_SUPABASE_RTT_MS).
+"""
+import os
+import sys
+import json
+import time
+import math
+import random
+import asyncio
+import argparse
+import subprocess
+from datetime import datetime, timezone
+
+import httpx
+
+from bench.datos_ejemplo import generar_tablas
+
+CARPETA_BACKEND = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+CARPETA_RESULTADOS = os.path.join(CARPETA_BACKEND, "bench", "resultados")
+
+# Preguntas que necesitan al LLM (no coinciden con ninguna consulta rápida)
+PREGUNTAS_LLM = [
+    "¿Por qué subió mi factura este mes?",
+    "Explícame el detalle de mis últimas facturas",
+    "¿Qué significa el estado de mi contrato?",
+    "No entiendo el consumo que me están cobrando",
+]
+# Preguntas que el enrutador de intenciones responde sin el LLM
+PREGUNTAS_DIRECTAS = ["¿Cuánto debo?", "¿Cuándo vence mi factura?", "¿Mi consumo es normal?", "¿Dónde puedo pagar?"]
+CONSULTAS_CLIENTE = [
+    "saldo_actual", "consumo_actual", "proxima_factura", "informacion_medidor", "promedio_facturacion",
+    "facturas_vencidas", "promedio_consumo", "comparar_mes_anterior", "consumo_normal", "estado_solicitudes",
+]
+CONSULTAS_INFORMATIVAS = ["reportar_fuga", "cambiar_medidor", "como_pagar", "donde_pagar", "pago_online", "descuentos"]
+
+def _identificadores() -> list[str]:
+    """ID de cliente y número de medidor de los clientes de ejemplo con contrato activo."""
+    tablas = generar_tablas()
+    activos = [c for c in tablas["contratos"] if c["estado_servicio"] == "Activo"]
+    return [str(c["id_cliente"]) for c in activos] + [f"MED{c['id_contrato']:05d}" for c in activos]
+
+# =================== ESCENARIOS ===================
+# Cada escenario hace una petición y devuelve (código HTTP, ttft en segundos o None).
+
+async def _chat(cliente: httpx.AsyncClient, azar: random.Random, ids: list[str], preguntas: list[str]):
+    respuesta = await cliente.post("/api/chat", json={"question": azar.choice(preguntas), "identifier": azar.choice(ids)})
+    return respuesta.status_code, None
+
+async def escenario_chat(cliente, azar, ids):
+    return await _chat(cliente, azar, ids, PREGUNTAS_LLM)
+
+async def escenario_chat_directo(cliente, azar, ids):
+    return await _chat(cliente, azar, ids, PREGUNTAS_DIRECTAS)
+
+async def escenario_chat_stream(cliente, azar, ids):
+    inicio = time.perf_counter()
+    ttft = None
+    cuerpo = {"question": azar.choice(PREGUNTAS_LLM), "identifier": azar.choice(ids)}
+    async with cliente.stream("POST", "/api/chat-stream", json=cuerpo) as respuesta:
+        async for linea in respuesta.aiter_lines():
+            if not linea.startswith("data: "):
+                continue
+            evento = json.loads(linea[6:])
+            if ttft is None and ("token" in evento or evento.get("done")):
+                ttft = time.perf_counter() - inicio
+            if evento.get("error"):
+                return 599, ttft  # Error informado dentro del stream
+            if evento.get("done"):
+                break
+    return respuesta.status_code, ttft
+
+async def escenario_quick_query(cliente, azar, ids):
+    cuerpo = {"query_type": azar.choice(CONSULTAS_CLIENTE), "identifier": azar.choice(ids)}
+    respuesta = await cliente.post("/api/quick-query", json=cuerpo)
+    return respuesta.status_code, None
+
+async def escenario_quick_query_informativa(cliente, azar, ids):
+    respuesta = await cliente.get(f"/api/quick-query/{azar.choice(CONSULTAS_INFORMATIVAS)}")
+    return respuesta.status_code, None
+
+ESCENARIOS = {
+    "chat": escenario_chat,
+    "chat_directo": escenario_chat_directo,
+    "chat_stream": escenario_chat_stream,
+    "quick_query": escenario_quick_query,
+    "quick_query_informativa": escenario_quick_query_informativa,
+}
+
+# =================== MEDICIÓN ===================
+
+def percentil(valores: list[float], p: float) -> float | None:
+    """Percentil por rango más cercano (el mismo criterio que usan la mayoría de herramientas de carga)."""
+    if not valores:
+        return None
+    ordenados = sorted(valores)
+    return ordenados[max(0, math.ceil(p / 100 * len(ordenados)) - 1)]
+
+def _resumen_ms(valores: list[float]) -> dict:
+    return {
+        "p50": _ms(percentil(valores, 50)),
+        "p95": _ms(percentil(valores, 95)),
+        "p99": _ms(percentil(valores, 99)),
+        "media": _ms(sum(valores) / len(valores)) if valores else None,
+        "max": _ms(max(valores)) if valores else None,
+    }
+
+def _ms(segundos: float | None) -> float | None:
+    return round(segundos * 1000, 1) if segundos is not None else None
+
+async def medir_escenario(url: str, nombre: str, peticiones: int, concurrencia: int, semilla: int, ids: list[str]) -> dict:
+    """Lanza ``peticiones`` del escenario con ``concurrencia`` clientes simultáneos."""
+    escenario = ESCENARIOS[nombre]
+    azar = random.Random(semilla)
+    latencias, ttfts, codigos = [], [], {}
+    pendientes = iter(range(peticiones))
+
+    async with httpx.AsyncClient(base_url=url, timeout=httpx.Timeout(120, connect=5),
+                                 limits=httpx.Limits(max_connections=concurrencia)) as cliente:
+        async def trabajador():
+            for _ in pendientes:
+                inicio = time.perf_counter()
+                try:
+                    codigo, ttft = await escenario(cliente, azar, ids)
+                except httpx.HTTPError as e:
+                    codigo, ttft = type(e).__name__, None
+                latencias.append(time.perf_counter() - inicio)
+                codigos[str(codigo)] = codigos.get(str(codigo), 0) + 1
+                if ttft is not None:
+                    ttfts.append(ttft)
+
+        inicio = time.perf_counter()
+        await asyncio.gather(*(trabajador() for _ in range(concurrencia)))
+        duracion = time.perf_counter() - inicio
+
+    correctas = codigos.get("200", 0)
+    return {
+        "peticiones": peticiones,
+        "concurrencia": concurrencia,
+        "duracion_s": round(duracion, 3),
+        "rps": round(peticiones / duracion, 2),
+        "correctas": correctas,
+        "tasa_error": round(1 - correctas / peticiones, 4) if peticiones else 0.0,
+        "codigos": codigos,
+        "latencia_ms": _resumen_ms(latencias),
+        "ttft_ms": _resumen_ms(ttfts) if ttfts else None,
+    }
+
+# =================== ENTORNO LOCAL ===================
+
+def _esperar_servidor(url: str, segundos: float = 30):
+    limite = time.monotonic() + segundos
+    while time.monotonic() < limite:
+        try:
+            httpx.get(url, timeout=1)
+            return
+        except httpx.HTTPError:
+            time.sleep(0.2)
+    raise RuntimeError(f"El servidor {url} no respondió en {segundos} s")
+
+def _uvicorn(modulo: str, puerto: int, env: dict) -> subprocess.Popen:
+    return subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", modulo, "--port", str(puerto), "--log-level", "warning"],
+        cwd=CARPETA_BACKEND, env={**os.environ, **env},
+        stdout=subprocess.DEVNULL,  # Los logs del backend por petición distorsionarían la medición
+    )
+
+def levantar_simulados(puerto_ollama: int, puerto_supabase: int) -> list[subprocess.Popen]:
+    """Arranca el Ollama y el PostgREST simulados y espera a que respondan."""
+    procesos = [_uvicorn("bench.fake_ollama:app", puerto_ollama, {}), _uvicorn("bench.fake_postgrest:app", puerto_supabase, {})]
+    _esperar_servidor(f"http://127.0.0.1:{puerto_ollama}/")
+    _esperar_servidor(f"http://127.0.0.1:{puerto_supabase}/rest/v1/clientes?limit=1")
+    return procesos
+
+def lanzar_backend(puerto_api: int, puerto_ollama: int, puerto_supabase: int, env_backend: dict) -> subprocess.Popen:
+    """Arranca el backend apuntando a los servidores simulados (sin esperar a que responda)."""
+    return _uvicorn("app.main:app", puerto_api, {
+        "OLLAMA_BASE_URL": f"http://127.0.0.1:{puerto_ollama}",
+        "OPENAI_BASE_URL": f"http://127.0.0.1:{puerto_ollama}",  # El simulado sirve las dos APIs
+        "SUPABASE_URL": f"http://127.0.0.1:{puerto_supabase}",
+        "SUPABASE_KEY": "bench",
+        **env_backend,
+    })
+
+def levantar_entorno(puerto_api: int, puerto_ollama: int, puerto_supabase: int, env_backend: dict) -> list[subprocess.Popen]:
+    """Arranca el Ollama y el PostgREST simulados y el backend apuntando a ellos."""
+    procesos = levantar_simulados(puerto_ollama, puerto_supabase)
+    procesos.append(lanzar_backend(puerto_api, puerto_ollama, puerto_supabase, env_backend))
+    _esperar_servidor(f"http://127.0.0.1:{puerto_api}/")
+    return procesos
+
+def _commit_actual() -> str | None:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=CARPETA_BACKEND,
+                              capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+# =================== COMPARACIÓN ===================
+
+def comparar(ruta_a: str, ruta_b: str):
+    """Muestra la variación de rps y latencias entre dos resultados guardados."""
+    with open(ruta_a, encoding="utf-8") as f:
+        a = json.load(f)
+    with open(ruta_b, encoding="utf-8") as f:
+        b = json.load(f)
+
+    print(f"{a.get('commit')} -> {b.get('commit')}")
+    for nombre in [n for n in a["resultados"] if n in b["resultados"]]:
+        ra, rb = a["resultados"][nombre], b["resultados"][nombre]
+        print(f"\n{nombre}")
+        filas = [("rps", ra["rps"], rb["rps"])]
+        filas += [(f"latencia {p}", ra["latencia_ms"][p], rb["latencia_ms"][p]) for p in ("p50", "p95", "p99")]
+        if ra.get("ttft_ms") and rb.get("ttft_ms"):
+            filas += [(f"ttft {p}", ra["ttft_ms"][p], rb["ttft_ms"][p]) for p in ("p50", "p95", "p99")]
+        for metrica, va, vb in filas:
+            variacion = f"{100 * (vb - va) / va:+.1f}%" if va else "-"
+            print(f"  {metrica:<14} {va:>10} {vb:>10}  {variacion}")
+
+# =================== PRINCIPAL ===================
+
+async def ejecutar(args) -> dict:
+    ids = _identificadores()
+    resultados = {}
+    for i, nombre in enumerate(args.escenarios):
+        # Unas peticiones de calentamiento para no medir conexiones ni cachés vacías
+        if args.calentamiento:
+            await medir_escenario(args.url, nombre, args.calentamiento, min(args.calentamiento, args.concurrencia), args.semilla, ids)
+        resultados[nombre] = await medir_escenario(args.url, nombre, args.peticiones, args.concurrencia, args.semilla + i, ids)
+        r = resultados[nombre]
+        ttft = f" ttft p50={r['ttft_ms']['p50']} ms" if r["ttft_ms"] else ""
+        print(f"{nombre:<24} {r['rps']:>8} rps  p50={r['latencia_ms']['p50']} p95={r['latencia_ms']['p95']} "
+              f"p99={r['latencia_ms']['p99']} ms{ttft}  errores={r['tasa_error']:.1%}")
+    return resultados
+
+def main():
+    parser = argparse.ArgumentParser(description="Prueba de carga de la API de AquaLLM")
+    parser.add_argument("--url", default="http://127.0.0.1:8000", help="URL del backend")
+    parser.add_argument("--escenarios", nargs="+", choices=list(ESCENARIOS), default=list(ESCENARIOS))
+    parser.add_argument("--peticiones", type=int, default=200, help="Peticiones por escenario")
+    parser.add_argument("--concurrencia", type=int, default=20, help="Clientes simultáneos")
+    parser.add_argument("--calentamiento", type=int, default=10, help="Peticiones previas sin medir")
+    parser.add_argument("--semilla", type=int, default=42)
+    parser.add_argument("--salida", help="Archivo JSON de resultados (por defecto bench/resultados/<fecha>_<commit>.json)")
+    parser.add_argument("--levantar", action="store_true", help="Arranca Ollama y Supabase simulados y el backend")
+    parser.add_argument("--puerto", type=int, default=8800, help="Puerto del backend con --levantar")
+    parser.add_argument("--sin-cache-llm", action="store_true", help="Desactiva la caché de respuestas del LLM en el backend levantado")
+    parser.add_argument("--comparar", nargs=2, metavar=("A", "B"), help="Compara dos resultados guardados")
+    args = parser.parse_args()
+
+    if args.comparar:
+        comparar(*args.comparar)
+        return
+
+    procesos = []
+    if args.levantar:
+        args.url = f"http://127.0.0.1:{args.puerto}"
+        env_backend = {"LLM_CACHE_BACKEND": "desactivado"} if args.sin_cache_llm else {}
+        procesos = levantar_entorno(args.puerto, args.puerto + 1, args.puerto + 2, env_backend)
+
+    try:
+        resultados = asyncio.run(ejecutar(args))
+    finally:
+        for proceso in procesos:
+            proceso.terminate()
+        for proceso in procesos:
+            proceso.wait(timeout=10)
+
+    commit = _commit_actual()
+    informe = {
+        "commit": commit,
+        "fecha": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        "url": args.url,
+        "entorno_simulado": args.levantar,
+        "parametros": {
+            "peticiones": args.peticiones,
+            "concurrencia": args.concurrencia,
+            "semilla": args.semilla,
+            **{clave: valor for clave, valor in os.environ.items() if clave.startswith("BENCH_")},
+        },
+        "resultados": resultados,
+    }
+
+    salida = args.salida
+    if not salida:
+        os.makedirs(CARPETA_RESULTADOS, exist_ok=True)
+        fecha = datetime.now().strftime("%Y%m%d-%H%M%S")
+        salida = os.path.join(CARPETA_RESULTADOS, f"{fecha}_{commit or 'sin-commit'}.json")
+    with open(salida, "w", encoding="utf-8") as f:
+        json.dump(informe, f, indent=2, ensure_ascii=False)
+    print(f"\nResultados guardados en {salida}")
+
+if __name__ == "__main__":
+    main()
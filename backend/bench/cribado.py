@@ -0,0 +1,112 @@
+"""
+Benchmark del cribado de consumos (app/services/cribado.py) sobre datos
+sintéticos: por defecto 1.000.000 de medidores × 36 meses.
+
+Los lotes se generan al vuelo con la misma forma que produce
+paginas_consumos (una fila por lectura, ~2 % de lecturas ausentes), con
+estacionalidad y ruido, y un porcentaje de medidores con una fuga en el
+último mes. Mide el tiempo y la memoria máxima de cada configuración y la
+precisión y exhaustividad de posible_fuga respecto a las fugas inyectadas.
+
+Uso (desde la carpeta backend):
+    python -m bench.cribado
+    python -m bench.cribado --medidores 200000 --procesos 0 2 4 --formato npy parquet
+"""
+import os
+import time
+import shutil
+import resource
+import argparse
+import tempfile
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from app.services.cribado import ESCRITORES, cribar
+
+def lotes_sinteticos(medidores: int, periodos: int, medidores_lote: int, fugas: float,
+                     con_fuga: list | None = None, semilla: int = 7):
+    """Lotes (ids, columnas, valores) como los de paginas_consumos; los ids con fuga inyectada se añaden a ``con_fuga``."""
+    azar = np.random.default_rng(semilla)
+    # Estacionalidad: más consumo en los meses de verano (como bench/datos_ejemplo.py)
+    meses = (np.arange(periodos) - periodos) % 12
+    estacional = np.where(np.isin(meses, [0, 1, 2, 11]), 1.15, 0.925)
+    for primero in range(1, medidores + 1, medidores_lote):
+        ids = np.arange(primero, min(primero + medidores_lote, medidores + 1), dtype=np.int64)
+        base = azar.uniform(10, 30, size=(len(ids), 1))
+        matriz = base * estacional * azar.uniform(0.8, 1.2, size=(len(ids), periodos))
+        fuga = azar.random(len(ids)) < fugas
+        matriz[fuga, -1] *= azar.uniform(2, 4, size=int(fuga.sum()))
+        if con_fuga is not None:
+            con_fuga.append(ids[fuga])
+        presente = azar.random(matriz.shape) >= 0.02
+        filas, columnas = np.nonzero(presente)
+        yield ids[filas], columnas.astype(np.int16), np.round(matriz[presente], 2)
+
+def _memoria_mb(quien: int) -> float:
+    return resource.getrusage(quien).ru_maxrss / 1024  # Linux: KiB
+
+def ejecutar(args, procesos: int, formato: str) -> dict:
+    carpeta = tempfile.mkdtemp(prefix="cribado_")
+    salida = os.path.join(carpeta, "resultado.parquet" if formato == "parquet" else "resultado")
+    con_fuga = []
+    lotes = lotes_sinteticos(args.medidores, args.periodos, args.medidores_lote, args.fugas, con_fuga)
+    try:
+        escritor = ESCRITORES[formato](salida)
+        inicio = time.perf_counter()
+        if procesos > 0:
+            with ProcessPoolExecutor(max_workers=procesos) as pool:
+                resumen = cribar(lotes, escritor, args.periodos, pool, en_vuelo=2 * procesos)
+        else:
+            resumen = cribar(lotes, escritor, args.periodos)
+        segundos = time.perf_counter() - inicio
+
+        if formato == "npy":
+            ids = np.load(os.path.join(salida, "id_medidor.npy"), mmap_mode="r")
+            marcados = ids[np.load(os.path.join(salida, "posible_fuga.npy"), mmap_mode="r")]
+        else:
+            import pyarrow.parquet as pq
+            tabla = pq.read_table(salida, columns=["id_medidor", "posible_fuga"])
+            marcados = tabla.column("id_medidor").to_numpy()[tabla.column("posible_fuga").to_numpy()]
+        reales = np.concatenate(con_fuga)
+        aciertos = np.intersect1d(marcados, reales).size
+        tamano = sum(os.path.getsize(os.path.join(raiz, f)) for raiz, _, archivos in os.walk(carpeta) for f in archivos)
+    finally:
+        shutil.rmtree(carpeta, ignore_errors=True)
+
+    return {
+        "segundos": segundos,
+        "medidores_s": resumen["medidores"] / segundos,
+        "precision": aciertos / len(marcados) if len(marcados) else 0.0,
+        "exhaustividad": aciertos / len(reales) if len(reales) else 0.0,
+        "atipicos": resumen["atipicos"],
+        "salida_mb": tamano / 2**20,
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark del cribado de consumos con datos sintéticos")
+    parser.add_argument("--medidores", type=int, default=1_000_000)
+    parser.add_argument("--periodos", type=int, default=36)
+    parser.add_argument("--medidores-lote", type=int, default=20_000, help="Medidores por lote (≈ CRIBADO_FILAS_LOTE / periodos)")
+    parser.add_argument("--fugas", type=float, default=0.01, help="Fracción de medidores con fuga inyectada")
+    parser.add_argument("--procesos", type=int, nargs="+", default=[0, os.cpu_count() or 1])
+    parser.add_argument("--formato", nargs="+", choices=sorted(ESCRITORES), default=["npy"])
+    args = parser.parse_args()
+
+    inicio = time.perf_counter()
+    for _ in lotes_sinteticos(args.medidores, args.periodos, args.medidores_lote, args.fugas):
+        pass
+    print(f"{args.medidores} medidores × {args.periodos} meses (CPU: {os.cpu_count()}); "
+          f"generar los lotes: {time.perf_counter() - inicio:.2f} s (incluido abajo)")
+
+    for formato in args.formato:
+        for procesos in args.procesos:
+            r = ejecutar(args, procesos, formato)
+            print(f"  {formato:<8} procesos={procesos:<3} {r['segundos']:7.2f} s  {r['medidores_s']:>10,.0f} medidores/s  "
+                  f"atípicos={r['atipicos']:<7} precisión={r['precision']:.3f} exhaustividad={r['exhaustividad']:.3f}  "
+                  f"salida={r['salida_mb']:.1f} MB")
+    print(f"Memoria máxima: proceso principal {_memoria_mb(resource.RUSAGE_SELF):.0f} MB, "
+          f"procesos del pool {_memoria_mb(resource.RUSAGE_CHILDREN):.0f} MB")
+
+if __name__ == "__main__":
+    main()
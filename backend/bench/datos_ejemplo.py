@@ -0,0 +1,153 @@
+"""
+Datos de ejemplo para las mediciones y benchmarks del backend.
+
+Los clientes y contratos se leen de insert_clientes.sql e insert_contratos.sql
+(en la raíz del repositorio); medidores, facturas, consumos y solicitudes se
+generan de forma determinista con las columnas de esquema.sql.
+"""
+import os
+import re
+import random
+from datetime import date
+
+RAIZ_REPO = os.path.abspath(os.path.join(os.path.dirname(__file__), "..", ".."))
+
+def leer_insert(ruta: str) -> list[dict]:
+    """Filas de un archivo 'INSERT INTO tabla (columnas) VALUES (...), (...);'."""
+    with open(ruta, encoding="utf-8") as f:
+        texto = f.read()
+
+    columnas = [c.strip() for c in re.search(r"\(([^)]*)\)\s*VALUES", texto).group(1).split(",")]
+    valores = texto[texto.index("VALUES"):]
+    filas = []
+    for tupla in re.finditer(r"\(((?:'[^']*'|[^()'])*)\)\s*[,;]", valores):
+        campos = re.findall(r"'((?:[^']|'')*)'|(-?\d+(?:\.\d+)?)", tupla.group(1))
+        fila = {}
+        for columna, (texto_campo, numero) in zip(columnas, campos):
+            if numero:
+                fila[columna] = float(numero) if "." in numero else int(numero)
+            else:
+                fila[columna] = texto_campo.replace("''", "'")
+        filas.append(fila)
+    return filas
+
+def _mes_anterior(fecha: date, meses: int) -> date:
+    total = fecha.year * 12 + (fecha.month - 1) - meses
+    return date(total // 12, total % 12 + 1, 1)
+
+def generar_tablas(meses_facturas: int = 12, meses_consumos: int = 36, ultimo_periodo: date = date(2024, 12, 1),
+                   semilla: int = 42) -> dict[str, list[dict]]:
+    """Todas las tablas del esquema, con los clientes y contratos de ejemplo."""
+    azar = random.Random(semilla)
+    tablas = {"clientes": [], "contratos": [], "medidores": [], "facturas": [], "consumos": [], "solicitudes": []}
+
+    for id_cliente, fila in enumerate(leer_insert(os.path.join(RAIZ_REPO, "insert_clientes.sql")), start=1):
+        tablas["clientes"].append({"id_cliente": id_cliente, **fila})
+    for id_contrato, fila in enumerate(leer_insert(os.path.join(RAIZ_REPO, "insert_contratos.sql")), start=1):
+        tablas["contratos"].append({"id_contrato": id_contrato, **fila})
+
+    for contrato in tablas["contratos"]:
+        id_contrato = contrato["id_contrato"]
+        # Un medidor por contrato, con el formato que usa el frontend (MED00001)
+        tablas["medidores"].append({
+            "id_medidor": id_contrato,
+            "id_contrato": id_contrato,
+            "numero_medidor": f"MED{id_contrato:05d}",
+            "ubicacion": azar.choice(["Frente de la casa", "Patio trasero", "Lateral izquierdo", "Garaje"]),
+        })
+
+        base = azar.uniform(10, 30)
+        for k in range(meses_consumos):
+            periodo = _mes_anterior(ultimo_periodo, k)
+            estacional = 1 + 0.15 * (1 if periodo.month in (1, 2, 3, 12) else -0.5)
+            tablas["consumos"].append({
+                "id_consumo": len(tablas["consumos"]) + 1,
+                "id_medidor": id_contrato,
+                "periodo": periodo.isoformat(),
+                "consumo_metros_cubicos": round(base * estacional * azar.uniform(0.8, 1.2), 2),
+            })
+
+        for k in range(meses_facturas):
+            periodo = _mes_anterior(ultimo_periodo, k)
+            # Las más recientes suelen estar pendientes; las antiguas, pagadas o vencidas
+            estado = "Pendiente" if k == 0 else azar.choice(["Pagada", "Pagada", "Pagada", "Vencida"])
+            tablas["facturas"].append({
+                "id_factura": len(tablas["facturas"]) + 1,
+                "id_contrato": id_contrato,
+                "periodo": periodo.isoformat(),
+                "monto": round(base * azar.uniform(0.9, 1.4), 2),
+                "fecha_vencimiento": periodo.replace(day=28).isoformat(),
+                "estado_pago": estado,
+            })
+
+    for cliente in tablas["clientes"]:
+        for k in range(azar.randint(0, 4)):
+            tablas["solicitudes"].append({
+                "id_solicitud": len(tablas["solicitudes"]) + 1,
+                "id_cliente": cliente["id_cliente"],
+                "tipo_solicitud": azar.choice(["Reclamo por facturación", "Revisión de medidor", "Reporte de fuga"]),
+                "descripcion": "Solicitud generada para pruebas",
+                "fecha_solicitud": f"{_mes_anterior(ultimo_periodo, 3 * k).isoformat()}T10:00:00+00:00",
+                "estado_solicitud": azar.choice(["Abierta", "En Proceso", "Cerrada"]),
+            })
+
+    tablas["resumen_cuenta"] = resumen_cuenta_ejemplo(tablas)
+    return tablas
+
+def resumen_cuenta_ejemplo(tablas: dict) -> list[dict]:
+    """Las filas que mantiene migracion_resumen_cuenta.sql, una por contrato."""
+    facturas, consumos, medidores = {}, {}, {}
+    for f in tablas["facturas"]:
+        facturas.setdefault(f["id_contrato"], []).append(f)
+    for c in tablas["consumos"]:
+        consumos.setdefault(c["id_medidor"], []).append(c)
+    for m in sorted(tablas["medidores"], key=lambda m: m["id_medidor"], reverse=True):
+        medidores[m["id_contrato"]] = m["id_medidor"]
+
+    filas = []
+    for contrato in tablas["contratos"]:
+        propias = facturas.get(contrato["id_contrato"], [])
+        pendientes = sorted((f for f in propias if f["estado_pago"] == "Pendiente"), key=lambda f: f["fecha_vencimiento"])
+        vencidas = [f for f in propias if f["estado_pago"] == "Vencida"]
+        id_medidor = medidores.get(contrato["id_contrato"])
+        ultimos = sorted(consumos.get(id_medidor, []), key=lambda c: c["periodo"], reverse=True)[:12]
+        valores = [c["consumo_metros_cubicos"] for c in ultimos]
+        monto_pendiente = round(sum(f["monto"] for f in pendientes), 2)
+        monto_vencido = round(sum(f["monto"] for f in vencidas), 2)
+        filas.append({
+            "id_contrato": contrato["id_contrato"],
+            "id_cliente": contrato["id_cliente"],
+            "id_medidor": id_medidor,
+            "monto_pendiente": monto_pendiente,
+            "facturas_pendientes": len(pendientes),
+            "monto_vencido": monto_vencido,
+            "facturas_vencidas": len(vencidas),
+            "total_adeudado": round(monto_pendiente + monto_vencido, 2),
+            "proximo_vencimiento": pendientes[0]["fecha_vencimiento"] if pendientes else None,
+            "proximo_monto": pendientes[0]["monto"] if pendientes else None,
+            "proximo_periodo": pendientes[0]["periodo"] if pendientes else None,
+            "ultimo_consumo": valores[0] if valores else None,
+            "ultimo_periodo_consumo": ultimos[0]["periodo"] if ultimos else None,
+            "consumo_promedio_6": round(sum(valores[:6]) / len(valores[:6]), 2) if valores else None,
+            "consumo_promedio_12": round(sum(valores) / len(valores), 2) if valores else None,
+            "actualizado_en": "2024-12-01T00:00:00+00:00",
+        })
+    return filas
+
+def snapshot_ejemplo(tablas: dict, id_cliente: int, consumos: int = 36) -> dict:
+    """El diccionario que devolvería buscar_datos_cliente para un ID de cliente."""
+    cliente = next(c for c in tablas["clientes"] if c["id_cliente"] == id_cliente)
+    contrato = next((c for c in tablas["contratos"] if c["id_cliente"] == id_cliente and c["estado_servicio"] == "Activo"), None)
+    medidor = next((m for m in tablas["medidores"] if contrato and m["id_contrato"] == contrato["id_contrato"]), None)
+
+    def ultimos(filas, columna, n):
+        return sorted(filas, key=lambda f: f[columna], reverse=True)[:n]
+
+    return {
+        "cliente": cliente,
+        "contrato": contrato,
+        "medidor": medidor,
+        "facturas": ultimos([f for f in tablas["facturas"] if contrato and f["id_contrato"] == contrato["id_contrato"]], "periodo", 5),
+        "consumos": ultimos([c for c in tablas["consumos"] if medidor and c["id_medidor"] == medidor["id_medidor"]], "periodo", consumos),
+        "solicitudes": ultimos([s for s in tablas["solicitudes"] if s["id_cliente"] == id_cliente], "fecha_solicitud", 3),
+    }
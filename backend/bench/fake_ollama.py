@@ -0,0 +1,147 @@
+"""
+Servidor que imita la API de Ollama (/api/generate) y la de un servidor
+compatible con OpenAI como llama.cpp (/v1/completions) para los benchmarks,
+sin modelo ni GPU.
+
+Genera respuestas de relleno con una latencia configurable:
+    BENCH_OLLAMA_TTFT_MS     tiempo hasta el primer token (incluye evaluar el prompt), por defecto 300
+    BENCH_OLLAMA_TOKENS_S    velocidad de generación en tokens por segundo, por defecto 40
+    BENCH_OLLAMA_TOKENS      tokens por respuesta, por defecto 60
+    BENCH_OLLAMA_PARALELO    generaciones simultáneas (como OLLAMA_NUM_PARALLEL), por defecto 2;
+                             el resto espera su turno igual que en el servidor real
+
+Con /v1/completions una petición puede traer una lista de prompts (un
+lote); se generan a la vez y cada uno ocupa su ranura.
+
+Uso (desde la carpeta backend):
+    uvicorn bench.fake_ollama:app --port 11434
+"""
+import os
+import json
+import time
+import asyncio
+
+from fastapi import FastAPI
+from fastapi.responses import StreamingResponse
+
+TTFT_MS = float(os.environ.get("BENCH_OLLAMA_TTFT_MS", "300"))
+TOKENS_POR_SEGUNDO = float(os.environ.get("BENCH_OLLAMA_TOKENS_S", "40"))
+TOKENS_RESPUESTA = int(os.environ.get("BENCH_OLLAMA_TOKENS", "60"))
+PARALELO = int(os.environ.get("BENCH_OLLAMA_PARALELO", "2"))
+
+PALABRAS = ["Según ", "sus ", "datos, ", "el ", "saldo ", "pendiente ", "es ", "de ", "$25.40 ", "y ", "vence ", "pronto. "]
+
+app = FastAPI(title="Ollama simulado")
+_ranuras: asyncio.Semaphore | None = None
+
+def _semaforo() -> asyncio.Semaphore:
+    # Se crea dentro del event loop de uvicorn
+    global _ranuras
+    if _ranuras is None:
+        _ranuras = asyncio.Semaphore(PARALELO)
+    return _ranuras
+
+def _fragmento_final(prompt: str, carga_ns: int, eval_ns: int) -> dict:
+    return {
+        "model": "simulado",
+        "response": "",
+        "done": True,
+        "prompt_eval_count": len(prompt) // 4,
+        "eval_count": TOKENS_RESPUESTA,
+        "eval_duration": eval_ns,
+        "load_duration": carga_ns,
+        "total_duration": carga_ns + eval_ns,
+    }
+
+async def _generar(prompt: str):
+    """Produce los fragmentos de una generación, ocupando una ranura mientras dura."""
+    async with _semaforo():
+        inicio = time.perf_counter_ns()
+        await asyncio.sleep(TTFT_MS / 1000)
+        carga_ns = time.perf_counter_ns() - inicio
+        for i in range(TOKENS_RESPUESTA):
+            if i:
+                await asyncio.sleep(1 / TOKENS_POR_SEGUNDO)
+            yield {"model": "simulado", "response": PALABRAS[i % len(PALABRAS)], "done": False}
+        yield _fragmento_final(prompt, carga_ns, time.perf_counter_ns() - inicio - carga_ns)
+
+@app.get("/")
+def raiz():
+    return "Ollama is running"
+
+@app.get("/api/tags")
+def modelos():
+    return {"models": [{"name": os.environ.get("OLLAMA_MODEL", "gemma3:latest")}]}
+
+@app.get("/api/ps")
+def modelos_cargados():
+    return modelos()
+
+@app.post("/api/generate")
+async def generar(cuerpo: dict):
+    prompt = cuerpo.get("prompt", "")
+    if not prompt:
+        # Sin prompt Ollama solo carga el modelo (y ajusta keep_alive)
+        return {"model": cuerpo.get("model", "simulado"), "response": "", "done": True, "done_reason": "load"}
+
+    if not cuerpo.get("stream", True):
+        partes, final = [], {}
+        async for fragmento in _generar(prompt):
+            partes.append(fragmento["response"])
+            final = fragmento
+        return {**final, "response": "".join(partes)}
+
+    async def ndjson():
+        async for fragmento in _generar(prompt):
+            yield json.dumps(fragmento) + "\n"
+
+    return StreamingResponse(ndjson(), media_type="application/x-ndjson")
+
+# =================== API COMPATIBLE CON OPENAI ===================
+
+@app.get("/v1/models")
+def modelos_openai():
+    return {"object": "list", "data": [{"id": os.environ.get("OPENAI_MODEL", os.environ.get("OLLAMA_MODEL", "gemma3:latest")), "object": "model"}]}
+
+def _timings(final: dict) -> dict:
+    # Los mismos campos que añade llama-server a sus respuestas
+    return {"prompt_n": final["prompt_eval_count"], "predicted_n": final["eval_count"], "predicted_ms": final["eval_duration"] / 1e6}
+
+async def _completar(prompt: str) -> tuple[str, dict]:
+    partes, final = [], {}
+    async for fragmento in _generar(prompt):
+        partes.append(fragmento["response"])
+        final = fragmento
+    return "".join(partes), final
+
+@app.post("/v1/completions")
+async def completar(cuerpo: dict):
+    prompts = cuerpo.get("prompt", "")
+    lista = prompts if isinstance(prompts, list) else [prompts]
+
+    if not cuerpo.get("stream"):
+        resultados = await asyncio.gather(*(_completar(p) for p in lista))
+        uso = {
+            "prompt_tokens": sum(f["prompt_eval_count"] for _, f in resultados),
+            "completion_tokens": sum(f["eval_count"] for _, f in resultados),
+        }
+        respuesta = {
+            "object": "text_completion",
+            "model": cuerpo.get("model"),
+            "choices": [{"index": i, "text": texto, "finish_reason": "length"} for i, (texto, _) in enumerate(resultados)],
+            "usage": uso,
+        }
+        if len(resultados) == 1:
+            respuesta["timings"] = _timings(resultados[0][1])
+        return respuesta
+
+    async def sse():
+        async for fragmento in _generar(lista[0]):
+            if fragmento.get("done"):
+                yield "data: " + json.dumps({"choices": [{"index": 0, "text": "", "finish_reason": "length"}], "timings": _timings(fragmento)}) + "\n\n"
+                yield "data: " + json.dumps({"choices": [], "usage": {"prompt_tokens": fragmento["prompt_eval_count"], "completion_tokens": fragmento["eval_count"]}}) + "\n\n"
+            else:
+                yield "data: " + json.dumps({"choices": [{"index": 0, "text": fragmento["response"], "finish_reason": None}]}) + "\n\n"
+        yield "data: [DONE]\n\n"
+
+    return StreamingResponse(sse(), media_type="text/event-stream")
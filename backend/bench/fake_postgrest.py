@@ -0,0 +1,198 @@
+"""
+Servidor que imita la API REST de Supabase (PostgREST) para los benchmarks.
+
+Sirve en memoria las tablas de bench/datos_ejemplo.py (clientes y contratos
+de insert_clientes.sql / insert_contratos.sql) con el subconjunto de
+PostgREST que usa el backend: select con recursos embebidos, filtros eq/neq/
+gt/gte/lt/lte/in, filtros sobre recursos embebidos, order, limit, offset,
+inserciones y la función obtener_snapshot_cliente por RPC.
+
+    BENCH_SUPABASE_RTT_MS    latencia añadida a cada petición, por defecto 20
+
+Uso (desde la carpeta backend):
+    uvicorn bench.fake_postgrest:app --port 54321
+y en el backend SUPABASE_URL=http://127.0.0.1:54321 y cualquier SUPABASE_KEY.
+"""
+import os
+import re
+import asyncio
+
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse
+
+from app.services.identificadores import clasificar_identificador
+from bench.datos_ejemplo import generar_tablas, snapshot_ejemplo
+
+RTT_MS = float(os.environ.get("BENCH_SUPABASE_RTT_MS", "20"))
+
+# Clave primaria de cada tabla; una columna con ese nombre en otra tabla es su clave foránea
+CLAVES = {
+    "clientes": "id_cliente",
+    "contratos": "id_contrato",
+    "medidores": "id_medidor",
+    "facturas": "id_factura",
+    "consumos": "id_consumo",
+    "solicitudes": "id_solicitud",
+    "conversaciones": "id",
+    "resumen_cuenta": "id_contrato",
+}
+
+TABLAS = {tabla: [] for tabla in CLAVES}
+TABLAS.update(generar_tablas())
+
+app = FastAPI(title="PostgREST simulado")
+
+def _partir_select(select: str) -> list[str]:
+    """Separa 'a,b,tabla(c,d)' por las comas de primer nivel."""
+    partes, profundidad, actual = [], 0, ""
+    for caracter in select:
+        if caracter == "(":
+            profundidad += 1
+        elif caracter == ")":
+            profundidad -= 1
+        if caracter == "," and profundidad == 0:
+            partes.append(actual.strip())
+            actual = ""
+        else:
+            actual += caracter
+    if actual.strip():
+        partes.append(actual.strip())
+    return partes
+
+def _convertir(valor, texto: str):
+    """Convierte el texto del filtro al tipo de la columna para comparar."""
+    if isinstance(valor, bool):
+        return texto == "true"
+    if isinstance(valor, (int, float)):
+        return type(valor)(texto)
+    return texto
+
+def _filtrar(filas: list[dict], columna: str, expresion: str) -> list[dict]:
+    operador, _, texto = expresion.partition(".")
+
+    def cumple(valor) -> bool:
+        if valor is None:
+            return operador == "is" and texto == "null"
+        if operador == "in":
+            return str(valor) in texto.strip("()").split(",")
+        objetivo = _convertir(valor, texto)
+        return {
+            "eq": valor == objetivo,
+            "neq": valor != objetivo,
+            "gt": valor > objetivo,
+            "gte": valor >= objetivo,
+            "lt": valor < objetivo,
+            "lte": valor <= objetivo,
+        }.get(operador, True)
+
+    return [fila for fila in filas if cumple(fila.get(columna))]
+
+def _proyectar(tabla: str, fila: dict, select: str, filtros_embebidos: dict) -> dict:
+    resultado = {}
+    for parte in _partir_select(select):
+        embebido = re.match(r"(\w+)(?:!\w+)?\((.*)\)$", parte, re.S)
+        if embebido:
+            hija, sub_select = embebido.groups()
+            clave_hija = CLAVES[hija]
+            if clave_hija in fila:
+                # Muchos a uno (medidores -> contratos): un objeto o null
+                candidatas = [h for h in TABLAS[hija] if h[clave_hija] == fila[clave_hija]]
+                resultado[hija] = _proyectar(hija, candidatas[0], sub_select, filtros_embebidos) if candidatas else None
+            else:
+                # Uno a muchos (clientes -> contratos): una lista, con sus filtros
+                candidatas = [h for h in TABLAS[hija] if h.get(CLAVES[tabla]) == fila[CLAVES[tabla]]]
+                for columna, expresion in filtros_embebidos.get(hija, []):
+                    candidatas = _filtrar(candidatas, columna, expresion)
+                resultado[hija] = [_proyectar(hija, h, sub_select, filtros_embebidos) for h in candidatas]
+        elif parte == "*":
+            resultado.update(fila)
+        else:
+            resultado[parte.strip()] = fila.get(parte.strip())
+    return resultado
+
+def _ordenar(filas: list[dict], orden: str) -> list[dict]:
+    for criterio in reversed(orden.split(",")):
+        columna, *modificadores = criterio.split(".")
+        filas.sort(key=lambda f: (f.get(columna) is None, f.get(columna)), reverse="desc" in modificadores)
+    return filas
+
+@app.get("/rest/v1/{tabla}")
+async def leer(tabla: str, request: Request):
+    await asyncio.sleep(RTT_MS / 1000)
+    filas = list(TABLAS.get(tabla, []))
+    select, orden, limite, desde, filtros_embebidos = "*", None, None, 0, {}
+
+    for parametro, valor in request.query_params.multi_items():
+        if parametro == "select":
+            select = valor
+        elif parametro == "order":
+            orden = valor
+        elif parametro == "limit":
+            limite = int(valor)
+        elif parametro == "offset":
+            desde = int(valor)
+        elif "." in parametro:
+            hija, columna = parametro.split(".", 1)
+            filtros_embebidos.setdefault(hija, []).append((columna, valor))
+        else:
+            filas = _filtrar(filas, parametro, valor)
+
+    if orden:
+        filas = _ordenar(filas, orden)
+    filas = filas[desde:desde + limite if limite is not None else None]
+    return [_proyectar(tabla, fila, select, filtros_embebidos) for fila in filas]
+
+@app.post("/rest/v1/{tabla}")
+async def insertar(tabla: str, request: Request):
+    await asyncio.sleep(RTT_MS / 1000)
+    cuerpo = await request.json()
+    filas = TABLAS.setdefault(tabla, [])
+    for fila in cuerpo if isinstance(cuerpo, list) else [cuerpo]:
+        filas.append({CLAVES.get(tabla, "id"): len(filas) + 1, **fila})
+    return JSONResponse([], status_code=201)
+
+def _snapshot(identificador: str, consumos: int = 36) -> dict:
+    """Lo mismo que devuelve la función SQL obtener_snapshot_cliente."""
+    vacio = {"cliente": None, "contrato": None, "medidor": None, "facturas": [], "consumos": [], "solicitudes": []}
+    tipo, valor = clasificar_identificador(identificador)
+    numero_medidor = identificador.strip()
+    cliente = None
+    if tipo == "cedula":
+        cliente = next((c for c in TABLAS["clientes"] if c["numero_identificacion_personal"] == valor), None)
+    elif tipo == "cliente":
+        cliente = next((c for c in TABLAS["clientes"] if c["id_cliente"] == int(valor)), None)
+    elif tipo == "factura":
+        factura = next((f for f in TABLAS["facturas"] if f["id_factura"] == int(valor)), None)
+        medidor = factura and next((m for m in TABLAS["medidores"] if m["id_contrato"] == factura["id_contrato"]), None)
+        if factura:
+            numero_medidor = medidor["numero_medidor"] if medidor else None
+
+    if cliente:
+        return snapshot_ejemplo(TABLAS, cliente["id_cliente"], consumos)
+
+    # Por número de medidor (también si el formato no correspondía a nadie): su contrato, aunque no sea el activo
+    medidor = next((m for m in TABLAS["medidores"] if m["numero_medidor"] == numero_medidor), None)
+    if medidor is None:
+        return vacio
+    contrato = next(c for c in TABLAS["contratos"] if c["id_contrato"] == medidor["id_contrato"])
+    cliente = next(c for c in TABLAS["clientes"] if c["id_cliente"] == contrato["id_cliente"])
+
+    def ultimos(filas, columna, n):
+        return sorted(filas, key=lambda f: f[columna], reverse=True)[:n]
+
+    return {
+        "cliente": cliente,
+        "contrato": contrato,
+        "medidor": medidor,
+        "facturas": ultimos([f for f in TABLAS["facturas"] if f["id_contrato"] == contrato["id_contrato"]], "periodo", 5),
+        "consumos": ultimos([c for c in TABLAS["consumos"] if c["id_medidor"] == medidor["id_medidor"]], "periodo", consumos),
+        "solicitudes": ultimos([s for s in TABLAS["solicitudes"] if s["id_cliente"] == cliente["id_cliente"]], "fecha_solicitud", 3),
+    }
+
+@app.post("/rest/v1/rpc/{funcion}")
+async def rpc(funcion: str, request: Request):
+    await asyncio.sleep(RTT_MS / 1000)
+    argumentos = await request.json()
+    if funcion == "obtener_snapshot_cliente":
+        return _snapshot(argumentos["p_identificador"], argumentos.get("p_consumos", 36))
+    return JSONResponse({"message": f"Could not find the function public.{funcion}"}, status_code=404)
@@ -0,0 +1,71 @@
+"""
+Compara el tamaño del prompt con el formato anterior (JSON con sangría y el
+historial antes de los datos) y con el formato compacto actual, sobre los
+clientes de ejemplo con contrato activo.
+
+Uso (desde la carpeta backend):
+    python -m bench.medir_prompt
+"""
+import os
+import json
+import statistics
+
+from app.models.schemas import MessageHistory
+from app.services.historial import contar_tokens
+from app.services.llm import construir_prompt
+from bench.datos_ejemplo import generar_tablas, snapshot_ejemplo
+
+def prompt_anterior(pregunta: str, datos_cliente: dict, historial: list) -> str:
+    """Formato previo: JSON completo con indent=2 y el historial antes de los datos."""
+    historial_str = "".join(f"Usuario: {h.pregunta}\nAquaBot: {h.respuesta}\n" for h in historial)
+    return (
+        "Eres un asistente virtual de atención al cliente para una empresa de agua potable. "
+        "Tu nombre es AquaBot. Eres amable, servicial y muy preciso. "
+        "Usa SOLAMENTE la información proporcionada y el historial de la conversación para responder a la pregunta del cliente. "
+        "No inventes información. Si la respuesta no está en los datos, indica amablemente que no tienes esa información. "
+        "Dirígete al cliente por su nombre de pila (si está disponible). Responde en español.\n\n"
+        "Los datos devueltos deben estar organizados de manera legible y clara\n\n"
+        "si la respuesta de la base de datos es un json,transformalo y organizalo como texto plano para que se muestre de manera legible.\n\n"
+        f"--- INICIO HISTORIAL DE CONVERSACIÓN ---\n{historial_str}\n--- FIN HISTORIAL DE CONVERSACIÓN ---\n\n"
+        f"--- INICIO DE DATOS DEL CLIENTE ---\n{json.dumps(datos_cliente, indent=2, default=str)}\n--- FIN DE DATOS DEL CLIENTE ---\n\n"
+        f"Pregunta actual: {pregunta}\nRespuesta:"
+    )
+
+def prefijo_comun(a: str, b: str) -> int:
+    """Caracteres iniciales idénticos entre dos prompts consecutivos."""
+    return len(os.path.commonprefix([a, b]))
+
+def main():
+    tablas = generar_tablas()
+    ids = [c["id_cliente"] for c in tablas["contratos"] if c["estado_servicio"] == "Activo"]
+    pregunta = "¿Cuánto debo y cuándo vence mi próxima factura?"
+    historial = [
+        MessageHistory(pregunta="¿Cuál es mi consumo actual?", respuesta="Su consumo del último periodo fue de 18.4 m³."),
+        MessageHistory(pregunta="¿Es normal?", respuesta="Sí, está dentro de su promedio de los últimos meses."),
+    ]
+
+    antes, despues, reutilizable_antes, reutilizable_despues = [], [], [], []
+    for id_cliente in ids:
+        datos = snapshot_ejemplo(tablas, id_cliente)
+        antes.append(contar_tokens(prompt_anterior(pregunta, datos, [])))
+        despues.append(contar_tokens(construir_prompt(pregunta, datos, [])))
+
+        # Segundo turno de la conversación: ¿qué parte del prompt repite el prefijo del primero?
+        turno1_antes, turno2_antes = prompt_anterior(pregunta, datos, historial[:1]), prompt_anterior(pregunta, datos, historial)
+        turno1, turno2 = construir_prompt(pregunta, datos, historial[:1]), construir_prompt(pregunta, datos, historial)
+        reutilizable_antes.append(prefijo_comun(turno1_antes, turno2_antes) / len(turno2_antes))
+        reutilizable_despues.append(prefijo_comun(turno1, turno2) / len(turno2))
+
+    media_antes, media_despues = statistics.mean(antes), statistics.mean(despues)
+    resultado = {
+        "clientes": len(ids),
+        "tokens_prompt_anterior": round(media_antes, 1),
+        "tokens_prompt_compacto": round(media_despues, 1),
+        "reduccion_pct": round(100 * (1 - media_despues / media_antes), 1),
+        "prefijo_reutilizable_anterior_pct": round(100 * statistics.mean(reutilizable_antes), 1),
+        "prefijo_reutilizable_compacto_pct": round(100 * statistics.mean(reutilizable_despues), 1),
+    }
+    print(json.dumps(resultado, indent=2, ensure_ascii=False))
+
+if __name__ == "__main__":
+    main()
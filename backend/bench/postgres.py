@@ -0,0 +1,177 @@
+"""
+Benchmark de los dos accesos a datos de database.py: la API REST de
+Supabase (supabase-py, una petición HTTP por consulta en un hilo) y
+PostgreSQL directo con asyncpg (DB_BACKEND=postgres, una sentencia preparada
+por snapshot).
+
+Mide la carga de snapshots de buscar_datos_cliente sin la caché de clientes,
+con ``--concurrencia`` cargas simultáneas:
+
+    resolucion  el identificador se resuelve con una consulta (índice vacío)
+    indice      el índice de identificadores ya conoce la ubicación
+    resumen     obtener_resumen_cuenta (requiere migracion_resumen_cuenta.sql)
+
+La base de datos de DATABASE_URL debe tener esquema.sql aplicado; con
+--cargar se vacían sus tablas y se cargan los datos de bench/datos_ejemplo.py
+(los mismos que sirve el PostgREST simulado), así que úsese una base de
+pruebas. Sin --supabase-url se arranca bench/fake_postgrest.py sin latencia
+añadida: la ruta REST paga HTTP, JSON e hilos pero no el trabajo de la base
+de datos, por lo que su resultado es una cota inferior. Con un PostgREST
+real sobre la misma base (p. ej. el de ``supabase start``), pásese su URL.
+
+Uso (desde la carpeta backend, con asyncpg instalado):
+    python -m bench.postgres --database-url postgresql://postgres@localhost/aquallm --cargar
+    python -m bench.postgres --supabase-url http://127.0.0.1:54321 --supabase-key ... --concurrencia 1 8 32
+"""
+import os
+import sys
+import json
+import time
+import random
+import asyncio
+import argparse
+
+from bench.carga import _esperar_servidor, _uvicorn, _resumen_ms
+from bench.datos_ejemplo import RAIZ_REPO, generar_tablas
+
+# Tablas que se cargan con --cargar y su clave primaria
+TABLAS = {
+    "clientes": "id_cliente",
+    "contratos": "id_contrato",
+    "medidores": "id_medidor",
+    "facturas": "id_factura",
+    "consumos": "id_consumo",
+    "solicitudes": "id_solicitud",
+}
+
+def identificadores(tablas: dict, semilla: int = 42) -> list[str]:
+    """Mezcla de todos los tipos de identificador: ID de cliente, cédula, medidor y factura."""
+    ids = [str(c["id_cliente"]) for c in tablas["clientes"]]
+    ids += [c["numero_identificacion_personal"] for c in tablas["clientes"] if c.get("numero_identificacion_personal")]
+    ids += [m["numero_medidor"] for m in tablas["medidores"]]
+    ids += [f"FAC-{f['id_factura']}" for f in random.Random(semilla).sample(tablas["facturas"], len(tablas["medidores"]))]
+    return ids
+
+async def cargar_datos(dsn: str, tablas: dict):
+    """Vacía las tablas del esquema y carga los datos de ejemplo (los triggers de resumen_cuenta se disparan)."""
+    import asyncpg
+    conexion = await asyncpg.connect(dsn)
+    try:
+        with open(os.path.join(RAIZ_REPO, "esquema.sql"), encoding="utf-8") as f:
+            await conexion.execute(f.read())
+        async with conexion.transaction():
+            await conexion.execute(f"TRUNCATE {', '.join(TABLAS)} RESTART IDENTITY CASCADE")
+            for tabla, clave in TABLAS.items():
+                await conexion.execute(
+                    f"INSERT INTO {tabla} SELECT * FROM jsonb_populate_recordset(NULL::{tabla}, $1::jsonb)",
+                    json.dumps(tablas[tabla]))
+                await conexion.execute(f"SELECT setval(pg_get_serial_sequence('{tabla}', '{clave}'), max({clave})) FROM {tabla}")
+        await conexion.execute("ANALYZE")
+    finally:
+        await conexion.close()
+
+async def medir(operacion, ids: list[str], peticiones: int, concurrencia: int, semilla: int) -> dict:
+    """Lanza ``peticiones`` llamadas a ``operacion(identificador)`` con ``concurrencia`` simultáneas."""
+    azar = random.Random(semilla)
+    pendientes = iter(range(peticiones))
+    latencias, errores = [], 0
+
+    async def trabajador():
+        nonlocal errores
+        for _ in pendientes:
+            identificador = azar.choice(ids)
+            inicio = time.perf_counter()
+            resultado = await operacion(identificador)
+            latencias.append(time.perf_counter() - inicio)
+            errores += bool(resultado.get("error"))
+
+    inicio = time.perf_counter()
+    await asyncio.gather(*(trabajador() for _ in range(concurrencia)))
+    duracion = time.perf_counter() - inicio
+    return {"ops_s": peticiones / duracion, "errores": errores, "latencia_ms": _resumen_ms(latencias)}
+
+async def ejecutar(args, ids: list[str]) -> list[dict]:
+    # La configuración de database.py se lee al importarla
+    from app.services import database
+    from app.services.identificadores import IndiceIdentificadores
+
+    await database.conexion_supabase.abrir()
+    await database.conexion_postgres.abrir()
+    if not database.conexion_postgres.estadisticas()["conectado"]:
+        sys.exit(f"No se pudo conectar a PostgreSQL: {database.conexion_postgres.ultimo_error}")
+    if database.conexion_supabase.obtener() is None:
+        sys.exit(f"No se pudo crear el cliente de Supabase: {database.conexion_supabase.ultimo_error}")
+
+    # Sin pasar por las cachés de snapshots y de resúmenes
+    operaciones = {
+        "resolucion": database._cargar_datos_cliente,
+        "indice": database._cargar_datos_cliente,
+        "resumen": lambda i: database._cargar_resumen_cuenta(i, None),
+    }
+    resultados = []
+    try:
+        for backend in args.backends:
+            # Mismo cambio de backend que hace DB_BACKEND al arrancar
+            database.USAR_POSTGRES = backend == "postgres"
+            database.conexion_bd = database.conexion_postgres if database.USAR_POSTGRES else database.conexion_supabase
+            for escenario in args.escenarios:
+                indice = IndiceIdentificadores(database._pagina_medidores, max_entradas=0 if escenario == "resolucion" else 200_000)
+                if escenario != "resolucion":
+                    await indice._refrescar()
+                database.indice_identificadores = indice
+                for concurrencia in args.concurrencia:
+                    operacion = operaciones[escenario]
+                    await medir(operacion, ids, args.calentamiento, concurrencia, args.semilla)
+                    r = await medir(operacion, ids, args.peticiones, concurrencia, args.semilla)
+                    resultados.append({"backend": backend, "escenario": escenario, "concurrencia": concurrencia, **r})
+                    lat = r["latencia_ms"]
+                    print(f"  {backend:<9} {escenario:<11} c={concurrencia:<3} {r['ops_s']:8.0f} ops/s  "
+                          f"p50={lat['p50']:6.1f} ms  p95={lat['p95']:6.1f} ms  p99={lat['p99']:6.1f} ms  errores={r['errores']}")
+    finally:
+        await database.conexion_postgres.cerrar()
+        await database.conexion_supabase.cerrar()
+    return resultados
+
+def main():
+    parser = argparse.ArgumentParser(description="Snapshots de clientes: API REST de Supabase frente a asyncpg")
+    parser.add_argument("--database-url", default=os.environ.get("DATABASE_URL"), help="PostgreSQL para asyncpg (por defecto DATABASE_URL)")
+    parser.add_argument("--supabase-url", help="PostgREST sobre la misma base; por defecto se arranca el simulado")
+    parser.add_argument("--supabase-key", default=os.environ.get("SUPABASE_KEY", "bench"))
+    parser.add_argument("--puerto", type=int, default=54330, help="Puerto del PostgREST simulado")
+    parser.add_argument("--cargar", action="store_true", help="Vacía las tablas de DATABASE_URL y carga los datos de ejemplo")
+    parser.add_argument("--backends", nargs="+", choices=["supabase", "postgres"], default=["supabase", "postgres"])
+    parser.add_argument("--escenarios", nargs="+", choices=["resolucion", "indice", "resumen"], default=["resolucion", "indice"])
+    parser.add_argument("--concurrencia", type=int, nargs="+", default=[1, 16])
+    parser.add_argument("--peticiones", type=int, default=2000, help="Cargas por escenario y concurrencia")
+    parser.add_argument("--calentamiento", type=int, default=100, help="Cargas previas sin medir")
+    parser.add_argument("--semilla", type=int, default=42)
+    args = parser.parse_args()
+    if not args.database_url:
+        parser.error("indique --database-url o DATABASE_URL")
+
+    tablas = generar_tablas()
+    if args.cargar:
+        asyncio.run(cargar_datos(args.database_url, tablas))
+
+    procesos = []
+    if not args.supabase_url:
+        args.supabase_url = f"http://127.0.0.1:{args.puerto}"
+        procesos.append(_uvicorn("bench.fake_postgrest:app", args.puerto, {"BENCH_SUPABASE_RTT_MS": "0"}))
+        _esperar_servidor(f"{args.supabase_url}/rest/v1/clientes?limit=1")
+
+    os.environ.update({
+        "SUPABASE_URL": args.supabase_url,
+        "SUPABASE_KEY": args.supabase_key,
+        "DATABASE_URL": args.database_url,
+        "DB_POOL_MAX": str(max(args.concurrencia)),
+    })
+    print(f"Base de datos: {args.database_url}  PostgREST: {args.supabase_url}  CPU: {os.cpu_count()}  "
+          f"({args.peticiones} cargas por fila)")
+    try:
+        asyncio.run(ejecutar(args, identificadores(tablas)))
+    finally:
+        for proceso in procesos:
+            proceso.terminate()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,101 @@
+import numpy as np
+import pytest
+
+from app.services import analitica
+from app.services.analitica import (
+    MOTIVO_IQR, MOTIVO_NORMAL, MOTIVO_TOLERANCIA, MOTIVO_Z,
+    analizar_consumos, medias_moviles, puntuar_matriz,
+)
+
+def matriz_con_huecos(filas: int = 200, meses: int = 37, semilla: int = 7) -> np.ndarray:
+    """Series con historias de distinto largo (NaN al principio) y meses sueltos sin lectura."""
+    azar = np.random.default_rng(semilla)
+    valores = azar.gamma(shape=4.0, scale=5.0, size=(filas, meses))
+    for fila, inicio in enumerate(azar.integers(0, meses - 1, size=filas)):
+        valores[fila, :inicio] = np.nan
+    huecos = azar.random((filas, meses - 1)) < 0.1
+    valores[:, :-1][huecos] = np.nan
+    return valores
+
+def referencia_fila(fila: np.ndarray) -> dict:
+    """Las mismas estadísticas calculadas fila a fila con las funciones de NumPy."""
+    historia = fila[:-1][~np.isnan(fila[:-1])]
+    resultado = {"lecturas": len(historia), "media": np.nan, "z_score": np.nan,
+                 "limite_iqr_inferior": np.nan, "limite_iqr_superior": np.nan}
+    if len(historia):
+        resultado["media"] = historia.mean()
+    if len(historia) >= analitica.ANALITICA_MIN_HISTORIA:
+        desviacion = historia.std(ddof=1)
+        resultado["z_score"] = (fila[-1] - historia.mean()) / desviacion if desviacion > 0 else 0.0
+        q1, q3 = np.percentile(historia, [25, 75])
+        resultado["limite_iqr_inferior"] = q1 - 1.5 * (q3 - q1)
+        resultado["limite_iqr_superior"] = q3 + 1.5 * (q3 - q1)
+    mismo_mes = fila[-13::-12]
+    mismo_mes = mismo_mes[~np.isnan(mismo_mes)]
+    resultado["linea_base_estacional"] = mismo_mes.mean() if len(mismo_mes) else np.nan
+    return resultado
+
+def test_puntuar_matriz_coincide_con_numpy_fila_a_fila():
+    valores = matriz_con_huecos()
+    puntuacion = puntuar_matriz(valores)
+
+    for i, fila in enumerate(valores):
+        esperado = referencia_fila(fila)
+        for clave, valor in esperado.items():
+            np.testing.assert_allclose(puntuacion[clave][i], valor, rtol=1e-9, equal_nan=True, err_msg=f"fila {i}, {clave}")
+
+def test_puntuar_matriz_no_depende_de_las_demas_filas():
+    valores = matriz_con_huecos(filas=20)
+    juntas = puntuar_matriz(valores)
+    for i in range(len(valores)):
+        sola = puntuar_matriz(valores[i:i + 1])
+        for clave in juntas:
+            np.testing.assert_array_equal(sola[clave][0], juntas[clave][i])
+
+def test_motivos_de_consumo_atipico():
+    historia = [20.0, 21.0, 19.0, 20.0, 22.0, 18.0, 20.0, 21.0]
+    valores = np.array([
+        historia + [20.5],  # Normal
+        historia + [60.0],  # Pico: z-score
+        [np.nan] * 6 + [20.0, 20.0, 35.0],  # Poca historia: tolerancia sobre el promedio
+        [np.nan] * 6 + [20.0, 20.0, 22.0],  # Poca historia, dentro de la tolerancia
+        [np.nan] * 9,  # Medidor sin lecturas
+    ])
+    motivo = puntuar_matriz(valores)["motivo"]
+    assert motivo.tolist() == [MOTIVO_NORMAL, MOTIVO_Z, MOTIVO_TOLERANCIA, MOTIVO_NORMAL, MOTIVO_NORMAL]
+
+def test_fuera_del_rango_intercuartilico_sin_superar_el_z_score():
+    # Historia con un valor extremo que infla la desviación, pero no el IQR
+    fila = np.array([[10.0, 10.0, 10.0, 10.0, 10.0, 10.0, 10.0, 10.0, 200.0, 15.0]])
+    puntuacion = puntuar_matriz(fila)
+    assert abs(puntuacion["z_score"][0]) < analitica.ANALITICA_Z_UMBRAL
+    assert puntuacion["motivo"][0] == MOTIVO_IQR
+
+def test_el_consumo_estacional_no_se_marca():
+    # Cada enero se consume el triple: el pico de este enero es lo habitual
+    anio = [20.0] * 12
+    anio[0] = 60.0
+    fila = np.array([anio * 2 + [60.0]])
+    puntuacion = puntuar_matriz(fila)
+    assert puntuacion["linea_base_estacional"][0] == 60.0
+    assert puntuacion["motivo"][0] == MOTIVO_NORMAL
+
+def test_medias_moviles():
+    valores = np.arange(1.0, 8.0)
+    np.testing.assert_allclose(medias_moviles(valores, 3), np.convolve(valores, np.ones(3) / 3, mode="valid"))
+    assert len(medias_moviles(valores, 12)) == 0
+
+def test_analizar_consumos_ordena_y_deja_huecos_en_los_meses_sin_lectura():
+    consumos = [
+        {"periodo": "2024-03-01", "consumo_metros_cubicos": 30},
+        {"periodo": "2024-01-01", "consumo_metros_cubicos": 20},
+        {"periodo": "2024-04-01", "consumo_metros_cubicos": 15},  # Falta febrero
+    ]
+    analisis = analizar_consumos(consumos)
+    assert analisis.periodos == ("2024-01-01", "2024-03-01", "2024-04-01")
+    assert (analisis.actual, analisis.anterior, analisis.delta_mensual) == (15.0, 30.0, -15.0)
+    assert analisis.delta_porcentual == pytest.approx(-50.0)
+    assert analisis.promedio_6 == pytest.approx(65 / 3)
+    # Dos lecturas previas: regla de tolerancia sobre el promedio (21,7 m³)
+    assert analisis.atipico and analisis.z_score is None
+    assert analizar_consumos([]) is None
@@ -0,0 +1,83 @@
+import asyncio
+
+import pytest
+
+from app.services.backends_llm import AgrupadorLotes, BackendLLM, BackendOllama
+from app.services.planificador import LLMSaturado, PlanificadorLLM
+
+MODELO = "modelo"
+
+class Lotes:
+    """generar_lote simulado que anota cada lote recibido y cuántos turnos había activos."""
+
+    def __init__(self, planificador: PlanificadorLLM):
+        self.planificador = planificador
+        self.recibidos = []
+        self.activos = []
+
+    async def __call__(self, prompts: list[str]) -> list[dict]:
+        self.recibidos.append(prompts)
+        self.activos.append(self.planificador.estadisticas()["modelos"][MODELO]["activos"])
+        await asyncio.sleep(0)
+        return [{"texto": prompt.upper()} for prompt in prompts]
+
+def test_un_lote_ocupa_un_solo_turno():
+    planificador = PlanificadorLLM(concurrencia=2, max_cola=10, plazo=60)
+    lotes = Lotes(planificador)
+    agrupador = AgrupadorLotes(lotes, max_lote=8, espera=0.01, turno=lambda: planificador.turno(MODELO))
+
+    async def escenario():
+        return await asyncio.gather(*(agrupador.generar(f"p{i}") for i in range(8)))
+
+    resultados = asyncio.run(escenario())
+    assert [r["texto"] for r in resultados] == [f"P{i}" for i in range(8)]
+    assert lotes.recibidos == [[f"p{i}" for i in range(8)]]
+    assert lotes.activos == [1]
+    assert planificador.admitidas == 1
+    assert agrupador.estadisticas()["media_por_lote"] == 8
+
+def test_sin_turno_todo_el_lote_recibe_llm_saturado():
+    planificador = PlanificadorLLM(concurrencia=1, max_cola=0, plazo=60)
+    lotes = Lotes(planificador)
+    agrupador = AgrupadorLotes(lotes, max_lote=4, espera=0.01, turno=lambda: planificador.turno(MODELO))
+
+    async def escenario():
+        planificador.solicitar(MODELO)  # El modelo queda ocupado
+        return await asyncio.gather(*(agrupador.generar(f"p{i}") for i in range(3)), return_exceptions=True)
+
+    resultados = asyncio.run(escenario())
+    assert all(isinstance(r, LLMSaturado) for r in resultados)
+    assert lotes.recibidos == []
+
+def test_los_llamadores_cancelados_no_se_envian():
+    planificador = PlanificadorLLM(concurrencia=1, max_cola=10, plazo=60)
+    lotes = Lotes(planificador)
+    agrupador = AgrupadorLotes(lotes, max_lote=8, espera=0.01, turno=lambda: planificador.turno(MODELO))
+
+    async def escenario():
+        tareas = [asyncio.create_task(agrupador.generar(p)) for p in ("a", "b", "c")]
+        await asyncio.sleep(0)
+        tareas[1].cancel()
+        return await asyncio.gather(*tareas, return_exceptions=True)
+
+    resultados = asyncio.run(escenario())
+    assert isinstance(resultados[1], asyncio.CancelledError)
+    assert lotes.recibidos == [["a", "c"]]
+
+def test_un_backend_incompleto_falla_al_crearse():
+    class BackendSinStream(BackendLLM):
+        async def verificar(self):
+            return {"status": "activo"}
+
+        async def precargar(self, keep_alive):
+            return {"segundos": 0}
+
+        async def modelo_cargado(self):
+            return True
+
+        async def generar(self, prompt):
+            return {"texto": ""}
+
+    with pytest.raises(TypeError, match="generar_stream"):
+        BackendSinStream("http://localhost", MODELO)
+    assert BackendOllama("http://localhost", MODELO).nombre == "ollama"
@@ -0,0 +1,171 @@
+import asyncio
+
+import pytest
+
+from app.services import cache as modulo_cache
+from app.services.cache import CacheSnapshots
+
+def snapshot(id_cliente: int, **extra) -> dict:
+    return {"cliente": {"id_cliente": id_cliente}, **extra}
+
+class Reloj:
+    """Sustituye time.monotonic en el módulo de la caché para avanzar el tiempo a mano."""
+
+    def __init__(self):
+        self.ahora = 1000.0
+
+    def __call__(self) -> float:
+        return self.ahora
+
+@pytest.fixture
+def reloj(monkeypatch):
+    reloj = Reloj()
+    monkeypatch.setattr(modulo_cache.time, "monotonic", reloj)
+    return reloj
+
+def contador_cargas(cargas: list):
+    async def cargar(clave):
+        cargas.append(clave)
+        return snapshot(int(clave))
+    return cargar
+
+def test_segunda_consulta_sale_de_la_cache():
+    cache, cargas = CacheSnapshots(), []
+
+    async def escenario():
+        primera = await cache.obtener("1", contador_cargas(cargas))
+        segunda = await cache.obtener("1", contador_cargas(cargas))
+        return primera, segunda
+
+    primera, segunda = asyncio.run(escenario())
+    assert primera is segunda
+    assert cargas == ["1"]
+    assert cache.estadisticas()["hits"] == 1
+
+def test_la_entrada_caduca_al_vencer_el_ttl(reloj):
+    cache, cargas = CacheSnapshots(ttl_segundos=60), []
+
+    async def escenario():
+        await cache.obtener("1", contador_cargas(cargas))
+        reloj.ahora += 59
+        await cache.obtener("1", contador_cargas(cargas))
+        reloj.ahora += 2
+        await cache.obtener("1", contador_cargas(cargas))
+
+    asyncio.run(escenario())
+    assert cargas == ["1", "1"]
+    assert cache.expiradas == 1
+
+def test_desaloja_la_menos_usada():
+    cache, cargas = CacheSnapshots(max_entradas=2), []
+
+    async def escenario():
+        for clave in ("1", "2", "1", "3"):  # "2" es la menos usada al entrar "3"
+            await cache.obtener(clave, contador_cargas(cargas))
+        cargas.clear()
+        for clave in ("1", "3", "2"):
+            await cache.obtener(clave, contador_cargas(cargas))
+
+    asyncio.run(escenario())
+    assert cargas == ["2"]
+    assert cache.desalojadas >= 1
+
+def test_peticiones_simultaneas_comparten_una_carga():
+    cache, cargas = CacheSnapshots(), []
+
+    async def cargar_lento(clave):
+        cargas.append(clave)
+        await asyncio.sleep(0.01)
+        return snapshot(7)
+
+    async def escenario():
+        return await asyncio.gather(*(cache.obtener("7", cargar_lento) for _ in range(10)))
+
+    resultados = asyncio.run(escenario())
+    assert cargas == ["7"]
+    assert all(r is resultados[0] for r in resultados)
+    assert cache.compartidas == 9
+
+def test_el_error_de_la_carga_llega_a_todos_y_no_se_guarda():
+    cache, cargas = CacheSnapshots(), []
+
+    async def cargar_fallida(clave):
+        cargas.append(clave)
+        await asyncio.sleep(0.01)
+        raise RuntimeError("base de datos caída")
+
+    async def escenario():
+        return await asyncio.gather(*(cache.obtener("7", cargar_fallida) for _ in range(3)), return_exceptions=True)
+
+    resultados = asyncio.run(escenario())
+    assert cargas == ["7"]
+    assert all(isinstance(r, RuntimeError) for r in resultados)
+    assert cache.estadisticas()["entradas"] == 0
+
+def test_no_guarda_errores_ni_identificadores_sin_cliente():
+    cache = CacheSnapshots()
+
+    async def escenario():
+        await cache.obtener("x", lambda _: asyncio.sleep(0, result={"error": "timeout"}))
+        await cache.obtener("y", lambda _: asyncio.sleep(0, result={"cliente": None}))
+
+    asyncio.run(escenario())
+    assert cache.estadisticas()["entradas"] == 0
+
+def test_invalidar_elimina_todos_los_identificadores_del_cliente():
+    cache = CacheSnapshots()
+
+    async def escenario():
+        await cache.obtener("5", lambda _: asyncio.sleep(0, result=snapshot(5)))
+        await cache.obtener("MED00005", lambda _: asyncio.sleep(0, result=snapshot(5)))
+        await cache.obtener("6", lambda _: asyncio.sleep(0, result=snapshot(6)))
+
+    asyncio.run(escenario())
+    assert cache.invalidar("MED00005") == 2
+    assert cache.estadisticas()["entradas"] == 1
+    assert cache.invalidar_cliente(6) == 1
+
+def test_una_carga_anterior_a_la_invalidacion_no_se_guarda():
+    cache = CacheSnapshots()
+
+    async def cargar_y_cambiar(clave):
+        # Los datos cambian mientras la consulta está en curso
+        cache.invalidar_cliente(5)
+        return snapshot(5, saldo="viejo")
+
+    async def escenario():
+        viejo = await cache.obtener("5", cargar_y_cambiar)
+        nuevo = await cache.obtener("5", lambda _: asyncio.sleep(0, result=snapshot(5, saldo="nuevo")))
+        return viejo, nuevo
+
+    viejo, nuevo = asyncio.run(escenario())
+    assert viejo["saldo"] == "viejo"
+    assert nuevo["saldo"] == "nuevo"
+
+def test_cancelar_a_quien_inicio_la_carga_no_afecta_al_resto():
+    cache, cargas = CacheSnapshots(), []
+    liberar = None
+
+    async def cargar_lento(clave):
+        cargas.append(clave)
+        await liberar.wait()
+        return snapshot(7)
+
+    async def escenario():
+        nonlocal liberar
+        liberar = asyncio.Event()
+        lider = asyncio.create_task(cache.obtener("7", cargar_lento))
+        await asyncio.sleep(0)
+        seguidores = [asyncio.create_task(cache.obtener("7", cargar_lento)) for _ in range(2)]
+        await asyncio.sleep(0)
+        lider.cancel()
+        await asyncio.sleep(0)
+        liberar.set()
+        resultados = await asyncio.gather(*seguidores)
+        return lider, resultados
+
+    lider, resultados = asyncio.run(escenario())
+    assert lider.cancelled()
+    assert [r["cliente"]["id_cliente"] for r in resultados] == [7, 7]
+    assert cargas == ["7"]
+    assert cache.estadisticas()["entradas"] == 1
@@ -0,0 +1,44 @@
+import asyncio
+
+import pytest
+from fastapi.testclient import TestClient
+
+from app.main import app, cliente_supabase
+from app.services.database import CONSULTAS_RAPIDAS
+
+@pytest.fixture
+def cliente():
+    app.dependency_overrides[cliente_supabase] = lambda: object()
+    yield TestClient(app)
+    app.dependency_overrides.clear()
+
+def test_las_informativas_salen_del_catalogo_con_etag(cliente):
+    respuesta = cliente.get("/api/quick-query/como_pagar")
+    assert respuesta.status_code == 200
+    assert respuesta.json()["query_type"] == "como_pagar"
+
+    etag = respuesta.headers["ETag"]
+    assert cliente.get("/api/quick-query/como_pagar", headers={"If-None-Match": etag}).status_code == 304
+    assert cliente.post("/api/quick-query", json={"query_type": "como_pagar", "identifier": "1"},
+                        headers={"If-None-Match": etag}).status_code == 304
+
+def test_tipo_desconocido(cliente):
+    assert cliente.get("/api/quick-query/no_existe").status_code == 404
+    assert cliente.post("/api/quick-query", json={"query_type": "no_existe", "identifier": "1"}).status_code == 400
+
+def test_el_error_de_la_consulta_es_un_404(cliente, monkeypatch):
+    monkeypatch.setitem(CONSULTAS_RAPIDAS, "saldo_actual",
+                        lambda identificador: asyncio.sleep(0, result={"error": "Cliente no encontrado"}))
+
+    respuesta = cliente.post("/api/quick-query", json={"query_type": "saldo_actual", "identifier": "999"})
+    assert respuesta.status_code == 404
+    assert respuesta.json()["detail"] == "Cliente no encontrado"
+
+def test_una_excepcion_de_la_consulta_es_un_500(cliente, monkeypatch):
+    async def fallar(identificador):
+        raise RuntimeError("consulta rota")
+
+    monkeypatch.setitem(CONSULTAS_RAPIDAS, "saldo_actual", fallar)
+
+    respuesta = cliente.post("/api/quick-query", json={"query_type": "saldo_actual", "identifier": "1"})
+    assert respuesta.status_code == 500
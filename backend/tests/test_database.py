@@ -0,0 +1,69 @@
+import asyncio
+import threading
+
+import pytest
+import supabase
+
+from app.services import database
+from app.services.database import ConexionSupabase
+
+class CrearCliente:
+    """Sustituye supabase.create_client: falla las primeras ``fallos`` veces y anota el hilo de cada intento."""
+
+    def __init__(self, fallos: int = 0):
+        self.fallos = fallos
+        self.hilos = []
+
+    def __call__(self, url, key):
+        self.hilos.append(threading.get_ident())
+        if len(self.hilos) <= self.fallos:
+            raise ConnectionError("sin red")
+        return object()
+
+@pytest.fixture
+def crear_cliente(monkeypatch):
+    def instalar(fallos: int = 0) -> CrearCliente:
+        crear = CrearCliente(fallos)
+        monkeypatch.setattr(supabase, "create_client", crear)
+        return crear
+    return instalar
+
+def test_el_reintento_no_bloquea_el_event_loop(crear_cliente, monkeypatch):
+    reloj = [1000.0]
+    monkeypatch.setattr(database.time, "monotonic", lambda: reloj[0])
+    crear = crear_cliente(fallos=1)
+    conexion = ConexionSupabase("http://supabase", "clave")
+
+    async def escenario():
+        await conexion.abrir()
+        reloj[0] += 1
+        assert conexion.obtener() is None  # Programa el reintento en segundo plano
+        assert conexion.obtener() is None  # Sin un segundo intento mientras tanto
+        await conexion._conectando
+        return threading.get_ident(), conexion.obtener()
+
+    hilo_bucle, cliente = asyncio.run(escenario())
+    assert cliente is not None
+    assert len(crear.hilos) == 2
+    assert hilo_bucle not in crear.hilos
+    assert conexion.estadisticas() == {"conectado": True, "intentos": 2, "ultimo_error": None}
+
+def test_respeta_la_espera_entre_intentos(crear_cliente):
+    crear = crear_cliente(fallos=5)
+    conexion = ConexionSupabase("http://supabase", "clave", reintento_max=30)
+
+    async def escenario():
+        await conexion.abrir()
+        assert conexion.obtener() is None
+        return conexion._conectando
+
+    assert asyncio.run(escenario()) is None
+    assert len(crear.hilos) == 1
+    assert conexion.reintentar_en() == 1
+
+def test_fuera_del_event_loop_conecta_en_el_momento(crear_cliente):
+    crear = crear_cliente()
+    conexion = ConexionSupabase("http://supabase", "clave")
+
+    assert conexion.obtener() is not None
+    assert crear.hilos == [threading.get_ident()]
@@ -0,0 +1,139 @@
+import asyncio
+
+import pytest
+
+from app.services import llm
+from app.services.generaciones import GeneracionesEnCurso
+from app.services.planificador import LLMSaturado, PlanificadorLLM
+
+class Generacion:
+    """Generación simulada: produce un token cada vez que se llama a ``avanzar``."""
+
+    def __init__(self, tokens: list[str]):
+        self.tokens = tokens
+        self.paso = asyncio.Event()
+        self.cancelada = False
+        self.iniciada = 0
+
+    def avanzar(self):
+        self.paso.set()
+
+    async def eventos(self, *_):
+        self.iniciada += 1
+        try:
+            for token in self.tokens:
+                await self.paso.wait()
+                self.paso.clear()
+                yield {"token": token}
+            yield {"done": True, "respuesta": "".join(self.tokens)}
+        except asyncio.CancelledError:
+            self.cancelada = True
+            raise
+
+async def leer(eventos) -> list[dict]:
+    return [evento async for evento in eventos]
+
+async def dejar_correr():
+    for _ in range(5):
+        await asyncio.sleep(0)
+
+def test_quien_se_une_tarde_recibe_los_eventos_ya_generados():
+    generaciones = GeneracionesEnCurso()
+
+    async def escenario():
+        generacion = Generacion(["Ho", "la"])
+        primero = asyncio.create_task(leer(generaciones.iniciar("clave", generacion.eventos())))
+        generacion.avanzar()
+        await dejar_correr()
+        tarde = asyncio.create_task(leer(generaciones.suscribir("clave")))
+        generacion.avanzar()
+        return await asyncio.gather(primero, tarde), generacion
+
+    (primero, tarde), generacion = asyncio.run(escenario())
+    assert primero == tarde == [{"token": "Ho"}, {"token": "la"}, {"done": True, "respuesta": "Hola"}]
+    assert generacion.iniciada == 1
+    assert generaciones.estadisticas() == {"en_curso": 0, "suscriptores": 0, "iniciadas": 1, "unidas": 1}
+
+def test_al_terminar_no_admite_nuevos_suscriptores():
+    generaciones = GeneracionesEnCurso()
+
+    async def escenario():
+        generacion = Generacion([])
+        await leer(generaciones.iniciar("clave", generacion.eventos()))
+        return generaciones.suscribir("clave")
+
+    assert asyncio.run(escenario()) is None
+
+def test_se_cancela_cuando_se_va_el_ultimo_suscriptor():
+    generaciones = GeneracionesEnCurso()
+
+    async def escenario():
+        generacion = Generacion(["a", "b"])
+        lectores = [
+            asyncio.create_task(leer(generaciones.iniciar("clave", generacion.eventos()))),
+            asyncio.create_task(leer(generaciones.suscribir("clave"))),
+        ]
+        await dejar_correr()
+        lectores[0].cancel()
+        await dejar_correr()
+        cancelada_con_uno = generacion.cancelada
+        lectores[1].cancel()
+        await dejar_correr()
+        return cancelada_con_uno, generacion
+
+    cancelada_con_uno, generacion = asyncio.run(escenario())
+    assert not cancelada_con_uno
+    assert generacion.cancelada
+    assert generaciones.estadisticas()["en_curso"] == 0
+
+def test_el_error_de_la_generacion_llega_a_todos():
+    generaciones = GeneracionesEnCurso()
+
+    async def saturada():
+        await asyncio.sleep(0.01)
+        raise LLMSaturado("La cola del modelo está llena", 12)
+        yield  # Generador asíncrono
+
+    async def escenario():
+        eventos = [generaciones.iniciar("clave", saturada()), generaciones.suscribir("clave")]
+        return await asyncio.gather(*(leer(e) for e in eventos), return_exceptions=True)
+
+    resultados = asyncio.run(escenario())
+    assert all(isinstance(r, LLMSaturado) and r.retry_after == 12 for r in resultados)
+
+@pytest.fixture
+def llm_saturado(monkeypatch):
+    """Módulo llm con generaciones compartidas y un planificador sin capacidad libre."""
+    planificador = PlanificadorLLM(concurrencia=1, max_cola=0, plazo=60)
+    monkeypatch.setattr(llm, "planificador", planificador)
+    monkeypatch.setattr(llm, "generaciones", GeneracionesEnCurso())
+    return planificador
+
+def test_unirse_a_una_generacion_no_pasa_por_la_admision(llm_saturado, monkeypatch):
+    generacion = Generacion(["ok"])
+    monkeypatch.setattr(llm, "_generar_stream", generacion.eventos)
+
+    async def escenario():
+        primero = asyncio.create_task(leer(llm.generar_respuesta_llm_stream("prompt")))
+        await dejar_correr()
+        llm_saturado.solicitar(llm.MODELO_LLM)  # El modelo queda ocupado
+        unido = asyncio.create_task(leer(llm.generar_respuesta_llm_stream("prompt")))
+        otro = await asyncio.wait_for(leer(llm.generar_respuesta_llm_stream("otro prompt")), 1)
+        generacion.avanzar()
+        return await primero, await unido, otro
+
+    primero, unido, otro = asyncio.run(escenario())
+    assert unido == primero == [{"token": "ok"}, {"done": True, "respuesta": "ok"}]
+    assert generacion.iniciada == 1
+    # Un prompt distinto necesitaría una generación nueva: se rechaza sin iniciarla
+    assert otro[-1]["retry_after"] >= 1
+    assert llm.generaciones.iniciadas == 1
+
+def test_una_peticion_completa_saturada_lanza_llm_saturado(llm_saturado):
+    async def escenario():
+        llm_saturado.solicitar(llm.MODELO_LLM)
+        await llm.generar_resultado_llm("prompt")
+
+    with pytest.raises(LLMSaturado):
+        asyncio.run(escenario())
+    assert llm.generaciones.iniciadas == 0
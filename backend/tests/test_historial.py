@@ -0,0 +1,82 @@
+from app.models.schemas import MessageHistory
+from app.services import historial
+from app.services.historial import contar_tokens, formatear_turno, recortar_historial
+from app.services.llm import construir_prompt
+
+def conversacion(turnos: int) -> list[MessageHistory]:
+    return [MessageHistory(pregunta=f"pregunta {i}", respuesta=f"respuesta {i}") for i in range(turnos)]
+
+def datos_cliente() -> dict:
+    return {
+        "cliente": {"id_cliente": 7, "nombre": "Ana", "apellido": "Pérez", "numero_identificacion_personal": "0102030405"},
+        "contrato": {"id_contrato": 3, "estado_servicio": "activo", "fecha_inicio": "2020-01-15"},
+        "medidor": {"numero_medidor": "MED-001", "ubicacion": "frente"},
+        "facturas": [{"periodo": "2024-05-01", "monto": 12.5, "fecha_vencimiento": "2024-06-10", "estado_pago": "pendiente"}],
+        "consumos": [{"periodo": "2024-05-01", "consumo_metros_cubicos": 18}],
+        "solicitudes": [],
+    }
+
+def test_historial_vacio_o_sin_presupuesto():
+    assert recortar_historial([], presupuesto_tokens=100, turnos_recientes=4) == ("", [])
+    assert recortar_historial(conversacion(3), presupuesto_tokens=0, turnos_recientes=4) == ("", [])
+
+def test_conserva_los_ultimos_turnos_y_resume_los_anteriores():
+    turnos = conversacion(6)
+    resumen, recientes = recortar_historial(turnos, presupuesto_tokens=1000, turnos_recientes=2)
+
+    assert recientes == turnos[-2:]
+    assert resumen.startswith("Preguntas anteriores del usuario")
+    lineas = resumen.splitlines()[1:]
+    assert lineas == [f"- pregunta {i}" for i in range(4)]
+
+def test_respeta_el_presupuesto_pero_siempre_incluye_el_ultimo_turno():
+    turnos = conversacion(3)
+    turnos[-1] = MessageHistory(pregunta="larga " * 200, respuesta="ok")
+
+    resumen, recientes = recortar_historial(turnos, presupuesto_tokens=10, turnos_recientes=4)
+
+    assert recientes == turnos[-1:]
+    assert resumen == ""
+
+def test_el_resumen_prefiere_las_preguntas_mas_recientes():
+    turnos = conversacion(5)
+    ultimo = contar_tokens(formatear_turno(turnos[-1]))
+    linea = contar_tokens("- pregunta 0\n")
+    resumen, recientes = recortar_historial(turnos, presupuesto_tokens=ultimo + 2 * linea, turnos_recientes=1)
+
+    assert recientes == turnos[-1:]
+    assert resumen.splitlines()[1:] == ["- pregunta 2", "- pregunta 3"]
+
+def test_recorta_preguntas_largas_en_el_resumen():
+    turnos = [MessageHistory(pregunta="a" * 500, respuesta="r"), *conversacion(1)]
+    resumen, _ = recortar_historial(turnos, presupuesto_tokens=1000, turnos_recientes=1)
+
+    linea = resumen.splitlines()[1]
+    assert linea.endswith("…")
+    assert len(linea) == len("- ") + historial._MAX_CARACTERES_RESUMEN + 1
+
+def test_descartar_omite_el_resumen(monkeypatch):
+    monkeypatch.setattr(historial, "HISTORIAL_ANTIGUOS", "descartar")
+    turnos = conversacion(6)
+
+    resumen, recientes = recortar_historial(turnos, presupuesto_tokens=1000, turnos_recientes=2)
+
+    assert resumen == ""
+    assert recientes == turnos[-2:]
+
+def test_el_prompt_comparte_prefijo_entre_turnos():
+    datos = datos_cliente()
+    primero = construir_prompt("¿Cuánto debo?", datos, conversacion(1))
+    segundo = construir_prompt("¿Y cuándo vence?", datos, conversacion(2))
+
+    fin_datos = "--- FIN DE DATOS DEL CLIENTE ---\n"
+    prefijo = primero[:primero.index(fin_datos) + len(fin_datos)]
+    assert segundo.startswith(prefijo)
+    assert "MED-001" in prefijo
+    assert primero.rstrip().endswith("Pregunta actual: ¿Cuánto debo?\nRespuesta:")
+
+def test_sin_cliente_pide_un_identificador():
+    prompt = construir_prompt("¿Cuánto debo?", {}, conversacion(2))
+
+    assert "número de cliente" in prompt
+    assert "pregunta 0" not in prompt
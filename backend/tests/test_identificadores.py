@@ -0,0 +1,140 @@
+import asyncio
+
+import pytest
+
+from app.services.identificadores import (
+    IndiceIdentificadores, Ubicacion, candidatos_identificador, clasificar_identificador,
+)
+
+def fila_medidor(id_medidor: int, id_cliente: int, estado: str = "Activo", cedula: str = None, id_contrato: int = None) -> dict:
+    return {
+        "id_medidor": id_medidor,
+        "numero_medidor": f"MED{id_medidor:03d}",
+        "id_contrato": 100 + id_medidor if id_contrato is None else id_contrato,
+        "contratos": {
+            "id_cliente": id_cliente,
+            "estado_servicio": estado,
+            "clientes": {"numero_identificacion_personal": cedula},
+        },
+    }
+
+class CargadorPaginado:
+    """cargar_pagina(desde_id, limite) sobre una lista de filas ordenada por id_medidor."""
+
+    def __init__(self, filas: list[dict]):
+        self.filas = filas
+        self.llamadas = []
+
+    async def __call__(self, desde_id: int, limite: int) -> list[dict]:
+        self.llamadas.append((desde_id, limite))
+        return [fila for fila in self.filas if fila["id_medidor"] > desde_id][:limite]
+
+@pytest.mark.parametrize("identificador, esperado", [
+    ("MED001", ("medidor", "MED001")),
+    ("  MED001 ", ("medidor", "MED001")),
+    ("FAC-0042", ("factura", "42")),
+    ("fac42", ("factura", "42")),
+    ("0102030405", ("cedula", "0102030405")),
+    ("000123", ("cliente", "123")),
+    ("med-9", ("medidor", "med-9")),
+    ("A 12", ("medidor", "A 12")),
+])
+def test_clasificar_identificador(identificador, esperado):
+    assert clasificar_identificador(identificador) == esperado
+
+def test_candidatos_prueban_el_medidor_como_alternativa():
+    assert candidatos_identificador(" 0000000042 ") == [("cedula", "0000000042"), ("medidor", "0000000042")]
+    assert candidatos_identificador("0042") == [("cliente", "42"), ("medidor", "0042")]
+    assert candidatos_identificador("FAC-7") == [("factura", "7"), ("medidor", "FAC-7")]
+    assert candidatos_identificador("MED001") == [("medidor", "MED001")]
+
+def test_refresco_carga_todas_las_paginas():
+    filas = [fila_medidor(i, id_cliente=i, cedula=f"{i:010d}") for i in range(1, 8)]
+    cargador = CargadorPaginado(filas)
+    indice = IndiceIdentificadores(cargador, tamano_pagina=3)
+
+    async def escenario():
+        assert indice.buscar("medidor", "MED005") is None
+        await indice._tarea
+        return indice.buscar("medidor", "MED005")
+
+    assert asyncio.run(escenario()) == Ubicacion(5, 105, 5)
+    assert cargador.llamadas == [(0, 3), (3, 3), (6, 3)]
+    assert indice.calentado
+    assert indice.buscar("cliente", "7") == Ubicacion(7, 107, 7)
+    assert indice.buscar("cedula", "0000000002") == Ubicacion(2, 102, 2)
+    assert indice.estadisticas()["entradas"] == 21
+
+def test_refresco_incremental_carga_solo_medidores_nuevos(monkeypatch):
+    reloj = [1000.0]
+    monkeypatch.setattr("app.services.identificadores.time.monotonic", lambda: reloj[0])
+    cargador = CargadorPaginado([fila_medidor(1, id_cliente=1)])
+    indice = IndiceIdentificadores(cargador, intervalo_refresco=60, tamano_pagina=10)
+
+    async def escenario():
+        indice.buscar("medidor", "MED001")
+        await indice._tarea
+        cargador.filas.append(fila_medidor(2, id_cliente=2))
+        reloj[0] += 30
+        indice.buscar("medidor", "MED002")
+        await indice._tarea
+        reloj[0] += 60
+        indice.buscar("medidor", "MED002")
+        await indice._tarea
+
+    asyncio.run(escenario())
+    assert cargador.llamadas == [(0, 10), (1, 10)]
+    assert indice.refrescos == 2
+    assert indice.buscar("medidor", "MED002") == Ubicacion(2, 102, 2)
+
+def test_cliente_y_cedula_solo_para_contratos_activos():
+    indice = IndiceIdentificadores(CargadorPaginado([]))
+    indice._indexar_medidor(fila_medidor(1, id_cliente=9, estado="Suspendido", cedula="0909090909"))
+    indice._indexar_medidor(fila_medidor(2, id_cliente=9, estado="Activo", cedula="0909090909"))
+    indice._indexar_medidor(fila_medidor(3, id_cliente=9, estado="Activo", cedula="0909090909"))
+    indice._indexar_medidor({"id_medidor": 4, "numero_medidor": "MED004", "id_contrato": 104, "contratos": None})
+
+    ubicaciones = indice._ubicaciones
+    assert ubicaciones[("medidor", "MED001")] == Ubicacion(9, 101, 1)
+    # El contrato activo de menor id se queda con el cliente y la cédula
+    assert ubicaciones[("cliente", "9")] == Ubicacion(9, 102, 2)
+    assert ubicaciones[("cedula", "0909090909")] == Ubicacion(9, 102, 2)
+    assert ("medidor", "MED004") not in ubicaciones
+
+def test_cliente_apunta_al_contrato_activo_de_menor_id():
+    indice = IndiceIdentificadores(CargadorPaginado([]))
+    # El medidor más antiguo pertenece al contrato más nuevo
+    indice._indexar_medidor(fila_medidor(1, id_cliente=9, cedula="0909090909", id_contrato=20))
+    indice._indexar_medidor(fila_medidor(2, id_cliente=9, cedula="0909090909", id_contrato=10))
+    indice._indexar_medidor(fila_medidor(3, id_cliente=9, cedula="0909090909", id_contrato=10))
+
+    assert indice._ubicaciones[("cliente", "9")] == Ubicacion(9, 10, 2)
+    assert indice._ubicaciones[("cedula", "0909090909")] == Ubicacion(9, 10, 2)
+
+def test_registrar_respeta_max_entradas_y_descartar_cuenta():
+    indice = IndiceIdentificadores(CargadorPaginado([]), max_entradas=2)
+    indice.registrar("factura", "1", Ubicacion(1, 1, 1))
+    indice.registrar("factura", "2", Ubicacion(2, 2, 2))
+    indice.registrar("factura", "3", Ubicacion(3, 3, 3))
+    # Una entrada existente se puede actualizar aunque el índice esté lleno
+    indice.registrar("factura", "1", Ubicacion(1, 5, None))
+
+    assert indice._ubicaciones == {("factura", "1"): Ubicacion(1, 5, None), ("factura", "2"): Ubicacion(2, 2, 2)}
+
+    indice.descartar("factura", "2")
+    indice.descartar("factura", "2")
+    assert indice.descartadas == 1
+    assert ("factura", "2") not in indice._ubicaciones
+
+def test_refresco_no_supera_max_entradas():
+    filas = [fila_medidor(i, id_cliente=i) for i in range(1, 50)]
+    cargador = CargadorPaginado(filas)
+    indice = IndiceIdentificadores(cargador, max_entradas=10, tamano_pagina=4)
+
+    async def escenario():
+        indice.buscar("medidor", "MED001")
+        await indice._tarea
+
+    asyncio.run(escenario())
+    assert len(indice._ubicaciones) == 10
+    assert len(cargador.llamadas) < len(filas) // 4
@@ -0,0 +1,69 @@
+import pytest
+
+from app.services import intenciones
+from app.services.intenciones import EnrutadorIntenciones, clasificar_intencion
+
+@pytest.mark.parametrize("pregunta, esperado", [
+    # Preguntas que equivalen a una consulta rápida
+    ("¿Cuánto debo?", "saldo_actual"),
+    ("cual es mi saldo", "saldo_actual"),
+    ("Saldo", "saldo_actual"),
+    ("¿Cuándo vence mi factura?", "proxima_factura"),
+    ("próxima factura", "proxima_factura"),
+    ("¿Tengo facturas vencidas?", "facturas_vencidas"),
+    ("número de mi medidor", "informacion_medidor"),
+    ("mi medidor", "informacion_medidor"),
+    ("quiero cambiar mi medidor", "cambiar_medidor"),
+    ("¿Cómo van mis solicitudes?", "estado_solicitudes"),
+    ("mis solicitudes", "estado_solicitudes"),
+    ("cuánto consumí este mes", "consumo_actual"),
+    ("¿Mi consumo es normal?", "consumo_normal"),
+    ("compara con el mes anterior", "comparar_mes_anterior"),
+    ("consumo promedio", "promedio_consumo"),
+    ("tengo una fuga en la casa", "reportar_fuga"),
+    ("¿Dónde puedo pagar?", "donde_pagar"),
+    ("¿Cómo puedo pagar?", "como_pagar"),
+    ("pagar en línea", "pago_online"),
+    ("¿Hay descuentos para adultos mayores?", "descuentos"),
+    # Quejas y averías: van al LLM
+    ("mi medidor no funciona", None),
+    ("el medidor está dañado", None),
+    ("tengo un problema con mi factura", None),
+    ("quiero poner una queja", None),
+    ("no me llegó la factura", None),
+    # Piden una explicación, no el dato
+    ("¿Por qué mi saldo es tan alto?", None),
+    ("me cobraron mal la factura", None),
+    # Menciones amplias o de otra persona
+    ("el medidor de mi vecino", None),
+    ("saldo a favor de mi vecino", None),
+    ("solicitud de un nuevo servicio", None),
+    # Varias intenciones o preguntas largas: confianza baja
+    ("mi medidor y mi saldo", None),
+    ("tengo varias preguntas sobre el saldo de mi cuenta y también quiero saber cuándo vence mi factura de este mes", None),
+    # Sin intención reconocible
+    ("hola", None),
+    ("¿Qué horario tienen?", None),
+])
+def test_enrutar_pregunta(pregunta, esperado):
+    intencion = EnrutadorIntenciones(activado=True, umbral=0.85).clasificar(pregunta)
+    assert (intencion.query_type if intencion else None) == esperado
+
+def test_una_pregunta_larga_baja_la_confianza():
+    intencion = clasificar_intencion(
+        "tengo varias preguntas sobre el saldo de mi cuenta y también quiero saber cuándo vence mi factura de este mes"
+    )
+    assert intencion.confianza < intenciones.INTENCIONES_UMBRAL
+
+def test_desactivado_todo_va_al_llm():
+    assert EnrutadorIntenciones(activado=False).clasificar("¿Cuánto debo?") is None
+
+def test_el_clasificador_registrado_decide_si_las_reglas_no_bastan(monkeypatch):
+    monkeypatch.setattr(intenciones, "_clasificador", None)
+    intenciones.registrar_clasificador(lambda texto: ("como_pagar", 0.9) if "abonar" in texto else (None, 0))
+
+    intencion = clasificar_intencion("¿Puedo abonar con tarjeta?")
+    assert (intencion.query_type, intencion.fuente) == ("como_pagar", "clasificador")
+    # Las quejas se descartan antes de consultar al clasificador
+    assert clasificar_intencion("no puedo abonar, la web falla") is None
+    assert clasificar_intencion("¿Cuánto debo?").fuente == "reglas"
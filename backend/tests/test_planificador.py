@@ -0,0 +1,106 @@
+import asyncio
+
+import pytest
+
+from app.services.planificador import PlanificadorLLM, LLMSaturado
+
+MODELO = "modelo"
+
+async def ocupar(planificador: PlanificadorLLM, liberar: asyncio.Event, orden: list, nombre: str):
+    """Espera turno, apunta el orden en que lo obtuvo y lo mantiene hasta ``liberar``."""
+    async with planificador.turno(MODELO):
+        orden.append(nombre)
+        await liberar.wait()
+
+def test_concede_sin_esperar_mientras_hay_capacidad():
+    planificador = PlanificadorLLM(concurrencia=2)
+
+    async def escenario():
+        primero, segundo = planificador.solicitar(MODELO), planificador.solicitar(MODELO)
+        return primero.posicion, segundo.posicion, planificador.espera_estimada(MODELO)
+
+    assert asyncio.run(escenario()) == (0, 0, pytest.approx(8.0))  # El tercero esperaría una ronda
+
+def test_los_turnos_se_conceden_en_orden_de_llegada():
+    planificador = PlanificadorLLM(concurrencia=1, max_cola=10, plazo=60)
+    orden = []
+
+    async def escenario():
+        liberar = asyncio.Event()
+        tareas = []
+        for nombre in "abcde":
+            tareas.append(asyncio.create_task(ocupar(planificador, liberar, orden, nombre)))
+            await asyncio.sleep(0)
+        await asyncio.sleep(0.01)
+        assert orden == ["a"]
+        assert planificador.estadisticas()["modelos"][MODELO]["en_cola"] == 4
+        liberar.set()
+        await asyncio.gather(*tareas)
+
+    asyncio.run(escenario())
+    assert orden == list("abcde")
+
+def test_con_la_cola_llena_rechaza_con_retry_after():
+    planificador = PlanificadorLLM(concurrencia=1, max_cola=2, plazo=60)
+
+    async def escenario():
+        for _ in range(3):  # Uno activo y dos en cola
+            planificador.solicitar(MODELO)
+        with pytest.raises(LLMSaturado) as error:
+            planificador.solicitar(MODELO)
+        return error.value
+
+    error = asyncio.run(escenario())
+    # Tres rondas por delante con la duración inicial de 8 s
+    assert error.retry_after == 24
+    assert planificador.rechazadas == 1
+
+def test_rechaza_si_la_espera_estimada_supera_el_plazo():
+    planificador = PlanificadorLLM(concurrencia=1, max_cola=100, plazo=10)
+
+    async def escenario():
+        planificador.solicitar(MODELO)
+        planificador.solicitar(MODELO)  # Espera estimada: 8 s
+        with pytest.raises(LLMSaturado):
+            planificador.solicitar(MODELO)  # 16 s > 10 s
+
+    asyncio.run(escenario())
+
+def test_la_espera_que_vence_el_plazo_lanza_llm_saturado():
+    planificador = PlanificadorLLM(concurrencia=1, plazo=60)
+
+    async def escenario():
+        ocupado = planificador.solicitar(MODELO)
+        turno = planificador.solicitar(MODELO)
+        with pytest.raises(LLMSaturado):
+            async for _ in turno.esperar(0.05):
+                pass
+        turno.liberar()
+        ocupado.liberar()
+
+    asyncio.run(escenario())
+    assert planificador.expiradas == 1
+    estado = planificador.estadisticas()["modelos"][MODELO]
+    assert (estado["activos"], estado["en_cola"]) == (0, 0)
+
+def test_quien_abandona_la_cola_no_retrasa_a_los_demas():
+    planificador = PlanificadorLLM(concurrencia=1, max_cola=10, plazo=60)
+
+    async def escenario():
+        ocupado = planificador.solicitar(MODELO)
+        cancelado, siguiente = planificador.solicitar(MODELO), planificador.solicitar(MODELO)
+        assert siguiente.posicion == 2
+        cancelado.liberar()  # El cliente se desconectó mientras esperaba
+        assert siguiente.posicion == 1
+        ocupado.liberar()
+        return siguiente.concedido
+
+    assert asyncio.run(escenario())
+    assert planificador.canceladas == 1
+
+def test_llm_saturado_responde_503_con_retry_after():
+    from app.main import llm_saturado_handler
+
+    respuesta = asyncio.run(llm_saturado_handler(None, LLMSaturado("La cola del modelo está llena", 12)))
+    assert respuesta.status_code == 503
+    assert respuesta.headers["Retry-After"] == "12"
@@ -0,0 +1,62 @@
+-- Esquema de las tablas que usa el backend de AquaLLM.
+-- En Supabase las tablas ya existen; este archivo permite recrearlas en un
+-- PostgreSQL local antes de cargar insert_clientes.sql e insert_contratos.sql:
+--
+--   psql -d aquallm -f esquema.sql -f insert_clientes.sql -f insert_contratos.sql
+
+CREATE TABLE IF NOT EXISTS public.clientes (
+    id_cliente SERIAL PRIMARY KEY,
+    nombre TEXT NOT NULL,
+    apellido TEXT NOT NULL,
+    direccion TEXT,
+    email TEXT,
+    numero_identificacion_personal TEXT UNIQUE
+);
+
+CREATE TABLE IF NOT EXISTS public.contratos (
+    id_contrato SERIAL PRIMARY KEY,
+    id_cliente INTEGER NOT NULL REFERENCES public.clientes (id_cliente),
+    fecha_inicio DATE NOT NULL,
+    estado_servicio TEXT NOT NULL  -- 'Activo', 'Inactivo' o 'Suspendido'
+);
+
+CREATE TABLE IF NOT EXISTS public.medidores (
+    id_medidor SERIAL PRIMARY KEY,
+    id_contrato INTEGER NOT NULL REFERENCES public.contratos (id_contrato),
+    numero_medidor TEXT NOT NULL UNIQUE,
+    ubicacion TEXT
+);
+
+CREATE TABLE IF NOT EXISTS public.facturas (
+    id_factura SERIAL PRIMARY KEY,
+    id_contrato INTEGER NOT NULL REFERENCES public.contratos (id_contrato),
+    periodo DATE NOT NULL,
+    monto NUMERIC(10, 2) NOT NULL,
+    fecha_vencimiento DATE NOT NULL,
+    estado_pago TEXT NOT NULL  -- 'Pagada', 'Pendiente' o 'Vencida'
+);
+
+CREATE TABLE IF NOT EXISTS public.consumos (
+    id_consumo SERIAL PRIMARY KEY,
+    id_medidor INTEGER NOT NULL REFERENCES public.medidores (id_medidor),
+    periodo DATE NOT NULL,
+    consumo_metros_cubicos NUMERIC(10, 2) NOT NULL
+);
+
+CREATE TABLE IF NOT EXISTS public.solicitudes (
+    id_solicitud SERIAL PRIMARY KEY,
+    id_cliente INTEGER NOT NULL REFERENCES public.clientes (id_cliente),
+    tipo_solicitud TEXT,
+    descripcion TEXT,
+    fecha_solicitud TIMESTAMPTZ NOT NULL DEFAULT now(),
+    estado_solicitud TEXT NOT NULL  -- 'Abierta', 'En Proceso' o 'Cerrada'
+);
+
+CREATE TABLE IF NOT EXISTS public.conversaciones (
+    id BIGSERIAL PRIMARY KEY,
+    session_id TEXT NOT NULL,
+    pregunta TEXT NOT NULL,
+    respuesta TEXT NOT NULL,
+    created_at TIMESTAMPTZ NOT NULL DEFAULT now()
+);
+CREATE INDEX IF NOT EXISTS idx_conversaciones_sesion ON public.conversaciones (session_id, id DESC);
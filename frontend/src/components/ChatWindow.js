@@ -3,13 +3,19 @@ import MessageBox from './MessageBox';
 import QuickSuggestions from './QuickSuggestions';
 import './ChatWindow.css';
 
+// Consultas rápidas que no dependen del cliente (catálogo estático del backend)
+const INFORMATIONAL_QUERIES = ['reportar_fuga', 'cambiar_medidor', 'como_pagar', 'donde_pagar', 'pago_online', 'descuentos'];
+
 const ChatWindow = () => {
   const [messages, setMessages] = useState([]);
   const [userInput, setUserInput] = useState('');
   const [identifier, setIdentifier] = useState('');
   const [isLoading, setIsLoading] = useState(false);
   const [processingStatus, setProcessingStatus] = useState('');
-  const [conversationHistory, setConversationHistory] = useState([]);
+  // El historial vive en el servidor, asociado a esta sesión
+  const [sessionId] = useState(() => crypto.randomUUID());
+  // Turnos que el servidor aún no conoce (consultas rápidas); se envían con la próxima pregunta
+  const [pendingTurns, setPendingTurns] = useState([]);
 
   const messagesEndRef = useRef(null);
 
@@ -47,44 +53,67 @@ const ChatWindow = () => {
         body: JSON.stringify({
           question: currentQuestion,
           identifier: normalizedIdentifier, // Usar el identificador normalizado
-          history: conversationHistory,
+          session_id: sessionId,
+          history: pendingTurns,
         }),
       });
 
+      if (response.status === 503) {
+        // El servicio de IA está saturado: se avisa cuándo volver a intentarlo
+        const retryAfter = response.headers.get('Retry-After');
+        const busyMessage = {
+          text: `Estoy atendiendo muchas consultas en este momento. Por favor, intenta de nuevo${retryAfter ? ` en ${retryAfter} segundos` : ' en unos segundos'}.`,
+          sender: 'bot',
+        };
+        setMessages(prevMessages => [...prevMessages, busyMessage]);
+        return;
+      }
       if (!response.ok) {
         throw new Error(`Error del servidor: ${response.status}`);
       }
+      // El servidor ya añadió los turnos pendientes a la sesión
+      setPendingTurns([]);
 
       const reader = response.body.getReader();
       const decoder = new TextDecoder();
+      let buffer = '';
+      let partialAnswer = '';
 
       while (true) {
         const { done, value } = await reader.read();
         if (done) break;
 
-        const chunk = decoder.decode(value);
-        const lines = chunk.split('\n');
+        // Un evento puede llegar partido entre dos lecturas: se guarda la última línea incompleta
+        buffer += decoder.decode(value, { stream: true });
+        const lines = buffer.split('\n');
+        buffer = lines.pop();
 
         for (const line of lines) {
           if (line.startsWith('data: ')) {
             try {
               const data = JSON.parse(line.slice(6));
+
+              if (data.token) {
+                // Mostrar la respuesta a medida que el modelo la genera
+                const isFirstToken = partialAnswer === '';
+                partialAnswer += data.token;
+                const streamingMessage = { text: partialAnswer, sender: 'bot', streaming: true };
+                setMessages(prevMessages => isFirstToken
+                  ? [...prevMessages, streamingMessage]
+                  : [...prevMessages.slice(0, -1), streamingMessage]);
+                continue;
+              }
               
               if (data.status) {
                 setProcessingStatus(`${data.status} (${data.step}/${data.total})`);
               }
               
               if (data.done && data.response) {
-                // Respuesta final recibida
+                // Respuesta final recibida: reemplaza el mensaje parcial, si lo hay
                 const botResponse = { text: data.response, sender: 'bot' };
-                setMessages(prevMessages => [...prevMessages, botResponse]);
-                
-                // Actualizar el historial de conversación
-                const newHistoryItem = {
-                  pregunta: currentQuestion,
-                  respuesta: data.response
-                };
-                setConversationHistory(prev => [...prev, newHistoryItem]);
+                setMessages(prevMessages => partialAnswer
+                  ? [...prevMessages.slice(0, -1), botResponse]
+                  : [...prevMessages, botResponse]);
                 
                 setProcessingStatus('');
                 setIsLoading(false);
@@ -132,14 +161,17 @@ const ChatWindow = () => {
     setIsLoading(true);
 
     try {
-      const response = await fetch('http://localhost:8000/api/quick-query', {
-        method: 'POST',
-        headers: { 'Content-Type': 'application/json' },
-        body: JSON.stringify({
-          query_type: queryType,
-          identifier: normalizedIdentifier, // Usar el identificador normalizado
-        }),
-      });
+      // Las consultas informativas se piden por GET para que el navegador las cachee
+      const response = INFORMATIONAL_QUERIES.includes(queryType)
+        ? await fetch(`http://localhost:8000/api/quick-query/${queryType}`)
+        : await fetch('http://localhost:8000/api/quick-query', {
+            method: 'POST',
+            headers: { 'Content-Type': 'application/json' },
+            body: JSON.stringify({
+              query_type: queryType,
+              identifier: normalizedIdentifier, // Usar el identificador normalizado
+            }),
+          });
 
       if (!response.ok) {
         throw new Error(`Error del servidor: ${response.status}`);
@@ -165,8 +197,8 @@ ${data.suggestions.map(s => `• ${s}`).join('\n')}
       const botResponse = { text: formattedResponse, sender: 'bot' };
       setMessages(prev => [...prev, botResponse]);
 
-      // Actualizar historial de conversación
-      setConversationHistory(prev => [...prev, {
+      // Se enviará al servidor junto con la próxima pregunta del chat
+      setPendingTurns(prev => [...prev, {
         pregunta: questionText,
         respuesta: formattedResponse
       }]);
@@ -0,0 +1,211 @@
+-- Resumen de cuenta por contrato, mantenido por triggers.
+--
+-- resumen_cuenta guarda una fila por contrato con lo que necesitan las
+-- consultas rápidas de saldo, facturas vencidas y próxima factura (y los
+-- promedios de consumo): el backend lee esa fila en lugar de calcularlo con
+-- las últimas facturas del snapshot, que no incluyen las deudas antiguas.
+--
+-- Cada INSERT, UPDATE o DELETE en facturas o consumos recalcula solo los
+-- contratos afectados por la sentencia (una vez por sentencia, aunque toque
+-- muchas filas); las altas y cambios de contratos y medidores también.
+--
+-- El backend la usa cuando SUPABASE_RESUMEN_CUENTA=true. Requiere
+-- migracion_snapshot_cliente.sql (índices). Para probarla en un PostgreSQL local:
+--
+--   psql -d aquallm -f migracion_snapshot_cliente.sql -f migracion_resumen_cuenta.sql
+--   psql -d aquallm -c "SELECT * FROM resumen_cuenta WHERE id_cliente = 6;"
+
+CREATE TABLE IF NOT EXISTS public.resumen_cuenta (
+    id_contrato INTEGER PRIMARY KEY REFERENCES public.contratos (id_contrato) ON DELETE CASCADE,
+    id_cliente INTEGER NOT NULL REFERENCES public.clientes (id_cliente) ON DELETE CASCADE,
+    id_medidor INTEGER REFERENCES public.medidores (id_medidor) ON DELETE SET NULL,
+    monto_pendiente NUMERIC(12, 2) NOT NULL DEFAULT 0,
+    facturas_pendientes INTEGER NOT NULL DEFAULT 0,
+    monto_vencido NUMERIC(12, 2) NOT NULL DEFAULT 0,
+    facturas_vencidas INTEGER NOT NULL DEFAULT 0,
+    total_adeudado NUMERIC(12, 2) GENERATED ALWAYS AS (monto_pendiente + monto_vencido) STORED,
+    -- Factura pendiente que vence primero
+    proximo_vencimiento DATE,
+    proximo_monto NUMERIC(10, 2),
+    proximo_periodo DATE,
+    -- Consumos del medidor del contrato
+    ultimo_consumo NUMERIC(10, 2),
+    ultimo_periodo_consumo DATE,
+    consumo_promedio_6 NUMERIC(10, 2),
+    consumo_promedio_12 NUMERIC(10, 2),
+    actualizado_en TIMESTAMPTZ NOT NULL DEFAULT now()
+);
+
+CREATE INDEX IF NOT EXISTS idx_resumen_cuenta_cliente ON public.resumen_cuenta (id_cliente);
+-- Facturas por cobrar de un contrato, por fecha de vencimiento
+CREATE INDEX IF NOT EXISTS idx_facturas_contrato_por_cobrar ON public.facturas (id_contrato, fecha_vencimiento)
+    WHERE estado_pago IN ('Pendiente', 'Vencida');
+
+-- Recalcula el resumen de los contratos indicados (NULL = todos)
+CREATE OR REPLACE FUNCTION public.recalcular_resumen_cuenta(p_contratos INTEGER[] DEFAULT NULL)
+RETURNS VOID
+LANGUAGE sql
+AS $$
+    INSERT INTO public.resumen_cuenta AS r (
+        id_contrato, id_cliente, id_medidor,
+        monto_pendiente, facturas_pendientes, monto_vencido, facturas_vencidas,
+        proximo_vencimiento, proximo_monto, proximo_periodo,
+        ultimo_consumo, ultimo_periodo_consumo, consumo_promedio_6, consumo_promedio_12,
+        actualizado_en
+    )
+    SELECT
+        ct.id_contrato, ct.id_cliente, m.id_medidor,
+        COALESCE(f.monto_pendiente, 0), COALESCE(f.facturas_pendientes, 0),
+        COALESCE(f.monto_vencido, 0), COALESCE(f.facturas_vencidas, 0),
+        p.fecha_vencimiento, p.monto, p.periodo,
+        c.ultimo, c.ultimo_periodo, c.promedio_6, c.promedio_12,
+        now()
+    FROM public.contratos ct
+    LEFT JOIN LATERAL (
+        SELECT id_medidor FROM public.medidores
+        WHERE id_contrato = ct.id_contrato
+        ORDER BY id_medidor
+        LIMIT 1
+    ) m ON TRUE
+    LEFT JOIN LATERAL (
+        SELECT
+            SUM(monto) FILTER (WHERE estado_pago = 'Pendiente') AS monto_pendiente,
+            COUNT(*) FILTER (WHERE estado_pago = 'Pendiente') AS facturas_pendientes,
+            SUM(monto) FILTER (WHERE estado_pago = 'Vencida') AS monto_vencido,
+            COUNT(*) FILTER (WHERE estado_pago = 'Vencida') AS facturas_vencidas
+        FROM public.facturas
+        WHERE id_contrato = ct.id_contrato AND estado_pago IN ('Pendiente', 'Vencida')
+    ) f ON TRUE
+    LEFT JOIN LATERAL (
+        SELECT fecha_vencimiento, monto, periodo FROM public.facturas
+        WHERE id_contrato = ct.id_contrato AND estado_pago = 'Pendiente'
+        ORDER BY fecha_vencimiento
+        LIMIT 1
+    ) p ON TRUE
+    LEFT JOIN LATERAL (
+        SELECT
+            (array_agg(consumo ORDER BY periodo DESC))[1] AS ultimo,
+            max(periodo) AS ultimo_periodo,
+            round(avg(consumo) FILTER (WHERE n <= 6), 2) AS promedio_6,
+            round(avg(consumo), 2) AS promedio_12
+        FROM (
+            SELECT consumo_metros_cubicos AS consumo, periodo, row_number() OVER (ORDER BY periodo DESC) AS n
+            FROM public.consumos
+            WHERE id_medidor = m.id_medidor
+            ORDER BY periodo DESC
+            LIMIT 12
+        ) u
+    ) c ON TRUE
+    WHERE p_contratos IS NULL OR ct.id_contrato = ANY (p_contratos)
+    ON CONFLICT (id_contrato) DO UPDATE SET
+        id_cliente = EXCLUDED.id_cliente,
+        id_medidor = EXCLUDED.id_medidor,
+        monto_pendiente = EXCLUDED.monto_pendiente,
+        facturas_pendientes = EXCLUDED.facturas_pendientes,
+        monto_vencido = EXCLUDED.monto_vencido,
+        facturas_vencidas = EXCLUDED.facturas_vencidas,
+        proximo_vencimiento = EXCLUDED.proximo_vencimiento,
+        proximo_monto = EXCLUDED.proximo_monto,
+        proximo_periodo = EXCLUDED.proximo_periodo,
+        ultimo_consumo = EXCLUDED.ultimo_consumo,
+        ultimo_periodo_consumo = EXCLUDED.ultimo_periodo_consumo,
+        consumo_promedio_6 = EXCLUDED.consumo_promedio_6,
+        consumo_promedio_12 = EXCLUDED.consumo_promedio_12,
+        actualizado_en = EXCLUDED.actualizado_en;
+$$;
+
+-- Triggers por sentencia: las tablas de transición traen las filas afectadas
+-- (en PostgreSQL cada trigger con tablas de transición admite un solo evento,
+-- de ahí uno por operación). La función solo lee las que existen en cada caso.
+CREATE OR REPLACE FUNCTION public.resumen_cuenta_facturas()
+RETURNS TRIGGER
+LANGUAGE plpgsql
+AS $$
+BEGIN
+    IF TG_OP = 'INSERT' THEN
+        PERFORM public.recalcular_resumen_cuenta(ARRAY(SELECT DISTINCT id_contrato FROM nuevas));
+    ELSIF TG_OP = 'UPDATE' THEN
+        PERFORM public.recalcular_resumen_cuenta(ARRAY(
+            SELECT id_contrato FROM nuevas UNION SELECT id_contrato FROM anteriores));
+    ELSE
+        PERFORM public.recalcular_resumen_cuenta(ARRAY(SELECT DISTINCT id_contrato FROM anteriores));
+    END IF;
+    RETURN NULL;
+END;
+$$;
+
+CREATE OR REPLACE FUNCTION public.resumen_cuenta_consumos()
+RETURNS TRIGGER
+LANGUAGE plpgsql
+AS $$
+BEGIN
+    IF TG_OP = 'INSERT' THEN
+        PERFORM public.recalcular_resumen_cuenta(ARRAY(
+            SELECT DISTINCT m.id_contrato FROM nuevas JOIN public.medidores m USING (id_medidor)));
+    ELSIF TG_OP = 'UPDATE' THEN
+        PERFORM public.recalcular_resumen_cuenta(ARRAY(
+            SELECT m.id_contrato FROM nuevas JOIN public.medidores m USING (id_medidor)
+            UNION
+            SELECT m.id_contrato FROM anteriores JOIN public.medidores m USING (id_medidor)));
+    ELSE
+        PERFORM public.recalcular_resumen_cuenta(ARRAY(
+            SELECT DISTINCT m.id_contrato FROM anteriores JOIN public.medidores m USING (id_medidor)));
+    END IF;
+    RETURN NULL;
+END;
+$$;
+
+-- Contratos nuevos o que cambian de cliente, y medidores nuevos o reasignados
+CREATE OR REPLACE FUNCTION public.resumen_cuenta_contrato()
+RETURNS TRIGGER
+LANGUAGE plpgsql
+AS $$
+BEGIN
+    IF TG_OP = 'UPDATE' AND TG_TABLE_NAME = 'medidores' AND OLD.id_contrato IS DISTINCT FROM NEW.id_contrato THEN
+        PERFORM public.recalcular_resumen_cuenta(ARRAY[OLD.id_contrato, NEW.id_contrato]);
+    ELSE
+        PERFORM public.recalcular_resumen_cuenta(ARRAY[NEW.id_contrato]);
+    END IF;
+    RETURN NULL;
+END;
+$$;
+
+DROP TRIGGER IF EXISTS resumen_cuenta_facturas_insert ON public.facturas;
+DROP TRIGGER IF EXISTS resumen_cuenta_facturas_update ON public.facturas;
+DROP TRIGGER IF EXISTS resumen_cuenta_facturas_delete ON public.facturas;
+CREATE TRIGGER resumen_cuenta_facturas_insert AFTER INSERT ON public.facturas
+    REFERENCING NEW TABLE AS nuevas FOR EACH STATEMENT EXECUTE FUNCTION public.resumen_cuenta_facturas();
+CREATE TRIGGER resumen_cuenta_facturas_update AFTER UPDATE ON public.facturas
+    REFERENCING OLD TABLE AS anteriores NEW TABLE AS nuevas FOR EACH STATEMENT EXECUTE FUNCTION public.resumen_cuenta_facturas();
+CREATE TRIGGER resumen_cuenta_facturas_delete AFTER DELETE ON public.facturas
+    REFERENCING OLD TABLE AS anteriores FOR EACH STATEMENT EXECUTE FUNCTION public.resumen_cuenta_facturas();
+
+DROP TRIGGER IF EXISTS resumen_cuenta_consumos_insert ON public.consumos;
+DROP TRIGGER IF EXISTS resumen_cuenta_consumos_update ON public.consumos;
+DROP TRIGGER IF EXISTS resumen_cuenta_consumos_delete ON public.consumos;
+CREATE TRIGGER resumen_cuenta_consumos_insert AFTER INSERT ON public.consumos
+    REFERENCING NEW TABLE AS nuevas FOR EACH STATEMENT EXECUTE FUNCTION public.resumen_cuenta_consumos();
+CREATE TRIGGER resumen_cuenta_consumos_update AFTER UPDATE ON public.consumos
+    REFERENCING OLD TABLE AS anteriores NEW TABLE AS nuevas FOR EACH STATEMENT EXECUTE FUNCTION public.resumen_cuenta_consumos();
+CREATE TRIGGER resumen_cuenta_consumos_delete AFTER DELETE ON public.consumos
+    REFERENCING OLD TABLE AS anteriores FOR EACH STATEMENT EXECUTE FUNCTION public.resumen_cuenta_consumos();
+
+DROP TRIGGER IF EXISTS resumen_cuenta_contratos ON public.contratos;
+DROP TRIGGER IF EXISTS resumen_cuenta_medidores ON public.medidores;
+CREATE TRIGGER resumen_cuenta_contratos AFTER INSERT OR UPDATE OF id_cliente ON public.contratos
+    FOR EACH ROW EXECUTE FUNCTION public.resumen_cuenta_contrato();
+CREATE TRIGGER resumen_cuenta_medidores AFTER INSERT OR UPDATE OF id_contrato ON public.medidores
+    FOR EACH ROW EXECUTE FUNCTION public.resumen_cuenta_contrato();
+
+-- Carga inicial de todos los contratos
+SELECT public.recalcular_resumen_cuenta();
+
+-- Supabase expone la tabla vía PostgREST a los roles con permiso de lectura
+-- (en un PostgreSQL local esos roles no existen y el permiso se omite)
+DO $$
+BEGIN
+    IF EXISTS (SELECT 1 FROM pg_roles WHERE rolname = 'anon') THEN
+        GRANT SELECT ON public.resumen_cuenta TO anon, authenticated;
+    END IF;
+END
+$$;
@@ -0,0 +1,143 @@
+-- Snapshot completo de un cliente en una sola petición.
+--
+-- obtener_snapshot_cliente(identificador, consumos) resuelve el identificador dentro de
+-- la base de datos (según su formato: número de factura 'FAC-123', cédula de
+-- 10 dígitos o id_cliente; si no es ninguno de ellos o no corresponde a
+-- ningún cliente, como número de medidor), con las mismas reglas y la misma
+-- normalización que candidatos_identificador en
+-- backend/app/services/identificadores.py, y devuelve un único JSON con la
+-- misma forma que buscar_datos_cliente en backend/app/services/database.py:
+--
+--   {"cliente": {...}, "contrato": {...}, "medidor": {...},
+--    "facturas": [...5 últimas], "consumos": [...N últimos], "solicitudes": [...3 últimas]}
+--
+-- N es p_consumos (CONSUMOS_HISTORIAL en el backend; 36 por defecto).
+--
+-- Se invoca desde el backend con supabase.rpc('obtener_snapshot_cliente', ...)
+-- cuando SUPABASE_SNAPSHOT_RPC=true. Para probarla en un PostgreSQL local:
+--
+--   psql -d aquallm -f esquema.sql -f insert_clientes.sql -f insert_contratos.sql \
+--        -f migracion_snapshot_cliente.sql
+--   psql -d aquallm -c "SELECT obtener_snapshot_cliente('6');"
+
+-- Índices que cubren las búsquedas y los "últimos N" de cada tabla hija
+CREATE INDEX IF NOT EXISTS idx_contratos_cliente_estado ON public.contratos (id_cliente, estado_servicio);
+CREATE INDEX IF NOT EXISTS idx_medidores_contrato ON public.medidores (id_contrato);
+CREATE INDEX IF NOT EXISTS idx_facturas_contrato_periodo ON public.facturas (id_contrato, periodo DESC);
+CREATE INDEX IF NOT EXISTS idx_consumos_medidor_periodo ON public.consumos (id_medidor, periodo DESC);
+CREATE INDEX IF NOT EXISTS idx_solicitudes_cliente_fecha ON public.solicitudes (id_cliente, fecha_solicitud DESC);
+
+-- La versión anterior solo recibía el identificador: se elimina para que la llamada con un
+-- argumento no sea ambigua
+DROP FUNCTION IF EXISTS public.obtener_snapshot_cliente(TEXT);
+
+CREATE OR REPLACE FUNCTION public.obtener_snapshot_cliente(p_identificador TEXT, p_consumos INTEGER DEFAULT 36)
+RETURNS JSONB
+LANGUAGE plpgsql
+STABLE
+AS $$
+DECLARE
+    v_cliente public.clientes%ROWTYPE;
+    v_contrato public.contratos%ROWTYPE;
+    v_medidor public.medidores%ROWTYPE;
+    v_texto TEXT := btrim(p_identificador);
+BEGIN
+    -- 1. Número de factura: el contrato facturado, su cliente y su medidor
+    IF upper(v_texto) ~ '^FAC-?[0-9]{1,9}$' THEN
+        SELECT c.* INTO v_contrato
+        FROM public.facturas f JOIN public.contratos c ON c.id_contrato = f.id_contrato
+        WHERE f.id_factura = substring(v_texto FROM '[0-9]+')::INTEGER;
+
+        IF FOUND THEN
+            SELECT * INTO v_cliente FROM public.clientes WHERE id_cliente = v_contrato.id_cliente;
+            SELECT * INTO v_medidor FROM public.medidores
+            WHERE id_contrato = v_contrato.id_contrato
+            ORDER BY id_medidor
+            LIMIT 1;
+        END IF;
+
+    -- 2. Cédula (10 dígitos) o ID de cliente: se toma su contrato activo y el medidor de ese contrato
+    ELSIF v_texto ~ '^[0-9]{1,10}$' THEN
+        IF length(v_texto) = 10 THEN
+            SELECT * INTO v_cliente FROM public.clientes WHERE numero_identificacion_personal = v_texto;
+        ELSE
+            SELECT * INTO v_cliente FROM public.clientes WHERE id_cliente = v_texto::INTEGER;
+        END IF;
+
+        IF FOUND THEN
+            SELECT * INTO v_contrato FROM public.contratos
+            WHERE id_cliente = v_cliente.id_cliente AND estado_servicio = 'Activo'
+            ORDER BY id_contrato
+            LIMIT 1;
+
+            IF FOUND THEN
+                SELECT * INTO v_medidor FROM public.medidores
+                WHERE id_contrato = v_contrato.id_contrato
+                ORDER BY id_medidor
+                LIMIT 1;
+            END IF;
+        END IF;
+    END IF;
+
+    -- 3. Cualquier otro formato, o uno que no corresponde a ningún cliente: número de medidor
+    IF v_cliente.id_cliente IS NULL THEN
+        SELECT * INTO v_medidor FROM public.medidores WHERE numero_medidor = v_texto LIMIT 1;
+
+        IF FOUND THEN
+            SELECT * INTO v_contrato FROM public.contratos WHERE id_contrato = v_medidor.id_contrato;
+            SELECT * INTO v_cliente FROM public.clientes WHERE id_cliente = v_contrato.id_cliente;
+        END IF;
+    END IF;
+
+    -- Identificador desconocido: snapshot vacío, igual que la versión en Python
+    IF v_cliente.id_cliente IS NULL THEN
+        RETURN jsonb_build_object(
+            'cliente', NULL, 'contrato', NULL, 'medidor', NULL,
+            'facturas', '[]'::JSONB, 'consumos', '[]'::JSONB, 'solicitudes', '[]'::JSONB
+        );
+    END IF;
+
+    RETURN jsonb_build_object(
+        'cliente', to_jsonb(v_cliente),
+        'contrato', CASE WHEN v_contrato.id_contrato IS NULL THEN NULL ELSE to_jsonb(v_contrato) END,
+        'medidor', CASE WHEN v_medidor.id_medidor IS NULL THEN NULL ELSE to_jsonb(v_medidor) END,
+        'facturas', COALESCE((
+            SELECT jsonb_agg(to_jsonb(f) ORDER BY f.periodo DESC)
+            FROM (
+                SELECT * FROM public.facturas
+                WHERE id_contrato = v_contrato.id_contrato
+                ORDER BY periodo DESC
+                LIMIT 5
+            ) f
+        ), '[]'::JSONB),
+        'consumos', COALESCE((
+            SELECT jsonb_agg(to_jsonb(c) ORDER BY c.periodo DESC)
+            FROM (
+                SELECT * FROM public.consumos
+                WHERE id_medidor = v_medidor.id_medidor
+                ORDER BY periodo DESC
+                LIMIT p_consumos
+            ) c
+        ), '[]'::JSONB),
+        'solicitudes', COALESCE((
+            SELECT jsonb_agg(to_jsonb(s) ORDER BY s.fecha_solicitud DESC)
+            FROM (
+                SELECT * FROM public.solicitudes
+                WHERE id_cliente = v_cliente.id_cliente
+                ORDER BY fecha_solicitud DESC
+                LIMIT 3
+            ) s
+        ), '[]'::JSONB)
+    );
+END;
+$$;
+
+-- Supabase expone las funciones vía PostgREST a los roles con permiso de ejecución
+-- (en un PostgreSQL local esos roles no existen y el permiso se omite)
+DO $$
+BEGIN
+    IF EXISTS (SELECT 1 FROM pg_roles WHERE rolname = 'anon') THEN
+        GRANT EXECUTE ON FUNCTION public.obtener_snapshot_cliente(TEXT, INTEGER) TO anon, authenticated;
+    END IF;
+END
+$$;